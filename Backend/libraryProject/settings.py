@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 from dotenv import load_dotenv
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -26,6 +27,9 @@ SECRET_KEY = os.getenv('SECRET_KEY')
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = os.getenv('DEBUG','True').lower() == 'true'
 
+# True while `manage.py test` is running
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
+
 ALLOWED_HOSTS = []
 
 
@@ -59,6 +63,63 @@ EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
+# Max SMTP sends in flight at once from the async check_due_books view (libraryapp/async_views.py)
+ASYNC_MAIL_CONCURRENCY = int(os.getenv('ASYNC_MAIL_CONCURRENCY', '10'))
+
+# Book status Server-Sent Events (libraryapp/events.py)
+SSE_QUEUE_SIZE = 100          # events buffered per client before the oldest are dropped
+SSE_HEARTBEAT_SECONDS = 15    # keepalive comment interval on idle streams
+SSE_RETRY_MS = 5000           # client reconnect delay sent in the stream
+
+# Title/author autocomplete prefix index (libraryapp/autocomplete.py)
+# About 4 keys per book: room for ~75k books. ~170 bytes each, ~50 MB per worker at most
+AUTOCOMPLETE_MAX_ENTRIES = int(os.getenv('AUTOCOMPLETE_MAX_ENTRIES', '300000'))
+AUTOCOMPLETE_MAX_KEY_LENGTH = 40   # characters kept per key
+AUTOCOMPLETE_MAX_WORDS = 6         # title word positions indexed per book
+AUTOCOMPLETE_MAX_RESULTS = 20
+# How often a lookup checks whether other workers changed the books (rebuilding the index if so)
+AUTOCOMPLETE_REFRESH_SECONDS = float(os.getenv('AUTOCOMPLETE_REFRESH_SECONDS', '60'))
+
+# "Also borrowed" recommendations (libraryapp/recommendations.py, manage.py build_recommendations)
+RECOMMENDATIONS_STATE_PATH = os.getenv('RECOMMENDATIONS_STATE_PATH', os.path.join(BASE_DIR, 'recommendations', 'state.npz'))
+RECOMMENDATIONS_TOP_N = 20
+RECOMMENDATIONS_MIN_SUPPORT = 2  # members who borrowed both books before they are linked
+
+# Circulation analytics (libraryapp/analytics.py)
+ANALYTICS_WINDOWS_DAYS = (7, 30, 90)   # rolling popularity windows
+ANALYTICS_HISTORY_WEEKS = 26           # length of the weekly demand curves
+ANALYTICS_TREND_WEEKS = 8              # weeks the demand forecast is fitted to
+ANALYTICS_FORECAST_WEEKS = 4
+ANALYTICS_CHUNK_SIZE = 50000           # rows fetched per database round trip
+ANALYTICS_CACHE_SECONDS = 24 * 60 * 60
+
+# manage.py archive_borrow_records: returned, paid loans older than this move to BorrowRecordArchive.
+# Keep it above ANALYTICS_HISTORY_WEEKS * 7, analytics only read the live table.
+BORROW_RECORD_ARCHIVE_AFTER_DAYS = int(os.getenv('BORROW_RECORD_ARCHIVE_AFTER_DAYS', '365'))
+
+# Category deletion (libraryapp/deletion.py): categories with more books than this are deleted by a
+# background DeletionJob in batches instead of one cascading delete
+CATEGORY_DELETE_INLINE_MAX_BOOKS = 100
+DELETION_BATCH_SIZE = 500       # rows per transaction
+DELETION_PAUSE_SECONDS = 0.05   # between batches, so other writers get the database
+DELETION_JOBS_SYNC = TESTING    # run jobs inline instead of in a thread
+
+# Single-flight list requests (libraryapp/coalescing.py): identical concurrent catalog lists share one query
+COALESCE_LIST_REQUESTS = os.getenv('COALESCE_LIST_REQUESTS', 'true').lower() == 'true'
+COALESCE_WAIT_SECONDS = 10  # followers give up waiting on the leader after this and query themselves
+
+# Pre-gzipped catalog snapshot served by GET /api/books/catalog/ (libraryapp/catalog.py, manage.py build_catalog_snapshot)
+CATALOG_SNAPSHOT_DIR = os.getenv('CATALOG_SNAPSHOT_DIR', os.path.join(BASE_DIR, 'catalog'))
+CATALOG_SEGMENT_SIZE = 5000           # book ids per separately compressed segment
+CATALOG_COMPRESSION_LEVEL = 6
+CATALOG_REFRESH_DELAY_SECONDS = 2     # changes are batched this long before the snapshot is refreshed
+CATALOG_AUTO_REFRESH = os.getenv('CATALOG_AUTO_REFRESH', str(not TESTING)).lower() == 'true'
+
+# Bulk user import (libraryapp/user_import.py): POST /api/users/bulk_import/ and manage.py import_users
+USER_IMPORT_WORKERS = int(os.getenv('USER_IMPORT_WORKERS', '0'))  # password hashing processes; 0 = one per core
+USER_IMPORT_BATCH_SIZE = 500    # users per bulk_create and transaction
+USER_IMPORT_MAX_ROWS = 50       # per API request, hashed inside it: keeps it well within proxy timeouts.
+                                # The command has no limit
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -67,12 +128,38 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
-    'EXCEPTION_HANDLER':'libraryapp.exception_handler.custom_exception_handler'
+    'EXCEPTION_HANDLER':'libraryapp.exception_handler.custom_exception_handler',
+    # Opt-in: lists are only paginated when ?page= or ?page_size= is sent (libraryapp/pagination.py)
+    'DEFAULT_PAGINATION_CLASS': 'libraryapp.pagination.CountedPageNumberPagination',
+    'PAGE_SIZE': 50,
+    # Throttling (libraryapp/throttles.py). The token endpoint adds TokenIPThrottle/TokenUsernameThrottle in urls.py
+    'DEFAULT_THROTTLE_CLASSES': [
+        'libraryapp.throttles.SearchUserThrottle',
+        'libraryapp.throttles.SearchIPThrottle',
+        'libraryapp.throttles.ListUserThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'token_ip': os.getenv('THROTTLE_TOKEN_IP', '20/min'),
+        'token_username': os.getenv('THROTTLE_TOKEN_USERNAME', '10/min'),
+        'search_user': os.getenv('THROTTLE_SEARCH_USER', '60/min'),
+        'search_ip': os.getenv('THROTTLE_SEARCH_IP', '180/min'),
+        'list_user': os.getenv('THROTTLE_LIST_USER', '120/min'),
+    },
 }
 
+# Throttle counters live in the database (ThrottleCounter), shared by every worker process.
+# Off under `manage.py test` (tests log in many times); tests that cover throttling turn it back on
+THROTTLE_ENABLED = os.getenv('THROTTLE_ENABLED', str(not TESTING)).lower() == 'true'
+
 AUTH_USER_MODEL = 'libraryapp.User'
 
+# How long a stored Idempotency-Key response is replayed for (see libraryapp/idempotency.py)
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+# A key reserved by a request that never finished (e.g. its worker was killed) is released after this
+IDEMPOTENCY_PENDING_TIMEOUT = timedelta(minutes=1)
+
 MIDDLEWARE = [
+    'libraryapp.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -83,6 +170,47 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Largest ?page_size= a client may ask for (libraryapp/pagination.py)
+PAGINATION_MAX_PAGE_SIZE = 500
+
+# Max SQL queries per view, not counting the throttle counters (see libraryapp/middleware.py).
+# Exceeding a budget logs a warning, and fails the request under `manage.py test` so N+1
+# regressions show up as test failures.
+QUERY_BUDGETS = {
+    'token_obtain_pair': 2,
+    'token_refresh': 2,
+    'user-list': 3,
+    'user-me': 2,
+    'user-summary': 2,
+    'book-list': 5,
+    'book-detail': 8,
+    'book-autocomplete': 3,
+    'book-recommendations': 4,
+    'category-list': 3,
+    'deletionjob-detail': 3,
+    'borrowrecord-list': 11,
+    'borrowrecord-detail': 6,
+    'borrowrecord-return-book': 11,
+    'borrowrecord-mark-fine-paid': 9,
+    'borrowrecord-unpaid-fines': 3,
+    'borrowrecord-analytics': 6,
+    'borrowrecord-check-due-books': 3,
+}
+DEFAULT_QUERY_BUDGET = None
+QUERY_BUDGET_STRICT = os.getenv('QUERY_BUDGET_STRICT', str(TESTING)).lower() == 'true'
+
+# /metrics (libraryapp/metrics.py). With several worker processes point METRICS_DIR at a
+# directory shared by all of them so the scrape sees every worker's counters.
+# Clear that directory at deploy time, before the workers start.
+METRICS_DIR = os.getenv('METRICS_DIR') or None
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '1.0'))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN') or None
+
+# Opt-in slow-query log with EXPLAIN QUERY PLAN (libraryapp/slow_queries.py), written to slow_queries.log.
+SLOW_QUERY_THRESHOLD_MS = float(os.environ['SLOW_QUERY_THRESHOLD_MS']) if os.getenv('SLOW_QUERY_THRESHOLD_MS') else None
+# Log the values of bound parameters, not just their types (they include password hashes and emails)
+SLOW_QUERY_LOG_PARAMS = os.getenv('SLOW_QUERY_LOG_PARAMS', 'False').lower() == 'true'
+
 ROOT_URLCONF = 'libraryProject.urls'
 
 TEMPLATES = [
@@ -111,8 +239,20 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        # WAL: readers and the writer no longer block each other
+        'OPTIONS': {'init_command': 'PRAGMA journal_mode=WAL;'},
+    },
+    # Same file, opened read-only. Safe viewset reads are routed here (libraryapp/db_router.py)
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': (BASE_DIR / 'db.sqlite3').as_uri() + '?mode=ro',
+        'OPTIONS': {'uri': True},
+        'TEST': {'MIRROR': 'default'},
+    },
 }
+DATABASE_ROUTERS = ['libraryapp.db_router.ReadReplicaRouter']
+READ_REPLICA_ALIAS = 'replica'
+READ_REPLICA_ENABLED = os.getenv('READ_REPLICA_ENABLED', str(not TESTING)).lower() == 'true'
 
 
 # Password validation
@@ -160,20 +300,67 @@ import os
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'records': {
+            'format': '%(asctime)s %(levelname)s %(name)s %(message)s',
+        },
+    },
+    'filters': {
+        # At most `burst` records per (status, view, exception) every `window` seconds (libraryapp/logging_utils.py)
+        'sample_repeats': {
+            '()': 'libraryapp.logging_utils.SampleRepeatsFilter',
+            'burst': int(os.getenv('API_ERROR_LOG_BURST', '10')),
+            'window': 60,
+        },
+    },
     'handlers': {
         'console': {
             'class': 'logging.StreamHandler',
         },
+        'null': {
+            'class': 'logging.NullHandler',
+        },
+        # Written from a background thread, like slow_queries_file
         'file': {
-            'class': 'logging.FileHandler',
+            'class': 'libraryapp.logging_utils.BackgroundRotatingFileHandler',
             'filename': os.path.join(BASE_DIR, 'error.log'),
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'formatter': 'records',
+        },
+        # Rotating file written from a background thread (libraryapp/logging_utils.py)
+        'slow_queries_file': {
+            'class': 'libraryapp.logging_utils.BackgroundRotatingFileHandler',
+            'filename': os.path.join(BASE_DIR, 'slow_queries.log'),
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
         },
     },
     'loggers': {
+        # Tests keep the tracked error.log untouched: console only
         'django': {
-            'handlers': ['console', 'file'],
+            'handlers': ['console'] if TESTING else ['console', 'file'],
             'level': 'ERROR',
             'propagate': True,
         },
+        # One JSON line per request from PerformanceMiddleware
+        'libraryapp.performance': {
+            'handlers': ['console'],
+            'level': 'WARNING' if TESTING else os.getenv('PERFORMANCE_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+        # Exceptions handled by the DRF exception handler (libraryapp/exception_handler.py).
+        # Discarded under tests, which raise plenty on purpose (and check them with assertLogs)
+        'libraryapp.exception_handler': {
+            'handlers': ['null'] if TESTING else ['file'],
+            'filters': ['sample_repeats'],
+            'level': 'WARNING' if TESTING else os.getenv('API_ERROR_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+        'libraryapp.slow_queries': {
+            'handlers': ['slow_queries_file'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
     },
 }
@@ -16,8 +16,11 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path,include
+from libraryapp.views import metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/',include('libraryapp.urls')),
+    # Prometheus scrape target (request latency histograms, error and query counters)
+    path('metrics', metrics, name='metrics'),
 ]
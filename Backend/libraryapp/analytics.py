@@ -0,0 +1,128 @@
+# libraryapp/analytics.py
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Book, BorrowRecord, Category
+
+"""
+Circulation analytics for acquisitions, served by GET /api/borrow-records/analytics/.
+
+->Only three columns of the recent loans are read (book, category, borrow date), streamed in chunks
+  straight into NumPy arrays. Everything after that is array arithmetic: no Python loop runs per loan.
+->popular_books: loan counts per book over each of ANALYTICS_WINDOWS_DAYS (bincount + argpartition).
+->categories: per-category loan counts per window, a weekly demand curve over ANALYTICS_HISTORY_WEEKS
+  (trailing 7-day blocks ending now, oldest first) and a linear-trend forecast for the next
+  ANALYTICS_FORECAST_WEEKS, fitted to the last ANALYTICS_TREND_WEEKS weeks of every category at once.
+->Results are cached under the id of the newest BorrowRecord (and the date, as windows roll daily),
+  so they are recomputed only once new loans have arrived.
+"""
+
+INDEX_DTYPE = np.int64
+LOAN_DTYPE = [('book', INDEX_DTYPE), ('category', INDEX_DTYPE), ('timestamp', np.float64)]
+SECONDS_PER_DAY = 86400
+
+
+def load_loans(since, chunk_size):
+    """Structured array (book, category, borrow timestamp) of loans made after `since`."""
+    loans = BorrowRecord.objects.filter(borrow_date__gte=since).values_list(
+        'book_id', 'book__category_id', 'borrow_date'
+    ).order_by()
+    return np.fromiter(
+        ((book, category, borrowed.timestamp()) for book, category, borrowed in loans.iterator(chunk_size=chunk_size)),
+        dtype=LOAN_DTYPE,
+    )
+
+
+def linear_forecast(weekly, trend_weeks, horizon):
+    """
+    Least-squares line through the last `trend_weeks` columns of `weekly` (one row per category),
+    extended `horizon` weeks ahead. Negative demand is clipped to 0.
+    """
+    recent = weekly[:, -trend_weeks:].astype(np.float64)
+    t = np.arange(recent.shape[1], dtype=np.float64)
+    centred = t - t.mean()
+    means = recent.mean(axis=1)
+    denominator = centred @ centred
+    slopes = (recent - means[:, None]) @ centred / denominator if denominator else np.zeros(len(recent))
+    future = np.arange(1, horizon + 1) + t[-1] - t.mean()
+    return np.clip(means[:, None] + slopes[:, None] * future[None, :], 0, None)
+
+
+def compute(loans, now, top):
+    windows = settings.ANALYTICS_WINDOWS_DAYS
+    weeks = settings.ANALYTICS_HISTORY_WEEKS
+    age_days = ((now.timestamp() - loans['timestamp']) // SECONDS_PER_DAY).astype(INDEX_DTYPE)
+
+    # Dense indexes for bincount
+    book_ids, book_index = np.unique(loans['book'], return_inverse=True)
+    category_ids, category_index = np.unique(loans['category'], return_inverse=True)
+
+    popular = {}
+    category_windows = {}
+    for days in windows:
+        in_window = age_days < days
+        per_book = np.bincount(book_index[in_window], minlength=len(book_ids))
+        best = np.argpartition(-per_book, min(top, len(per_book)) - 1)[:top] if len(per_book) else per_book
+        best = best[np.lexsort((book_ids[best], -per_book[best]))]  # most loans first, then by id
+        popular[days] = [(int(book_ids[i]), int(per_book[i])) for i in best if per_book[i] > 0]
+        category_windows[days] = np.bincount(category_index[in_window], minlength=len(category_ids))
+
+    # Weekly demand curves: one row per category, oldest week first
+    week = weeks - 1 - age_days // 7
+    in_history = (week >= 0) & (week < weeks)
+    weekly = np.bincount(
+        category_index[in_history] * weeks + week[in_history], minlength=len(category_ids) * weeks
+    ).reshape(len(category_ids), weeks)
+    forecast = linear_forecast(weekly, settings.ANALYTICS_TREND_WEEKS, settings.ANALYTICS_FORECAST_WEEKS)
+    return popular, category_ids, category_windows, weekly, forecast
+
+
+def circulation_report(top=20):
+    """Cached analytics report (a JSON-ready dict)."""
+    now = timezone.now()
+    last_record_id = BorrowRecord.objects.aggregate(last=Max('id'))['last'] or 0
+    cache_key = f'libraryapp:analytics:{last_record_id}:{now.date().isoformat()}:{top}'
+    report = cache.get(cache_key)
+    if report is not None:
+        return report
+
+    weeks = settings.ANALYTICS_HISTORY_WEEKS
+    history_days = max(weeks * 7, max(settings.ANALYTICS_WINDOWS_DAYS))
+    loans = load_loans(now - timedelta(days=history_days), settings.ANALYTICS_CHUNK_SIZE)
+    popular, category_ids, category_windows, weekly, forecast = compute(loans, now, top)
+
+    titles = dict(Book.objects.filter(
+        id__in={book_id for books in popular.values() for book_id, _ in books}
+    ).values_list('id', 'title'))
+    names = dict(Category.objects.filter(id__in=category_ids.tolist()).values_list('id', 'name'))
+    week_starts = [(now - timedelta(days=7 * (weeks - i))).date().isoformat() for i in range(weeks)]
+
+    report = {
+        'generated_at': now.isoformat(),
+        'last_record_id': last_record_id,
+        'loans_analysed': len(loans),
+        'week_starts': week_starts,
+        'popular_books': {
+            str(days): [
+                {'book_id': book_id, 'title': titles.get(book_id), 'loans': count} for book_id, count in books
+            ]
+            for days, books in popular.items()
+        },
+        'categories': [
+            {
+                'category_id': int(category_id),
+                'name': names.get(int(category_id)),
+                'loans': {str(days): int(counts[i]) for days, counts in category_windows.items()},
+                'weekly_loans': weekly[i].tolist(),
+                'forecast': np.round(forecast[i], 1).tolist(),
+            }
+            for i, category_id in enumerate(category_ids)
+        ],
+    }
+    cache.set(cache_key, report, settings.ANALYTICS_CACHE_SECONDS)
+    return report
@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class LibraryappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'libraryapp'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from .instrumentation import install_query_recorder
+        from .slow_queries import install_slow_query_logger
+        from . import signals  # noqa: F401  (registers the @receiver functions)
+
+        connection_created.connect(install_query_recorder, dispatch_uid='libraryapp_query_recorder')
+        connection_created.connect(install_slow_query_logger, dispatch_uid='libraryapp_slow_query_logger')
@@ -0,0 +1,63 @@
+# libraryapp/archive.py
+import time
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import BorrowRecord, BorrowRecordArchive
+
+"""
+Moves closed loans from BorrowRecord to BorrowRecordArchive (`manage.py archive_borrow_records`).
+
+->Eligible: returned more than `older_than_days` ago with no fine outstanding. Open loans and unpaid
+  fines always stay in BorrowRecord, so get_queryset, check_due_books and unpaid_fines never need the archive.
+->Each batch is its own short transaction: INSERT ... SELECT into the archive, then DELETE the same ids.
+  A write lock is held for one batch at a time, and `pause` seconds between batches let borrow/return
+  requests through. Interrupting the command loses nothing: every batch is either fully moved or untouched.
+->Batches walk the table by id, so each one starts where the previous one stopped instead of rescanning.
+"""
+
+ARCHIVE_COLUMNS = ('id', 'user_id', 'book_id', 'borrow_date', 'due_date', 'return_date', 'fine_amount', 'fine_paid')
+
+
+def archivable(older_than_days):
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    return BorrowRecord.objects.filter(return_date__isnull=False, return_date__lt=cutoff).filter(
+        Q(fine_paid=True) | Q(fine_amount=0)
+    )
+
+
+def move_batch(ids, archived_at):
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(column) for column in ARCHIVE_COLUMNS)
+    placeholders = ', '.join(['%s'] * len(ids))
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {quote(BorrowRecordArchive._meta.db_table)} ({columns}, {quote('archived_at')}) "
+                f"SELECT {columns}, %s FROM {quote(BorrowRecord._meta.db_table)} WHERE {quote('id')} IN ({placeholders})",
+                [archived_at, *ids],
+            )
+        BorrowRecord.objects.filter(id__in=ids).delete()
+
+
+def archive_borrow_records(older_than_days, batch_size=500, pause=0.0, limit=None, progress=None):
+    """Moves eligible records in batches; returns how many were archived."""
+    queryset = archivable(older_than_days).order_by('id')
+    moved = 0
+    last_id = 0
+    while limit is None or moved < limit:
+        size = batch_size if limit is None else min(batch_size, limit - moved)
+        ids = list(queryset.filter(id__gt=last_id).values_list('id', flat=True)[:size])
+        if not ids:
+            break
+        move_batch(ids, timezone.now())
+        moved += len(ids)
+        last_id = ids[-1]
+        if progress:
+            progress(moved)
+        if pause:
+            time.sleep(pause)
+    return moved
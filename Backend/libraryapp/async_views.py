@@ -0,0 +1,191 @@
+# -------------------------------------------------------------------------
+# Async versions of the I/O-bound BorrowRecord actions
+# -------------------------------------------------------------------------
+# BorrowRecordViewSet.send_email and check_due_books talk to the SMTP server
+# synchronously, so one worker is blocked for the whole SMTP handshake.
+# The views below do the same work as plain Django async views:
+#   - under ASGI (libraryProject/asgi.py) the event loop keeps serving other
+#     requests while a mail is being sent
+#   - send_mail runs in a worker thread (sync_to_async, thread_sensitive=False),
+#     because Django's SMTP backend has no async API
+#   - check_due_books sends its notifications concurrently
+#     (at most ASYNC_MAIL_CONCURRENCY at a time)
+#
+# book_events (Server-Sent Events) lives here too: it needs a long-lived
+# async response that only ASGI can serve efficiently.
+#
+# DRF views are sync-only, so authentication (JWT) and permissions reuse the
+# DRF classes directly instead of going through APIView.
+# -------------------------------------------------------------------------
+
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.mail import send_mail
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .events import broker
+from .models import BorrowRecord
+from .permissions import IsAdminOrLibrarian
+from .utils import send_due_notification
+
+
+def error_response(status_code, message):
+    # Same shape as libraryapp.exception_handler.custom_exception_handler
+    return JsonResponse({
+        "success": False,
+        "status_code": status_code,
+        "error": message,
+    }, status=status_code)
+
+
+async def authorize(request, permission):
+    """Sets request.user from the JWT and checks `permission`. Returns an error response or None."""
+    try:
+        result = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except APIException as exc:
+        return error_response(status.HTTP_401_UNAUTHORIZED, str(exc.detail))
+    if result is None:
+        return error_response(status.HTTP_401_UNAUTHORIZED, 'Authentication credentials were not provided.')
+    request.user = result[0]
+    if not permission().has_permission(request, None):
+        return error_response(status.HTTP_403_FORBIDDEN, 'You do not have permission to perform this action.')
+    return None
+
+
+# ---------------------------------------------------------------------
+# POST /api/async/borrow-records/{id}/send_email/
+# Librarian/Admin — send custom email to borrower (async twin of
+# BorrowRecordViewSet.send_email, same request and response bodies)
+# ---------------------------------------------------------------------
+@csrf_exempt
+@require_POST
+async def send_email(request, pk):
+    denied = await authorize(request, IsAdminOrLibrarian)
+    if denied:
+        return denied
+
+    try:
+        borrow_record = await BorrowRecord.objects.select_related('user').aget(pk=pk)
+    except BorrowRecord.DoesNotExist:
+        return error_response(status.HTTP_404_NOT_FOUND, 'No BorrowRecord matches the given query.')
+
+    try:
+        data = json.loads(request.body or b'{}') if request.content_type == 'application/json' else request.POST
+    except ValueError:
+        return error_response(status.HTTP_400_BAD_REQUEST, 'Invalid JSON body.')
+    subject = data.get('subject')
+    message = data.get('message')
+    if not subject or not message:
+        return JsonResponse({'error': 'Subject and message are required.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        await sync_to_async(send_mail, thread_sensitive=False)(
+            subject=subject,
+            message=message,
+            from_email=settings.EMAIL_HOST_USER,
+            recipient_list=[borrow_record.user.email],
+            fail_silently=False,
+        )
+        return JsonResponse({'message': 'Email sent successfully.'})
+    except Exception as e:
+        return JsonResponse({'error': f'Failed to send email: {str(e)}'},
+                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+# ---------------------------------------------------------------------
+# GET /api/async/borrow-records/check_due_books/
+# Admin-only — async twin of BorrowRecordViewSet.check_due_books
+# ---------------------------------------------------------------------
+@require_GET
+async def check_due_books(request):
+    denied = await authorize(request, IsAdminUser)
+    if denied:
+        return denied
+
+    records = BorrowRecord.objects.select_related('book', 'user').filter(
+        return_date__isnull=True,
+        due_date__lte=timezone.now()
+    )
+    limit = asyncio.Semaphore(settings.ASYNC_MAIL_CONCURRENCY)
+    notify = sync_to_async(send_due_notification, thread_sensitive=False)
+
+    async def send(record):
+        async with limit:
+            await notify(record.user.email, record.book.title, record.due_date.strftime('%Y-%m-%d'))
+
+    results = await asyncio.gather(*[send(record) async for record in records], return_exceptions=True)
+    failed = sum(1 for result in results if isinstance(result, Exception))
+    response = {'message': f'Sent {len(results) - failed} notifications for overdue books'}
+    if failed:
+        response['failed'] = failed
+    return JsonResponse(response)
+
+
+# ---------------------------------------------------------------------
+# GET /api/books/events/?category=1,2&book=7
+# Any logged-in user — Server-Sent Events stream of Book.status changes
+# (see events.py). Replaces polling GET /api/books/?status=available.
+# Browsers' EventSource cannot send headers, so ?token=<access token> is
+# accepted in place of the Authorization header.
+#
+#   event: book.status
+#   id: 42
+#   data: {"book_id": 7, "category_id": 1, "status": "available", ...}
+# ---------------------------------------------------------------------
+def parse_id_list(value):
+    if not value:
+        return None
+    return frozenset(int(part) for part in value.split(',') if part.strip())
+
+
+def format_event(event):
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+async def book_event_stream(category_ids, book_ids):
+    # Subscribing inside the generator ties the subscription's lifetime to the stream:
+    # the finally block runs when the client disconnects and the server closes the generator
+    subscription = broker.subscribe(category_ids=category_ids, book_ids=book_ids)
+    try:
+        yield f"retry: {settings.SSE_RETRY_MS}\n: connected\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), timeout=settings.SSE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                # Comment line: keeps proxies from closing an idle connection
+                yield ": keepalive\n\n"
+                continue
+            yield format_event(event)
+    finally:
+        broker.unsubscribe(subscription)
+
+
+@require_GET
+async def book_events(request):
+    token = request.GET.get('token')
+    if token and 'HTTP_AUTHORIZATION' not in request.META:
+        request.META['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+    denied = await authorize(request, IsAuthenticated)
+    if denied:
+        return denied
+
+    try:
+        category_ids = parse_id_list(request.GET.get('category'))
+        book_ids = parse_id_list(request.GET.get('book'))
+    except ValueError:
+        return error_response(status.HTTP_400_BAD_REQUEST, 'category and book must be comma-separated ids.')
+
+    response = StreamingHttpResponse(book_event_stream(category_ids, book_ids), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx: do not buffer the stream
+    return response
@@ -0,0 +1,256 @@
+# libraryapp/autocomplete.py
+import logging
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db.models import Count, Max, Sum
+
+"""
+In-memory prefix index behind GET /api/books/autocomplete/?q=.
+
+->Keys are normalized (case-folded, accents stripped, whitespace collapsed) titles and authors, plus
+  every later word of a title, so "phys" finds both "Physics 101" and "Modern Physics".
+->Keys live in one sorted list; the book id and field of each key are kept in parallel compact
+  arrays. A lookup is a bisect to the first key >= prefix and a short forward scan: O(log n + k).
+->Books of categories being deleted (Category.is_deleted) are left out, like everywhere in the API.
+->Built lazily from the database on first use, then kept up to date by the Book post_save/post_delete
+  and Category post_save receivers in signals.py (after commit), with no further queries.
+->The index belongs to one process, so it also checks for changes made by other workers: at most
+  every AUTOCOMPLETE_REFRESH_SECONDS a lookup compares the count, highest id and summed `version` of
+  the indexed books with the database (one aggregate query) and rebuilds the index when they differ.
+  Lookups keep using the old index while the new one is built.
+->Memory is bounded: keys are cut to AUTOCOMPLETE_MAX_KEY_LENGTH characters, titles contribute at
+  most AUTOCOMPLETE_MAX_WORDS word keys, and no more than AUTOCOMPLETE_MAX_ENTRIES keys are held
+  (books beyond that are not suggested until the index is rebuilt).
+"""
+
+logger = logging.getLogger(__name__)
+
+TITLE = 0
+AUTHOR = 1
+TITLE_WORD = 2  # key starts at a later word of the title
+FIELD_NAMES = ('title', 'author', 'title')
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(text.casefold().split())
+
+
+class PrefixIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built = False
+        self._keys = []
+        self._book_ids = array('q')
+        self._fields = bytearray()
+        self._books = {}  # book id -> (title, author, category id), for display and for removing old keys
+        self._hidden_categories = set()
+        self._generation = None  # (count, max id, summed version) of the books the index was built from
+        self._checked_at = 0.0
+        self._full_warned = False
+
+    # ---------------------------------------------------------------------
+    # Building and incremental updates
+    # ---------------------------------------------------------------------
+    def keys_for(self, title, author):
+        limit = settings.AUTOCOMPLETE_MAX_KEY_LENGTH
+        keys = []
+        words = normalize(title).split(' ')
+        for start in range(min(len(words), settings.AUTOCOMPLETE_MAX_WORDS)):
+            key = ' '.join(words[start:])[:limit]
+            if key:
+                keys.append((key, TITLE_WORD if start else TITLE))
+        author_key = normalize(author)[:limit]
+        if author_key:
+            keys.append((author_key, AUTHOR))
+        return keys
+
+    def ensure_built(self):
+        if self._built:
+            self._check_generation()
+            return
+        with self._lock:
+            if self._built:
+                return
+            self._build()
+
+    def _build(self):
+        """Reads every book and swaps the new index in; lookups use the old one until then."""
+        from .models import Book
+
+        entries = []
+        books = {}
+        hidden = set()
+        count, max_id, versions = 0, 0, 0
+        max_entries = settings.AUTOCOMPLETE_MAX_ENTRIES
+        full = False
+        rows = Book.objects.order_by('id').values_list(
+            'id', 'title', 'author', 'category_id', 'category__is_deleted', 'version'
+        )
+        for book_id, title, author, category_id, category_hidden, version in rows.iterator():
+            if category_hidden:
+                hidden.add(category_id)
+                continue
+            # The generation covers every visible book, also those left out of a full index
+            count, max_id, versions = count + 1, book_id, versions + version
+            if full:
+                continue
+            keys = self.keys_for(title, author)
+            if len(entries) + len(keys) > max_entries:
+                full = True
+                self._warn_full()
+                continue
+            books[book_id] = (title, author, category_id)
+            entries.extend((key, book_id, field) for key, field in keys)
+        entries.sort()
+        keys = [key for key, _, _ in entries]
+        book_ids = array('q', (book_id for _, book_id, _ in entries))
+        fields = bytearray(field for _, _, field in entries)
+        with self._lock:
+            self._keys, self._book_ids, self._fields, self._books = keys, book_ids, fields, books
+            self._hidden_categories = hidden
+            self._generation = (count, max_id, versions)
+            self._checked_at = time.monotonic()
+            self._built = True
+
+    def _check_generation(self):
+        """Rebuilds the index if other processes changed the books since it was built."""
+        interval = settings.AUTOCOMPLETE_REFRESH_SECONDS
+        if time.monotonic() - self._checked_at < interval:
+            return
+        with self._lock:
+            # One lookup checks; the others keep going with the index as it is
+            if time.monotonic() - self._checked_at < interval:
+                return
+            self._checked_at = time.monotonic()
+        from .models import Book
+
+        stored = Book.objects.filter(category__is_deleted=False).aggregate(
+            count=Count('id'), max_id=Max('id'), versions=Sum('version'),
+        )
+        if (stored['count'], stored['max_id'] or 0, stored['versions'] or 0) != self._generation:
+            self._build()
+
+    def _warn_full(self):
+        if not self._full_warned:
+            self._full_warned = True
+            logger.warning("Autocomplete index is full (AUTOCOMPLETE_MAX_ENTRIES=%s); new books are not indexed",
+                           settings.AUTOCOMPLETE_MAX_ENTRIES)
+
+    def _insert(self, key, book_id, field):
+        position = bisect_left(self._keys, key)
+        self._keys.insert(position, key)
+        self._book_ids.insert(position, book_id)
+        self._fields.insert(position, field)
+
+    def _delete(self, key, book_id, field):
+        position = bisect_left(self._keys, key)
+        while position < len(self._keys) and self._keys[position] == key:
+            if self._book_ids[position] == book_id and self._fields[position] == field:
+                del self._keys[position]
+                del self._book_ids[position]
+                del self._fields[position]
+                return
+            position += 1
+
+    def update(self, book_id, title, author, category_id):
+        """Add or re-index one book. No-op until the index has been built."""
+        if not self._built:
+            return
+        with self._lock:
+            if self._books.get(book_id) == (title, author, category_id):
+                return
+            self._remove(book_id)
+            if category_id in self._hidden_categories:
+                return
+            keys = self.keys_for(title, author)
+            if len(self._keys) + len(keys) > settings.AUTOCOMPLETE_MAX_ENTRIES:
+                self._warn_full()
+                return
+            self._books[book_id] = (title, author, category_id)
+            for key, field in keys:
+                self._insert(key, book_id, field)
+
+    def remove(self, book_id):
+        if not self._built:
+            return
+        with self._lock:
+            self._remove(book_id)
+
+    def hide_category(self, category_id):
+        """Drops the books of a category that is being deleted, now and when they are saved later."""
+        if not self._built:
+            return
+        with self._lock:
+            self._hidden_categories.add(category_id)
+            for book_id in [book_id for book_id, book in self._books.items() if book[2] == category_id]:
+                self._remove(book_id)
+
+    def _remove(self, book_id):
+        previous = self._books.pop(book_id, None)
+        if previous is not None:
+            title, author, _ = previous
+            for key, field in self.keys_for(title, author):
+                self._delete(key, book_id, field)
+
+    def clear(self):
+        with self._lock:
+            self._built = False
+            self._keys = []
+            self._book_ids = array('q')
+            self._fields = bytearray()
+            self._books = {}
+            self._hidden_categories = set()
+            self._generation = None
+            self._checked_at = 0.0
+            self._full_warned = False
+
+    def __len__(self):
+        return len(self._keys)
+
+    # ---------------------------------------------------------------------
+    # Lookup
+    # ---------------------------------------------------------------------
+    def suggest(self, query, limit=10):
+        """
+        Up to `limit` distinct suggestions for the prefix `query`. Titles and authors that start
+        with it come before titles that only have a later word starting with it; within each group
+        shorter completions come first, then alphabetical order. Authors are suggested once however
+        many books they wrote. Only the first `limit` * 20 matching keys (alphabetically) are ranked.
+        """
+        prefix = normalize(query)[:settings.AUTOCOMPLETE_MAX_KEY_LENGTH]
+        if not prefix or limit < 1:
+            return []
+        self.ensure_built()
+        with self._lock:
+            keys, book_ids, fields, books = self._keys, self._book_ids, self._fields, self._books
+            matches = []
+            seen = set()
+            position = bisect_left(keys, prefix)
+            # Bounded scan: many keys can share a prefix (duplicate authors/titles)
+            end = min(position + limit * 20, len(keys))
+            while position < end and keys[position].startswith(prefix):
+                book_id, field = book_ids[position], fields[position]
+                name = FIELD_NAMES[field]
+                text = books[book_id][AUTHOR if field == AUTHOR else TITLE]
+                if (name, text) not in seen:
+                    seen.add((name, text))
+                    matches.append((field == TITLE_WORD, len(keys[position]), name, text, book_id))
+                position += 1
+        matches.sort(key=lambda match: match[:2])  # stable: key order kept for equal lengths
+        suggestions = []
+        for _, _, name, text, book_id in matches[:limit]:
+            suggestion = {'text': text, 'field': name}
+            if name == 'title':
+                suggestion['book_id'] = book_id
+            suggestions.append(suggestion)
+        return suggestions
+
+
+index = PrefixIndex()
@@ -0,0 +1,310 @@
+# libraryapp/benchmarks.py
+import logging
+import math
+import multiprocessing
+import secrets
+import time
+from contextlib import ExitStack
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import workers
+from .models import Book, Category, User
+
+"""
+In-process endpoint benchmarks, run by `manage.py benchmark_api` against whatever database
+settings point at (seed it first with `manage.py seed_library`).
+
+->Requests go through the full Django/DRF stack with APIClient, so middleware, JWT auth,
+  permissions, filtering and serialization are all included; only the network is not.
+->Each scenario is one "operation" (a borrow/return cycle is two requests). For every scenario
+  we report p50/p95/p99 latency, throughput (operations/second, one client) and SQL queries per operation.
+"""
+
+# Created for each run with a random suffix and password, and deleted by cleanup()
+BENCHMARK_USERS = {
+    'admin': {'username': 'bench_admin', 'is_staff': True},
+    'librarian': {'username': 'bench_librarian', 'is_staff': False},
+    'member': {'username': 'bench_member', 'is_staff': False},
+}
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+class BenchmarkContext:
+    """
+    Authenticated clients per role plus sample ids the scenarios query with.
+    The benchmark users only exist for the run: call cleanup() when done.
+    """
+
+    def __init__(self):
+        self.users = {}
+        self.clients = {}
+        # Only token_obtain logs in; the other clients get their token directly
+        self.password = secrets.token_urlsafe(24)
+        suffix = secrets.token_hex(4)
+        try:
+            for role, spec in BENCHMARK_USERS.items():
+                username = f"{spec['username']}_{suffix}"
+                user = User.objects.create_user(
+                    username=username, email=f'{username}@example.com', password=self.password,
+                    role=role, is_staff=spec['is_staff'],
+                )
+                self.users[role] = user
+                client = APIClient()
+                client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+                self.clients[role] = client
+        except Exception:
+            self.cleanup()
+            raise
+        self.anonymous = APIClient()
+
+        category = Category.objects.order_by('id').first()
+        self.category_id = category.id if category else 0
+        book = Book.objects.order_by('id').first()
+        self.search_term = book.title.split()[0] if book else 'Physics'
+
+    def available_book_id(self):
+        book = Book.objects.filter(status='available').order_by('id').values_list('id', flat=True).first()
+        if book is None:
+            raise RuntimeError("No available book left for the borrow/return scenario")
+        return book
+
+    def cleanup(self):
+        """Delete the benchmark users, and with them the loans of the borrow/return scenario."""
+        User.objects.filter(pk__in=[user.pk for user in self.users.values()]).delete()
+
+
+# -------------------------------------------------------------------------
+# Scenarios: each takes the context and performs one operation
+# -------------------------------------------------------------------------
+def book_search(ctx):
+    return [ctx.clients['member'].get(reverse('book-list'), {'search': ctx.search_term})]
+
+
+def book_list_filtered(ctx):
+    return [ctx.clients['member'].get(reverse('book-list'), {
+        'status': 'available', 'category': ctx.category_id, 'ordering': 'title',
+    })]
+
+
+def borrow_records_member(ctx):
+    return [ctx.clients['member'].get(reverse('borrowrecord-list'))]
+
+
+def borrow_records_librarian(ctx):
+    return [ctx.clients['librarian'].get(reverse('borrowrecord-list'))]
+
+
+def borrow_return_cycle(ctx):
+    client = ctx.clients['member']
+    borrowed = client.post(reverse('borrowrecord-list'), {
+        'book_id': ctx.available_book_id(),
+        'due_date': (timezone.now() + timedelta(days=14)).isoformat(),
+    })
+    returned = client.post(reverse('borrowrecord-return-book', args=[borrowed.data['id']]))
+    return [borrowed, returned]
+
+
+def unpaid_fines(ctx):
+    return [ctx.clients['admin'].get(reverse('borrowrecord-unpaid-fines'))]
+
+
+def check_due_books(ctx):
+    return [ctx.clients['admin'].get(reverse('borrowrecord-check-due-books'))]
+
+
+def token_obtain(ctx):
+    return [ctx.anonymous.post(reverse('token_obtain_pair'), {
+        'username': ctx.users['member'].username, 'password': ctx.password,
+    })]
+
+
+SCENARIOS = {
+    'book-search': book_search,
+    'book-list-filtered': book_list_filtered,
+    'borrow-records-member': borrow_records_member,
+    'borrow-records-librarian': borrow_records_librarian,
+    'borrow-return-cycle': borrow_return_cycle,
+    'unpaid-fines': unpaid_fines,
+    'check-due-books': check_due_books,
+    'token-obtain': token_obtain,
+}
+
+
+def run_scenario(ctx, scenario, iterations, warmup):
+    for _ in range(warmup):
+        scenario(ctx)
+    # With READ_REPLICA_ENABLED the book reads run on the replica connection: count those too
+    aliases = [DEFAULT_DB_ALIAS] + ([settings.READ_REPLICA_ALIAS] if settings.READ_REPLICA_ENABLED else [])
+    latencies = []
+    queries = 0
+    started = time.perf_counter()
+    for _ in range(iterations):
+        with ExitStack() as stack:
+            captured = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in aliases]
+            op_started = time.perf_counter()
+            responses = scenario(ctx)
+            latencies.append(time.perf_counter() - op_started)
+        for response in responses:
+            if response.status_code >= 400:
+                raise RuntimeError(f"{scenario.__name__} got HTTP {response.status_code}: {response.data}")
+        queries += sum(len(context) for context in captured)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'iterations': iterations,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'throughput_ops': round(iterations / elapsed, 2),
+        'queries_per_op': round(queries / iterations, 2),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Scenario-by-scenario comparison with a baseline results file.
+    A scenario regresses when its p95 grows by more than `tolerance` (0.2 = 20%)
+    or it runs more SQL queries per operation than before.
+    """
+    comparison = {}
+    for name, current in results.items():
+        previous = baseline.get('results', {}).get(name)
+        if previous is None:
+            continue
+        p95_change = (current['p95_ms'] - previous['p95_ms']) / previous['p95_ms'] if previous['p95_ms'] else 0.0
+        comparison[name] = {
+            'baseline_p95_ms': previous['p95_ms'],
+            'p95_change': round(p95_change, 3),
+            'baseline_queries_per_op': previous['queries_per_op'],
+            'regressed': p95_change > tolerance or current['queries_per_op'] > previous['queries_per_op'],
+        }
+    return comparison
+
+
+# -------------------------------------------------------------------------
+# Reader/writer contention (manage.py benchmark_contention)
+# -------------------------------------------------------------------------
+def latency_summary(latencies, errors, elapsed):
+    latencies.sort()
+    return {
+        'operations': len(latencies),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'throughput_ops': round(len(latencies) / elapsed, 2),
+    }
+
+
+def contention_client(kind, user_id, category_id, read_book, write_book, use_replica, duration, barrier, results):
+    """
+    One reader or writer process of run_contention (started through workers.run). Waits for every
+    other client to be ready, runs its operation in a loop for `duration` seconds and puts
+    (kind, latencies, errors, failure) on the `results` queue.
+    """
+    latencies, errors, failure = [], 0, None
+    try:
+        # ALLOWED_HOSTS for the test client, no per-request log lines, no 429s
+        setup_test_environment()
+        logging.getLogger('libraryapp.performance').setLevel(logging.WARNING)
+        override_settings(THROTTLE_ENABLED=False, READ_REPLICA_ENABLED=use_replica).enable()
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(User.objects.get(pk=user_id))}')
+
+        def read():
+            return [
+                client.get(reverse('book-list'), {'category': category_id, 'ordering': 'title'}),
+                client.get(reverse('book-detail', args=[read_book])),
+            ]
+
+        def cycle():
+            borrowed = client.post(reverse('borrowrecord-list'), {
+                'book_id': write_book, 'due_date': (timezone.now() + timedelta(days=14)).isoformat(),
+            })
+            if borrowed.status_code >= 400:
+                return [borrowed]
+            return [borrowed, client.post(reverse('borrowrecord-return-book', args=[borrowed.data['id']]))]
+
+        operation = read if kind == 'reader' else cycle
+        barrier.wait(timeout=120)
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                ok = all(response.status_code < 500 for response in operation())
+            except DatabaseError:  # e.g. "database is locked"
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+    except Exception as exc:
+        barrier.abort()  # do not leave the other clients waiting
+        failure = f'{kind}: {exc!r}'
+    finally:
+        connections.close_all()
+        results.put((kind, latencies, errors, failure))
+
+
+def run_contention(ctx, readers, writers, duration, use_replica):
+    """
+    `readers` processes list/retrieve books while `writers` processes run borrow/return cycles, for
+    `duration` seconds. Each client is a separate process with its own database connections, like the
+    workers of a multi-process server, so SQLite locking is measured rather than the GIL.
+    With `use_replica`, book reads go through the read-only connection (db_router.py); otherwise
+    everything uses `default`.
+    """
+    book_ids = list(
+        Book.objects.filter(status='available').order_by('id').values_list('id', flat=True)[:writers + 1]
+    )
+    if len(book_ids) < writers + 1:
+        raise RuntimeError(f"Need {writers + 1} available books for the contention benchmark")
+    read_book, write_books = book_ids[0], book_ids[1:]
+    clients = [('reader', None)] * readers + [('writer', book_id) for book_id in write_books]
+
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(len(clients))
+    queue = context.Queue()
+    processes = [
+        context.Process(target=workers.run, args=(
+            workers.current_settings_module(), 'libraryapp.benchmarks.contention_client',
+            kind, ctx.users['member'].pk, ctx.category_id, read_book, write_book, use_replica, duration,
+            barrier, queue,
+        ))
+        for kind, write_book in clients
+    ]
+    for process in processes:
+        process.start()
+    try:
+        # Read the queue before joining: a process exits only once its result has been taken
+        reports = [queue.get(timeout=duration + 300) for _ in processes]
+    finally:
+        for process in processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+
+    failures = [failure for _, _, _, failure in reports if failure]
+    if failures:
+        raise RuntimeError(f"Contention client failed: {failures[0]}")
+    results = {'reader': ([], 0), 'writer': ([], 0)}
+    for kind, latencies, errors, _ in reports:
+        results[kind] = (results[kind][0] + latencies, results[kind][1] + errors)
+    return {kind: latency_summary(latencies, errors, duration) for kind, (latencies, errors) in results.items()}
@@ -0,0 +1,283 @@
+# libraryapp/catalog.py
+import gzip
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .models import Book, Category
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, single-process dev servers only
+    fcntl = None
+
+"""
+Static catalog snapshot for frontend start-up, served by GET /api/books/catalog/.
+
+Instead of paging the whole catalog through DRF, the app downloads one gzipped JSON file:
+    {"version": 7, "generated_at": "...", "categories": [[id, name], ...],
+     "book_fields": ["id", "title", "author", "category", "ISBN"], "books": [[1, "...", ...], ...]}
+Book status is left out on purpose: it changes with every loan, so the app takes live status from
+the list API (or the SSE stream) and the snapshot only changes when the catalog itself does.
+Books whose category is missing from `categories` belong to a category being deleted; skip them.
+
+->Books are split into segments of CATALOG_SEGMENT_SIZE ids. Each segment is stored compressed on its
+  own as a raw deflate piece ending on a byte boundary (Z_FULL_FLUSH), so pieces can be concatenated
+  into one valid gzip stream without recompressing them.
+->A refresh only re-queries and recompresses the segments whose books changed, rebuilds the small
+  header (categories) and writes catalog-<version>.json.gz; the unchanged pieces are copied as they are.
+  (The gzip trailer needs the CRC of all the text, so unchanged pieces are inflated once to compute it:
+  fast next to querying and compressing.)
+->signals.py marks changed books and categories; changes are batched for CATALOG_REFRESH_DELAY_SECONDS
+  and applied from a background thread of that process. `manage.py build_catalog_snapshot` does a full
+  build (needed once, and after bulk loads that skip signals such as seed_library).
+->Files are replaced atomically and the previous version is kept, so downloads in progress finish.
+  Builds from different processes are serialised with a lock file.
+"""
+
+logger = logging.getLogger(__name__)
+
+BOOK_FIELDS = ('id', 'title', 'author', 'category', 'ISBN')
+BOOK_COLUMNS = ('id', 'title', 'author', 'category_id', 'ISBN')
+MANIFEST = 'manifest.json'
+
+
+def dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def snapshot_dir():
+    return settings.CATALOG_SNAPSHOT_DIR
+
+
+def segment_path(index):
+    return os.path.join(snapshot_dir(), 'segments', f'{index}.deflate')
+
+
+def current():
+    """The manifest of the latest snapshot, or None before the first build."""
+    try:
+        with open(os.path.join(snapshot_dir(), MANIFEST)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    manifest['path'] = os.path.join(snapshot_dir(), manifest['file'])
+    return manifest
+
+
+def open_current(manifest):
+    """
+    Opens the snapshot file of `manifest`, for reading in binary mode; returns (manifest, file),
+    or (None, None) when there is no snapshot any more (its directory was cleared).
+    Only the latest two versions are kept, so if two refreshes removed that version since the
+    manifest was read, the manifest is read again once.
+    """
+    try:
+        return manifest, open(manifest['path'], 'rb')
+    except FileNotFoundError:
+        manifest = current()
+        if manifest is None:
+            return None, None
+        try:
+            return manifest, open(manifest['path'], 'rb')
+        except FileNotFoundError:
+            return None, None
+
+
+def inflate(snapshot, chunk_size=64 * 1024):
+    """Streams the JSON text of an open snapshot file, then closes it."""
+    with snapshot, gzip.GzipFile(fileobj=snapshot) as text:
+        while chunk := text.read(chunk_size):
+            yield chunk
+
+
+def write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+
+@contextmanager
+def build_lock():
+    os.makedirs(snapshot_dir(), exist_ok=True)
+    with open(os.path.join(snapshot_dir(), '.lock'), 'w') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def deflate(text, finish=False):
+    compressor = zlib.compressobj(settings.CATALOG_COMPRESSION_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(text.encode()) + compressor.flush(zlib.Z_FINISH if finish else zlib.Z_FULL_FLUSH)
+
+
+def write_segment(index, rows):
+    """Stores the rows of one segment as a deflate piece; an empty segment has no file."""
+    if rows:
+        write_atomic(segment_path(index), deflate(dumps(rows)[1:-1]))  # the rows without the list brackets
+    elif os.path.exists(segment_path(index)):
+        os.remove(segment_path(index))
+
+
+def segment_indexes():
+    directory = os.path.join(snapshot_dir(), 'segments')
+    if not os.path.isdir(directory):
+        return []
+    return sorted(int(name.split('.')[0]) for name in os.listdir(directory) if name.endswith('.deflate'))
+
+
+def assemble(previous_version):
+    """Writes catalog-<version>.json.gz from the stored segments and a fresh header; returns the manifest."""
+    version = previous_version + 1
+    generated_at = timezone.now()
+    categories = list(Category.objects.filter(is_deleted=False).order_by('id').values_list('id', 'name'))
+    header = dumps({
+        'version': version,
+        'generated_at': generated_at.isoformat(),
+        'categories': categories,
+        'book_fields': BOOK_FIELDS,
+    })[:-1] + ',"books":['
+
+    separator = deflate(',')
+    chunks = [deflate(header)]
+    # The gzip trailer holds the CRC and length of the whole uncompressed text
+    crc = zlib.crc32(header.encode())
+    size = len(header.encode())
+    for n, index in enumerate(segment_indexes()):
+        with open(segment_path(index), 'rb') as f:
+            piece = f.read()
+        text = zlib.decompressobj(-zlib.MAX_WBITS).decompress(piece)
+        if n:
+            chunks.append(separator)
+            text = b',' + text
+        crc = zlib.crc32(text, crc)
+        size += len(text)
+        chunks.append(piece)
+    chunks.append(deflate(']}', finish=True))
+    crc = zlib.crc32(b']}', crc)
+    size += 2
+
+    gzip_header = b'\x1f\x8b\x08\x00' + struct.pack('<I', int(generated_at.timestamp())) + b'\x00\xff'
+    body = gzip_header + b''.join(chunks) + struct.pack('<II', crc & 0xffffffff, size & 0xffffffff)
+
+    name = f'catalog-{version}.json.gz'
+    write_atomic(os.path.join(snapshot_dir(), name), body)
+    manifest = {
+        'version': version, 'file': name, 'generated_at': generated_at.isoformat(),
+        'categories': len(categories), 'size': len(body), 'uncompressed_size': size,
+    }
+    write_atomic(os.path.join(snapshot_dir(), MANIFEST), json.dumps(manifest).encode())
+    manifest['path'] = os.path.join(snapshot_dir(), name)
+
+    # Keep the previous version for downloads that are still running
+    for old in os.listdir(snapshot_dir()):
+        if old.startswith('catalog-') and old not in (name, f'catalog-{previous_version}.json.gz'):
+            os.remove(os.path.join(snapshot_dir(), old))
+    return manifest
+
+
+def build_full(chunk_size=20000):
+    """Renders every segment from the database and assembles a new version."""
+    size = settings.CATALOG_SEGMENT_SIZE
+    with build_lock():
+        previous = current()
+        stale = set(segment_indexes())
+        rows = Book.objects.order_by('id').values_list(*BOOK_COLUMNS).iterator(chunk_size=chunk_size)
+        index, segment = None, []
+        for row in rows:
+            if row[0] // size != index:
+                if segment:
+                    write_segment(index, segment)
+                    stale.discard(index)
+                index, segment = row[0] // size, []
+            segment.append(row)
+        if segment:
+            write_segment(index, segment)
+            stale.discard(index)
+        for index in stale:
+            write_segment(index, [])
+        return assemble(previous['version'] if previous else 0)
+
+
+def refresh(book_ids=()):
+    """
+    Re-renders the segments holding `book_ids` and assembles a new version.
+    Does nothing before the first full build.
+    """
+    size = settings.CATALOG_SEGMENT_SIZE
+    with build_lock():
+        previous = current()
+        if previous is None:
+            return None
+        for index in sorted({book_id // size for book_id in book_ids}):
+            write_segment(index, list(
+                Book.objects.filter(id__gte=index * size, id__lt=(index + 1) * size)
+                .order_by('id').values_list(*BOOK_COLUMNS)
+            ))
+        return assemble(previous['version'])
+
+
+class Refresher:
+    """Collects changed book ids in this process and refreshes the snapshot shortly after."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._book_ids = set()
+        self._changed = False
+        self._timer = None
+
+    def mark(self, book_ids=()):
+        if not settings.CATALOG_AUTO_REFRESH:
+            return
+        with self._lock:
+            self._book_ids.update(book_ids)
+            self._changed = True
+            if settings.CATALOG_REFRESH_DELAY_SECONDS <= 0:
+                schedule = False
+            elif self._timer is None:
+                self._timer = threading.Timer(settings.CATALOG_REFRESH_DELAY_SECONDS, self.run_in_thread)
+                self._timer.daemon = True
+                schedule = True
+            else:
+                return
+        if schedule:
+            self._timer.start()
+        else:
+            self.run()
+
+    def run(self):
+        with self._lock:
+            book_ids, self._book_ids = self._book_ids, set()
+            changed, self._changed = self._changed, False
+            self._timer = None
+        if not changed:
+            return
+        started = time.perf_counter()
+        try:
+            manifest = refresh(book_ids)
+        except Exception:
+            logger.exception("Catalog snapshot refresh failed")
+            return
+        if manifest:
+            logger.info("Catalog snapshot v%s: %s changed books in %.2fs",
+                        manifest['version'], len(book_ids), time.perf_counter() - started)
+
+    def run_in_thread(self):
+        try:
+            self.run()
+        finally:
+            connection.close()
+
+
+refresher = Refresher()
@@ -0,0 +1,105 @@
+# libraryapp/coalescing.py
+import threading
+from urllib.parse import urlencode
+
+from django.conf import settings
+from rest_framework.response import Response
+
+"""
+Single-flight coalescing of identical concurrent list requests (CoalescedListMixin).
+
+At opening time many clients send the same GET /api/books/?status=available&category=... at once.
+The first request for a key (the leader) runs the query and serialization; identical requests that
+arrive while it is still running (followers) wait for it and answer with the same serialized data.
+
+->Key: view, host, path, the query string with its parameters sorted, and the caller's role
+  (coalesce_scope()). Authentication, permissions and throttles still run for every request.
+->Only in-flight requests are shared: once the leader finishes, the next request starts a new flight,
+  so nothing is served staler than a normal concurrent read.
+->If the leader fails, or takes longer than COALESCE_WAIT_SECONDS, followers run the view themselves.
+->Flights live in one process: with several workers, each coalesces its own threads' requests.
+"""
+
+
+class Flight:
+    __slots__ = ('done', 'result', 'failed', 'followers')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.failed = False
+        self.followers = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def waiting(self):
+        """Followers currently waiting on a leader (for tests and debugging)."""
+        with self._lock:
+            return sum(flight.followers for flight in self._flights.values())
+
+    def run(self, key, compute, timeout):
+        """
+        Returns (result, shared). The first caller for `key` runs compute(); callers that arrive
+        before it returns get its result with shared=True.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Flight()
+            else:
+                flight.followers += 1
+
+        if leader:
+            try:
+                flight.result = compute()
+            except BaseException:
+                flight.failed = True
+                raise
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                flight.done.set()
+            return flight.result, False
+
+        if flight.done.wait(timeout) and not flight.failed:
+            return flight.result, True
+        return compute(), False
+
+
+flights = SingleFlight()
+
+
+def request_key(view, request, scope):
+    query = urlencode(sorted(request.query_params.lists()), doseq=True)
+    return f'{type(view).__name__}:{scope}:{request.get_host()}{request.path}?{query}'
+
+
+class CoalescedListMixin:
+    """
+    Add to a ViewSet to coalesce its list() requests. Override coalesce_scope() when the list depends
+    on more than the caller's role (e.g. per-user querysets).
+    """
+
+    def coalesce_scope(self, request):
+        return getattr(request.user, 'role', 'anonymous')
+
+    def list(self, request, *args, **kwargs):
+        if not settings.COALESCE_LIST_REQUESTS:
+            return super().list(request, *args, **kwargs)
+        parent = super()
+
+        def compute():
+            response = parent.list(request, *args, **kwargs)
+            return response.data, response.status_code
+
+        key = request_key(self, request, self.coalesce_scope(request))
+        (data, status_code), shared = flights.run(key, compute, settings.COALESCE_WAIT_SECONDS)
+        response = Response(data, status=status_code)
+        if shared:
+            response['X-Coalesced'] = '1'
+        return response
@@ -0,0 +1,73 @@
+# libraryapp/concurrency.py
+from django.db.models import F
+from django.db.models.signals import post_save
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+"""
+Optimistic concurrency for Book and BorrowRecord updates.
+
+->Every row carries a `version` column. Responses expose it as the ETag header ("3").
+->Clients send it back with If-Match. The write is a single conditional
+  UPDATE ... SET version = version + 1 WHERE id = ? AND version = ?
+  so no row lock is held between reading and writing.
+->0 rows updated means someone else changed the row first:
+    with If-Match    -> 412 Precondition Failed (client's copy is stale)
+    without If-Match -> 409 Conflict (row changed while this request was running)
+"""
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'This record was changed by someone else. Reload it and try again.'
+    default_code = 'precondition_failed'
+
+
+class VersionConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'This record was changed by another request. Please retry.'
+    default_code = 'version_conflict'
+
+
+def etag_for(version):
+    return f'"{version}"'
+
+
+def expected_version(request, instance):
+    """
+    Returns (version, from_header).
+    Missing or `*` If-Match falls back to the version that was just read from the database.
+    """
+    header = request.headers.get('If-Match', '').strip()
+    if not header or header == '*':
+        return instance.version, False
+    value = header.removeprefix('W/').strip('"')
+    if not value.isdigit():
+        raise ValidationError({'If-Match': 'Expected an ETag returned by this API, e.g. "3".'})
+    return int(value), True
+
+
+def conditional_update(instance, expected, **fields):
+    """
+    Write `fields` only if the row is still at `expected` version.
+    On success the instance is refreshed and post_save is sent, because QuerySet.update() skips it.
+    """
+    model = type(instance)
+    updated = model._default_manager.filter(pk=instance.pk, version=expected).update(
+        version=F('version') + 1, **fields
+    )
+    if not updated:
+        return False
+    instance.refresh_from_db()
+    post_save.send(
+        sender=model, instance=instance, created=False,
+        update_fields=frozenset([*fields, 'version']), raw=False, using=instance._state.db,
+    )
+    return True
+
+
+def update_or_raise(request, instance, **fields):
+    """conditional_update() for a view: raises 412/409 instead of returning False."""
+    expected, from_header = expected_version(request, instance)
+    if not conditional_update(instance, expected, **fields):
+        raise PreconditionFailed() if from_header else VersionConflict()
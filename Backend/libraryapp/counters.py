@@ -0,0 +1,113 @@
+# libraryapp/counters.py
+from collections import Counter
+
+from django.apps import apps as global_apps
+from django.db import connections, transaction
+from django.db.models import Count, Q
+
+"""
+Row counts kept up to date as books and loans change, so paginated lists (pagination.py) read their
+total from one RowCount row instead of running COUNT(*) over the filtered table.
+
+->Keys (a missing row means 0):
+    books   books:status:<status>   books:category:<id>   books:category:<id>:status:<status>
+    loans   loans:open   loans:unpaid   loans:user:<id>   loans:user:<id>:open   loans:user:<id>:unpaid
+->signals.py applies the difference made by every Book/BorrowRecord save or delete as
+  INSERT ... ON CONFLICT DO UPDATE SET value = value + delta, on the connection and in the transaction
+  of the write itself, so a borrow, return or fine payment commits or rolls back with its counts.
+->Writes that skip model signals (QuerySet.update(), bulk_create(), raw SQL as in seed_library) must
+  call rebuild() afterwards; `manage.py rebuild_counters` does the same from the shell.
+"""
+
+
+def book_key(status=None, category=None):
+    key = 'books'
+    if category is not None:
+        key += f':category:{category}'
+    if status is not None:
+        key += f':status:{status}'
+    return key
+
+
+def loan_key(user=None, kind=None):
+    """`kind` is None (every loan), 'open' or 'unpaid'."""
+    key = 'loans'
+    if user is not None:
+        key += f':user:{user}'
+    if kind is not None:
+        key += f':{kind}'
+    return key
+
+
+def book_keys(state):
+    """Every key a book in `state` (Book.counted_state()) is counted under."""
+    if state is None:
+        return []
+    status, category = state
+    return [book_key(), book_key(status=status), book_key(category=category), book_key(status, category)]
+
+
+def loan_keys(state):
+    """Every key a loan in `state` (BorrowRecord.counted_state()) is counted under."""
+    if state is None:
+        return []
+    user, is_open, unpaid = state
+    kinds = [None] + (['open'] if is_open else []) + (['unpaid'] if unpaid else [])
+    return [loan_key(user=owner, kind=kind) for kind in kinds for owner in (None, user)]
+
+
+def apply(deltas, using='default'):
+    """Adds {key: delta} to the counters, creating missing rows."""
+    rows = [(key, delta) for key, delta in deltas.items() if delta]
+    if not rows:
+        return
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    table = quote(global_apps.get_model('libraryapp', 'RowCount')._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {table} ({quote('name')}, {quote('value')}) VALUES (%s, %s) "
+            f"ON CONFLICT ({quote('name')}) DO UPDATE SET {quote('value')} = {table}.{quote('value')} + excluded.{quote('value')}",
+            rows,
+        )
+
+
+def change(removed, added, using='default'):
+    """Moves one row from the `removed` keys to the `added` ones."""
+    deltas = Counter(added)
+    deltas.subtract(removed)
+    apply(deltas, using)
+
+
+def get(key):
+    RowCount = global_apps.get_model('libraryapp', 'RowCount')
+    return RowCount.objects.filter(name=key).values_list('value', flat=True).first() or 0
+
+
+def rebuild(apps=global_apps, using='default'):
+    """Recomputes every counter from the tables (one GROUP BY per table); returns the number of keys."""
+    Book = apps.get_model('libraryapp', 'Book')
+    BorrowRecord = apps.get_model('libraryapp', 'BorrowRecord')
+    RowCount = apps.get_model('libraryapp', 'RowCount')
+
+    with transaction.atomic(using=using):
+        # Delete first: on SQLite that takes the write lock, so no save can slip in between the counts
+        RowCount.objects.using(using).all().delete()
+        values = Counter()
+        books = Book.objects.using(using).values_list('status', 'category_id').annotate(rows=Count('id')).order_by()
+        for status, category, rows in books:
+            for key in book_keys((status, category)):
+                values[key] += rows
+        loans = BorrowRecord.objects.using(using).values_list('user_id').annotate(
+            rows=Count('id'),
+            open=Count('id', filter=Q(return_date__isnull=True)),
+            unpaid=Count('id', filter=Q(fine_amount__gt=0, fine_paid=False)),
+        ).order_by()
+        for user, rows, open_rows, unpaid_rows in loans:
+            for kind, count in ((None, rows), ('open', open_rows), ('unpaid', unpaid_rows)):
+                values[loan_key(kind=kind)] += count
+                values[loan_key(user=user, kind=kind)] += count
+        RowCount.objects.using(using).bulk_create(
+            [RowCount(name=key, value=value) for key, value in values.items() if value], batch_size=1000
+        )
+    return len(values)
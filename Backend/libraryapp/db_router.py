@@ -0,0 +1,77 @@
+# libraryapp/db_router.py
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+
+"""
+Read/write splitting between the `default` connection and the read-only `replica` connection
+(settings.DATABASES). The replica opens the same SQLite file with a read-only URI (mode=ro), and the
+database runs in WAL mode, so readers on it never take a lock that blocks a borrow/return commit.
+
+->Routing only happens inside a request handled by a ReplicaReadMixin viewset action listed in
+  `replica_actions` and using a safe method (GET/HEAD/OPTIONS). Everything else (other views,
+  management commands, signals outside requests) stays on `default`.
+->The first write in such a request pins it: every later read of that request goes to `default`,
+  so a request always reads its own writes.
+->READ_REPLICA_ENABLED = False sends everything to `default` (the default under `manage.py test`,
+  whose TestCase transactions are invisible to a second connection).
+"""
+
+
+class RoutingState:
+    __slots__ = ('pinned',)
+
+    def __init__(self):
+        self.pinned = False
+
+
+_routing = ContextVar('libraryapp_db_routing', default=None)
+
+
+@contextmanager
+def reads_from_replica():
+    """Send this block's reads to the replica until its first write."""
+    token = _routing.set(RoutingState())
+    try:
+        yield
+    finally:
+        _routing.reset(token)
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if state is None or state.pinned:
+            return 'default'
+        return settings.READ_REPLICA_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            state.pinned = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases are the same data
+        return {obj1._state.db, obj2._state.db} <= {'default', settings.READ_REPLICA_ALIAS}
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaReadMixin:
+    """
+    Add to a ViewSet and list the read-only actions that may use the replica:
+        replica_actions = ('list', 'retrieve')
+    """
+    replica_actions = ()
+
+    def dispatch(self, request, *args, **kwargs):
+        # self.action is only set inside dispatch(); action_map is already known
+        action = getattr(self, 'action_map', {}).get(request.method.lower())
+        if settings.READ_REPLICA_ENABLED and request.method in SAFE_METHODS and action in self.replica_actions:
+            with reads_from_replica():
+                return super().dispatch(request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
@@ -0,0 +1,122 @@
+# libraryapp/deletion.py
+import logging
+import threading
+import time
+from functools import partial
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+from .models import Book, BorrowRecord, BorrowRecordArchive, Category, DeletionJob
+
+"""
+Background deletion of large categories (CategoryViewSet.destroy).
+
+Category -> Book -> BorrowRecord are all on_delete=CASCADE, so a single delete() of a big category
+loads every book and loan and deletes them in one transaction, holding SQLite's write lock throughout.
+Instead:
+->the category is flagged is_deleted right away, which hides it (and its books) from the API;
+->a DeletionJob then deletes loans, books and finally the category in batches of
+  DELETION_BATCH_SIZE rows, one short transaction each, with DELETION_PAUSE_SECONDS between them;
+->progress counters are saved after every batch for GET /api/deletion-jobs/{id}/.
+
+Jobs run in a thread of the process that accepted the request (inline when DELETION_JOBS_SYNC is set,
+e.g. under `manage.py test`). A job cut short by a restart stays pending/running and is finished by
+`manage.py run_deletion_jobs`. Every step is idempotent, so resuming is always safe.
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def start_category_deletion(category, user):
+    """Hides the category and schedules its deletion once this transaction commits."""
+    with transaction.atomic():
+        Category.objects.filter(pk=category.pk).update(is_deleted=True)
+        category.is_deleted = True
+        # QuerySet.update() sends no post_save; receivers (e.g. the catalog snapshot) need to see the change
+        post_save.send(
+            sender=Category, instance=category, created=False,
+            update_fields=frozenset(['is_deleted']), raw=False, using=category._state.db,
+        )
+        job = DeletionJob.objects.create(
+            category_id=category.pk,
+            category_name=category.name,
+            total_books=Book.objects.filter(category_id=category.pk).count(),
+            requested_by=user if user.is_authenticated else None,
+        )
+        transaction.on_commit(partial(launch, job.pk))
+    return job
+
+
+def launch(job_id):
+    if settings.DELETION_JOBS_SYNC:
+        run_job(job_id)
+        return
+    threading.Thread(target=run_in_thread, args=(job_id,), name=f'deletion-job-{job_id}', daemon=True).start()
+
+
+def run_in_thread(job_id):
+    try:
+        run_job(job_id)
+    finally:
+        # The thread got its own database connection; don't leave it open
+        connection.close()
+
+
+def delete_in_batches(queryset, batch_size, pause):
+    """Deletes the rows of `queryset` a batch at a time; returns how many were deleted."""
+    deleted = 0
+    while True:
+        ids = list(queryset.order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        with transaction.atomic():
+            queryset.model.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
+        if pause:
+            time.sleep(pause)
+
+
+def run_job(job_id):
+    job = DeletionJob.objects.get(pk=job_id)
+    if job.status == 'done':
+        return job
+    batch_size = settings.DELETION_BATCH_SIZE
+    pause = settings.DELETION_PAUSE_SECONDS
+    job.status = 'running'
+    job.started_at = job.started_at or timezone.now()
+    job.save(update_fields=['status', 'started_at'])
+
+    try:
+        while True:
+            # A slice of books at a time; their loans go first so deleting the books cascades to nothing big
+            book_ids = list(
+                Book.objects.filter(category_id=job.category_id).order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not book_ids:
+                break
+            for model in (BorrowRecord, BorrowRecordArchive):
+                job.deleted_borrow_records += delete_in_batches(
+                    model.objects.filter(book_id__in=book_ids), batch_size, pause
+                )
+            with transaction.atomic():
+                # Model delete (not a raw one) so Book post_delete receivers still run
+                Book.objects.filter(id__in=book_ids).delete()
+            job.deleted_books += len(book_ids)
+            job.save(update_fields=['deleted_books', 'deleted_borrow_records'])
+            if pause:
+                time.sleep(pause)
+
+        Category.objects.filter(pk=job.category_id).delete()
+        job.status = 'done'
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'finished_at'])
+    except Exception as exc:
+        logger.exception("Deletion job %s failed", job_id)
+        job.status = 'failed'
+        job.error = str(exc)
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'finished_at', 'deleted_books', 'deleted_borrow_records'])
+    return job
@@ -0,0 +1,84 @@
+# libraryapp/events.py
+import asyncio
+import threading
+
+from django.conf import settings
+
+"""
+In-process fan-out of Book.status changes to Server-Sent Events clients (async_views.book_events).
+
+->signals.py publishes an event after every committed status change (borrow, return,
+  reservation or a librarian edit).
+->Each SSE client owns a Subscription: an asyncio.Queue bounded by SSE_QUEUE_SIZE plus its
+  category/book filters. An idle subscriber is just a coroutine parked on queue.get(), so thousands
+  of them cost a few KB each and no CPU.
+->A client that falls behind loses its oldest events (it can re-sync with GET /api/books/)
+  instead of growing memory without bound.
+->publish() is called from sync worker threads; events are handed to each subscriber's event loop
+  with call_soon_threadsafe.
+->The broker lives in one process: with several ASGI workers a client only sees changes made
+  through the worker it is connected to.
+"""
+
+
+class Subscription:
+    __slots__ = ('loop', 'queue', 'category_ids', 'book_ids', 'dropped')
+
+    def __init__(self, loop, max_size, category_ids=None, book_ids=None):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=max_size)
+        self.category_ids = category_ids
+        self.book_ids = book_ids
+        self.dropped = 0
+
+    def matches(self, event):
+        if self.category_ids is not None and event['category_id'] not in self.category_ids:
+            return False
+        if self.book_ids is not None and event['book_id'] not in self.book_ids:
+            return False
+        return True
+
+    def push(self, event):
+        # Runs in the subscriber's event loop thread
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+
+class BookEventBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+        self._next_id = 0
+
+    def subscribe(self, category_ids=None, book_ids=None):
+        subscription = Subscription(
+            asyncio.get_running_loop(), settings.SSE_QUEUE_SIZE, category_ids, book_ids
+        )
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def subscriber_count(self):
+        return len(self._subscriptions)
+
+    def publish(self, event):
+        with self._lock:
+            self._next_id += 1
+            event = {'id': self._next_id, **event}
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            if not subscription.matches(event):
+                continue
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.push, event)
+            except RuntimeError:  # loop already closed, client is gone
+                self.unsubscribe(subscription)
+
+
+broker = BookEventBroker()
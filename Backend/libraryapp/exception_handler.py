@@ -12,7 +12,46 @@ Aman:-
 ->For ValidationError, exception_handler returns a 400 with response.data containing field errors. 
 ->For NotAuthenticated -> 401, PermissionDenied -> 403, etc. For unknown exceptions it returns None.
 ->Use logger.exception(...) or logger.error(..., exc_info=True) to capture tracebacks where backend is disturbed.
+->Logging (log_exception) is cheap on the request path: the record carries the facts as fields and is
+  only formatted by the background file handler (logging_utils.BackgroundRotatingFileHandler).
+  Severity follows the status code: 5xx ERROR with traceback, 401/403/429 WARNING, other 4xx INFO.
+  Client errors are sampled per (status, view, exception) by SampleRepeatsFilter (settings.LOGGING).
 """
+
+
+def level_for(status_code):
+    if status_code >= 500:
+        return logging.ERROR
+    if status_code in (401, 403, 429):
+        return logging.WARNING
+    return logging.INFO
+
+
+def log_exception(exc, context, status_code):
+    level = level_for(status_code)
+    if not logger.isEnabledFor(level):
+        return
+    request = context.get('request')
+    view = context.get('view')
+    view_name = type(view).__name__ if view is not None else None
+    exc_type = type(exc).__name__
+    extra = {
+        'status_code': status_code,
+        'view': view_name,
+        'method': getattr(request, 'method', None),
+        'path': getattr(request, 'path', None),
+        # _user: reading request.user here could re-run a failed authentication
+        'user_id': getattr(getattr(request, '_user', None), 'pk', None),
+        'exc_type': exc_type,
+    }
+    if status_code < 500:
+        extra['sample_key'] = (status_code, view_name, exc_type)
+    logger.log(
+        level, "%s %s -> %s %s: %s", extra['method'], extra['path'], status_code, exc_type, exc,
+        exc_info=(type(exc), exc, exc.__traceback__) if status_code >= 500 else None, extra=extra,
+    )
+
+
 def custom_exception_handler(exc, context): #exc is exception instance
     """
     Custom global exception handler for DRF.
@@ -20,17 +59,18 @@ def custom_exception_handler(exc, context): #exc is exception instance
     # Let DRF handle the exception first
     response = exception_handler(exc, context)
 
-    # Log the exception (useful for debugging)
-    logger.error(f"Exception: {exc} | Context: {context}")
+    log_exception(exc, context, response.status_code if response is not None else status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     # If DRF handled it, modify the response
     if response is not None:
+        # Keep the headers DRF set for the client (Retry-After on 429, WWW-Authenticate on 401)
+        headers = {name: response[name] for name in ('Retry-After', 'WWW-Authenticate') if response.has_header(name)}
         return Response({
             "success": False,
             "status_code": response.status_code,
             "error": str(exc),
             "details": response.data
-        }, status=response.status_code)
+        }, status=response.status_code, headers=headers)
 
     # Handle uncaught exceptions (like KeyError, ValueError, etc.)
     return Response({
@@ -0,0 +1,149 @@
+# libraryapp/idempotency.py
+import hashlib
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+"""
+Idempotency-Key support for POST endpoints that change circulation state
+(borrow, return_book, mark_fine_paid).
+
+->The client sends the same Idempotency-Key header on every retry of one logical action.
+->First request: (user, key) is reserved with a pending row before the view runs (the unique
+  constraint admits one), then the view's response is stored in that row. A 5xx or an exception
+  deletes the row, so the client can retry for real.
+->Retries: the stored response is returned with an Idempotent-Replayed header. The view is not run again,
+  so no book/record rows are touched and no write lock is taken (the lookup is a single indexed SELECT).
+  A retry that arrives while the first request is still running gets 409 with Retry-After, instead
+  of running the view a second time.
+->Reusing a key for a different body/path returns 422 instead of replaying the wrong response.
+->Rows expire after settings.IDEMPOTENCY_KEY_TTL; `manage.py purge_idempotency_keys` deletes them.
+  A pending row whose request never finished is released after IDEMPOTENCY_PENDING_TIMEOUT
+  (a request still running by then no longer holds the key, and its response is not stored).
+"""
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+PENDING_RETRY_AFTER = 1  # seconds, for the 409 sent while the first request is running
+
+
+def _request_hash(request):
+    payload = json.dumps(request.data, sort_keys=True, default=str)
+    raw = f"{request.method}:{request.path}:{payload}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _existing_response(stored, request_hash):
+    """
+    The response for a request whose key is already taken by `stored` (None: taken, but released
+    again before we could read it).
+    """
+    if stored is not None and stored.request_hash != request_hash:
+        return Response(
+            {'error': 'Idempotency-Key was already used for a different request.'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    if stored is None or stored.status_code is None:
+        response = Response(
+            {'error': 'A request with this Idempotency-Key is still being processed.'},
+            status=status.HTTP_409_CONFLICT,
+        )
+        response['Retry-After'] = str(PENDING_RETRY_AFTER)
+        return response
+    response = Response(stored.response_body, status=stored.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _live(user, key):
+    return IdempotencyKey.objects.filter(user=user, key=key, expires_at__gt=timezone.now()).first()
+
+
+def _reserve(request, key, request_hash):
+    """
+    Takes (user, key) for this request with a pending row. Returns the row's expires_at, which
+    identifies this reservation, or None when another request holds the key.
+    """
+    now = timezone.now()
+    reserved_until = now + settings.IDEMPOTENCY_PENDING_TIMEOUT
+    quote = connection.ops.quote_name
+    table = quote(IdempotencyKey._meta.db_table)
+    columns = ('user_id', 'key', 'request_hash', 'status_code', 'response_body', 'created_at', 'expires_at')
+    taken_over = ('request_hash', 'status_code', 'response_body', 'created_at', 'expires_at')
+    db = connection.ops
+    with connection.cursor() as cursor:
+        # One statement: insert, or take over an expired row (stored or abandoned pending).
+        # rowcount is 0 when a live row holds the key.
+        cursor.execute(
+            f"INSERT INTO {table} ({', '.join(quote(column) for column in columns)}) "
+            f"VALUES (%s, %s, %s, NULL, NULL, %s, %s) "
+            f"ON CONFLICT ({quote('user_id')}, {quote('key')}) DO UPDATE SET "
+            + ', '.join(f"{quote(column)} = excluded.{quote(column)}" for column in taken_over)
+            + f" WHERE {table}.{quote('expires_at')} <= %s",
+            [request.user.pk, key, request_hash, db.adapt_datetimefield_value(now),
+             db.adapt_datetimefield_value(reserved_until), db.adapt_datetimefield_value(now)],
+        )
+        return reserved_until if cursor.rowcount else None
+
+
+def _reservation(request, key, reserved_until):
+    return IdempotencyKey.objects.filter(
+        user=request.user, key=key, status_code__isnull=True, expires_at=reserved_until,
+    )
+
+
+def _complete(request, key, reserved_until, response):
+    _reservation(request, key, reserved_until).update(
+        status_code=response.status_code,
+        response_body=response.data,
+        expires_at=timezone.now() + settings.IDEMPOTENCY_KEY_TTL,
+    )
+
+
+def _release(request, key, reserved_until):
+    _reservation(request, key, reserved_until).delete()
+
+
+def idempotent(view_method):
+    """
+    Decorator for ViewSet methods / @action handlers.
+    Requests without the header are passed straight through.
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            raise ValidationError({IDEMPOTENCY_HEADER: f'Must be at most {MAX_KEY_LENGTH} characters.'})
+
+        request_hash = _request_hash(request)
+        stored = _live(request.user, key)
+        if stored is not None:
+            return _existing_response(stored, request_hash)
+        reserved_until = _reserve(request, key, request_hash)
+        if reserved_until is None:
+            # A concurrent request with this key got there first
+            return _existing_response(_live(request.user, key), request_hash)
+
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except BaseException:
+            _release(request, key, reserved_until)
+            raise
+        # Server errors are not stored so the client can retry them for real
+        if response.status_code >= 500:
+            _release(request, key, reserved_until)
+        else:
+            _complete(request, key, reserved_until, response)
+        return response
+
+    return wrapper
@@ -0,0 +1,87 @@
+# libraryapp/instrumentation.py
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+"""
+Per-request performance counters shared by PerformanceMiddleware (middleware.py) and the serializers.
+
+->RequestMetrics lives in a ContextVar for the duration of one request, so it is safe under
+  threads (WSGI) and coroutines (ASGI) alike.
+->query_recorder is installed on every new DB connection (apps.py) and counts SQL queries + DB time
+  while a request is being measured; outside a request it is a no-op. The throttles' own queries
+  are counted too, but not charged to the view's query budget.
+->TimedSerializerMixin measures time spent turning model instances into JSON-ready dicts.
+  Nested serializers (BookSerializer inside BorrowRecordSerializer) are not counted twice.
+"""
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised instead of only logging when settings.QUERY_BUDGET_STRICT is on (tests)."""
+
+
+class RequestMetrics:
+    def __init__(self, request=None):
+        self.request = request
+        self.queries = 0
+        self.throttle_queries = 0  # counter upserts of throttles.py, left out of the query budget
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self._serializer_depth = 0
+
+
+_current_metrics = ContextVar('request_metrics', default=None)
+
+
+def current_metrics():
+    return _current_metrics.get()
+
+
+@contextmanager
+def collect_metrics(request=None):
+    metrics = RequestMetrics(request)
+    token = _current_metrics.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current_metrics.reset(token)
+
+
+def query_recorder(execute, sql, params, many, context):
+    metrics = _current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - start
+        metrics.queries += 1
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """connection_created receiver."""
+    if query_recorder not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, query_recorder)
+
+
+@contextmanager
+def serializer_timer():
+    metrics = _current_metrics.get()
+    if metrics is None:
+        yield
+        return
+    metrics._serializer_depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics._serializer_depth -= 1
+        if metrics._serializer_depth == 0:
+            metrics.serializer_time += time.perf_counter() - start
+
+
+class TimedSerializerMixin:
+    def to_representation(self, instance):
+        with serializer_timer():
+            return super().to_representation(instance)
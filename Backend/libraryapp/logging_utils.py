@@ -0,0 +1,101 @@
+# libraryapp/logging_utils.py
+import copy
+import logging
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+"""
+Logging handlers that keep file I/O off the request path, and a filter that keeps repeated
+records from flooding them.
+"""
+
+
+class BackgroundRotatingFileHandler(QueueHandler):
+    """
+    Drop-in for RotatingFileHandler in settings.LOGGING.
+
+    ->emit() only puts the record on an in-memory queue; a listener thread formats it and
+      writes/rotates the file. A slow disk never shows up in request latency.
+    ->The listener starts on the first record in each process, so it also works after a
+      pre-fork server (gunicorn --preload) forks its workers.
+    """
+
+    def __init__(self, filename, maxBytes=0, backupCount=0, encoding='utf-8'):
+        super().__init__(queue.SimpleQueue())
+        self.target = RotatingFileHandler(
+            filename, maxBytes=maxBytes, backupCount=backupCount, encoding=encoding, delay=True
+        )
+        self._listener = None
+        self._listener_pid = None
+        self._start_lock = threading.Lock()
+
+    def setFormatter(self, fmt):
+        super().setFormatter(fmt)
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # QueueHandler.prepare() formats the message in the caller's thread.
+        # The listener is in the same process, so hand over the record as-is and format it there.
+        return copy.copy(record)
+
+    def emit(self, record):
+        if self._listener_pid != os.getpid():
+            self._start_listener()
+        super().emit(record)
+
+    def _start_listener(self):
+        with self._start_lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener = QueueListener(self.queue, self.target)
+            self._listener.start()
+            self._listener_pid = os.getpid()
+
+    def close(self):
+        # Called by logging.shutdown() at exit: drain the queue before closing the file
+        with self._start_lock:
+            if self._listener is not None and self._listener_pid == os.getpid():
+                self._listener.stop()
+            self._listener = None
+            self._listener_pid = None
+        self.target.close()
+        super().close()
+
+
+class SampleRepeatsFilter(logging.Filter):
+    """
+    Rate-limits repeated records: at most `burst` records per `sample_key` every `window` seconds.
+    The key is set by the caller with extra={'sample_key': ...}; records without one always pass.
+    The first record let through after a suppressed stretch says how many similar ones were dropped.
+    """
+
+    def __init__(self, burst=10, window=60):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._lock = threading.Lock()
+        self._windows = {}  # sample_key -> [window start, records passed, records suppressed]
+
+    def filter(self, record):
+        key = getattr(record, 'sample_key', None)
+        if key is None:
+            return True
+        now = time.monotonic()
+        suppressed = 0
+        with self._lock:
+            state = self._windows.get(key)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state else 0
+                state = self._windows[key] = [now, 0, 0]
+            if state[1] >= self.burst:
+                state[2] += 1
+                return False
+            state[1] += 1
+        if suppressed and isinstance(record.args, tuple):
+            record.msg = f'{record.msg} (%d similar suppressed)'
+            record.args = (*record.args, suppressed)
+        record.suppressed = suppressed
+        return True
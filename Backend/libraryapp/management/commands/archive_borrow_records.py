@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from libraryapp.archive import archivable, archive_borrow_records
+
+
+class Command(BaseCommand):
+    help = (
+        "Move returned borrow records with no outstanding fine into BorrowRecordArchive, "
+        "in small transactions (run periodically, e.g. nightly from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=settings.BORROW_RECORD_ARCHIVE_AFTER_DAYS,
+                            help="Only archive loans returned more than this many days ago")
+        parser.add_argument('--batch-size', type=int, default=500, help="Records moved per transaction")
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help="Seconds to sleep between batches, to leave room for other writers")
+        parser.add_argument('--limit', type=int, help="Stop after this many records")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the records that would be moved")
+
+    def handle(self, *args, **options):
+        if options['older_than_days'] < 0 or options['batch_size'] < 1:
+            raise CommandError("--older-than-days must be >= 0 and --batch-size >= 1")
+        if options['dry_run']:
+            count = archivable(options['older_than_days']).count()
+            self.stdout.write(f"{count} borrow records would be archived")
+            return
+
+        moved = archive_borrow_records(
+            options['older_than_days'], batch_size=options['batch_size'], pause=options['pause'],
+            limit=options['limit'], progress=lambda total: self.stdout.write(f"  archived: {total}"),
+        )
+        self.stdout.write(self.style.SUCCESS(f"Archived {moved} borrow records"))
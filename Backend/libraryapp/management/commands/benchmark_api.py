@@ -0,0 +1,121 @@
+import json
+import logging
+import os
+import platform
+import subprocess
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from libraryapp.benchmarks import SCENARIOS, BenchmarkContext, compare, run_scenario
+from libraryapp.models import Book, BorrowRecord, User
+
+DEFAULT_BASELINE = os.path.join(settings.BASE_DIR, 'benchmarks', 'baseline.json')
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the catalog and circulation APIs in-process against the configured database. "
+        "Writes p50/p95/p99 latency, throughput and queries per operation as JSON and compares "
+        "them with a baseline file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                            help="Run only this scenario (repeatable)")
+        parser.add_argument('--output', help="Results file (default: benchmarks/results-<timestamp>.json)")
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Results file to compare against")
+        parser.add_argument('--save-baseline', action='store_true', help="Also write the results to --baseline")
+        parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed p95 growth before a regression (0.2 = 20%%)")
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError("--iterations must be at least 1")
+        names = options['scenario'] or list(SCENARIOS)
+
+        # Lets the test client reach the app (ALLOWED_HOSTS) and keeps check_due_books from sending real mail
+        try:
+            setup_test_environment()
+            own_test_environment = True
+        except RuntimeError:  # already inside `manage.py test`
+            own_test_environment = False
+        # One log line per request would be measured too
+        performance_logger = logging.getLogger('libraryapp.performance')
+        previous_level = performance_logger.level
+        performance_logger.setLevel(logging.WARNING)
+
+        # One client issues hundreds of logins and searches: throttling would turn them into 429s
+        throttling = override_settings(THROTTLE_ENABLED=False)
+        throttling.enable()
+
+        try:
+            ctx = BenchmarkContext()
+            results = {}
+            try:
+                for name in names:
+                    self.stdout.write(f"{name}...")
+                    results[name] = run_scenario(ctx, SCENARIOS[name], options['iterations'], options['warmup'])
+                    self.stdout.write(self.format_result(name, results[name]))
+            finally:
+                ctx.cleanup()
+        finally:
+            throttling.disable()
+            performance_logger.setLevel(previous_level)
+            if own_test_environment:
+                teardown_test_environment()
+
+        report = {'meta': self.meta(options), 'results': results}
+        baseline_path = options['baseline']
+        if baseline_path and os.path.exists(baseline_path) and not options['save_baseline']:
+            with open(baseline_path) as f:
+                report['comparison'] = compare(results, json.load(f), options['tolerance'])
+
+        output = options['output'] or os.path.join(
+            settings.BASE_DIR, 'benchmarks', f"results-{timezone.now():%Y%m%d-%H%M%S}.json"
+        )
+        self.write_json(output, report)
+        if options['save_baseline']:
+            self.write_json(baseline_path, report)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {output}"))
+
+        regressions = [name for name, row in report.get('comparison', {}).items() if row['regressed']]
+        for name in regressions:
+            row = report['comparison'][name]
+            self.stdout.write(self.style.WARNING(
+                f"REGRESSION {name}: p95 {row['p95_change']:+.0%} vs baseline, "
+                f"queries/op {results[name]['queries_per_op']} (was {row['baseline_queries_per_op']})"
+            ))
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f"{len(regressions)} scenario(s) regressed: {', '.join(regressions)}")
+
+    def format_result(self, name, result):
+        return (
+            f"  p50 {result['p50_ms']:.1f}ms  p95 {result['p95_ms']:.1f}ms  p99 {result['p99_ms']:.1f}ms  "
+            f"{result['throughput_ops']:.1f} ops/s  {result['queries_per_op']} queries/op"
+        )
+
+    def meta(self, options):
+        try:
+            commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                    text=True, cwd=settings.BASE_DIR).stdout.strip() or None
+        except OSError:
+            commit = None
+        return {
+            'timestamp': timezone.now().isoformat(),
+            'commit': commit,
+            'python': platform.python_version(),
+            'iterations': options['iterations'],
+            'books': Book.objects.count(),
+            'users': User.objects.count(),
+            'borrow_records': BorrowRecord.objects.count(),
+        }
+
+    def write_json(self, path, data):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2)
@@ -0,0 +1,80 @@
+import json
+import logging
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from libraryapp.benchmarks import BenchmarkContext, run_contention
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure reader/writer contention on the configured database: book reads against borrow/return "
+        "writes from separate processes, once with every query on `default` and once with reads routed to the "
+        "read-only replica connection. Seed the database first (manage.py seed_library)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4, help="Reader processes")
+        parser.add_argument('--writers', type=int, default=2, help="Writer processes")
+        parser.add_argument('--duration', type=float, default=10.0, help="Seconds per run")
+        parser.add_argument('--output', help="Results file (default: benchmarks/contention-<timestamp>.json)")
+
+    def handle(self, *args, **options):
+        try:
+            setup_test_environment()
+            own_test_environment = True
+        except RuntimeError:  # already inside `manage.py test`
+            own_test_environment = False
+        performance_logger = logging.getLogger('libraryapp.performance')
+        previous_level = performance_logger.level
+        performance_logger.setLevel(logging.WARNING)
+        throttling = override_settings(THROTTLE_ENABLED=False)
+        throttling.enable()
+
+        try:
+            ctx = BenchmarkContext()
+            results = {}
+            try:
+                for mode, use_replica in (('default_only', False), ('replica_reads', True)):
+                    self.stdout.write(f"{mode}...")
+                    results[mode] = run_contention(
+                        ctx, options['readers'], options['writers'], options['duration'], use_replica
+                    )
+                    for kind, row in results[mode].items():
+                        self.stdout.write(
+                            f"  {kind:<7} p50 {row['p50_ms']:.1f}ms  p95 {row['p95_ms']:.1f}ms  "
+                            f"p99 {row['p99_ms']:.1f}ms  {row['throughput_ops']:.1f} ops/s  {row['errors']} errors"
+                        )
+            finally:
+                ctx.cleanup()
+        finally:
+            throttling.disable()
+            performance_logger.setLevel(previous_level)
+            if own_test_environment:
+                teardown_test_environment()
+
+        journal_mode = None
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                journal_mode = cursor.fetchone()[0]
+        report = {
+            'meta': {
+                'timestamp': timezone.now().isoformat(),
+                'readers': options['readers'], 'writers': options['writers'], 'duration': options['duration'],
+                'journal_mode': journal_mode,
+            },
+            'results': results,
+        }
+        output = options['output'] or os.path.join(
+            settings.BASE_DIR, 'benchmarks', f"contention-{timezone.now():%Y%m%d-%H%M%S}.json"
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {output}"))
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the book co-borrowing matrix and store the top-N neighbours per book. "
+        "Incremental by default: only loans added since the last run are read (run it from cron). "
+        "Requires numpy and scipy."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Rebuild from all borrow records")
+        parser.add_argument('--top-n', type=int, help="Neighbours kept per book (default: RECOMMENDATIONS_TOP_N)")
+        parser.add_argument('--min-support', type=int,
+                            help="Members that must have borrowed both books (default: RECOMMENDATIONS_MIN_SUPPORT)")
+        parser.add_argument('--state', help="Matrix state file (default: RECOMMENDATIONS_STATE_PATH)")
+        parser.add_argument('--chunk-size', type=int, default=50000)
+
+    def handle(self, *args, **options):
+        try:
+            from libraryapp import recommendations
+        except ImportError as exc:
+            raise CommandError(f"build_recommendations needs numpy and scipy ({exc})")
+
+        started = time.perf_counter()
+        summary = recommendations.refresh(
+            full=options['full'], top_n=options['top_n'], min_support=options['min_support'],
+            path=options['state'], chunk_size=options['chunk_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Read {summary['loans']} new loans, refreshed {summary['books_refreshed']} books "
+            f"({summary['neighbours']} neighbours) up to borrow record {summary['last_record_id']} "
+            f"in {time.perf_counter() - started:.1f}s"
+        ))
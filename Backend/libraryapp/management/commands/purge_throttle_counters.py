@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from libraryapp.models import ThrottleCounter
+
+
+class Command(BaseCommand):
+    help = "Delete the throttle counters of clients idle for more than a window (run periodically, e.g. from cron)."
+
+    def handle(self, *args, **options):
+        deleted, _ = ThrottleCounter.objects.filter(expires_at__lte=timezone.now()).delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired throttle counters"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from libraryapp.counters import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the row counters used by paginated lists (libraryapp/counters.py) from the tables. "
+        "Run after bulk loads or manual SQL that bypassed the model signals."
+    )
+
+    def handle(self, *args, **options):
+        keys = rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {keys} counters"))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from libraryapp.deletion import run_job
+from libraryapp.models import DeletionJob
+
+
+class Command(BaseCommand):
+    help = (
+        "Finish category deletion jobs that were interrupted (e.g. by a server restart). "
+        "Safe to run at any time; run it after deploys or from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry-failed', action='store_true', help="Also rerun jobs that failed")
+
+    def handle(self, *args, **options):
+        statuses = ['pending', 'running'] + (['failed'] if options['retry_failed'] else [])
+        job_ids = list(DeletionJob.objects.filter(status__in=statuses).order_by('id').values_list('id', flat=True))
+        for job_id in job_ids:
+            job = run_job(job_id)
+            self.stdout.write(
+                f"Job {job.id} ({job.category_name}): {job.status}, "
+                f"{job.deleted_books} books and {job.deleted_borrow_records} borrow records deleted"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Processed {len(job_ids)} deletion jobs"))
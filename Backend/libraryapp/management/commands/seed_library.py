@@ -0,0 +1,241 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from libraryapp import catalog
+from libraryapp.counters import rebuild as rebuild_counters
+from libraryapp.models import Book, BorrowRecord, Category, User
+
+GENRES = [
+    'Science', 'History', 'Fiction', 'Mathematics', 'Philosophy', 'Biography', 'Poetry', 'Travel',
+    'Computer Science', 'Economics', 'Art', 'Music', 'Medicine', 'Law', 'Engineering', 'Children',
+]
+TITLE_WORDS = [
+    'Introduction', 'Principles', 'Advanced', 'History', 'Theory', 'Modern', 'Practical', 'Guide',
+    'Foundations', 'Essays', 'Journey', 'Secrets', 'World', 'Night', 'River', 'Garden', 'Stars',
+    'Silent', 'Lost', 'Hidden', 'Physics', 'Chemistry', 'Algorithms', 'Economy', 'Empire', 'Ocean',
+]
+FIRST_NAMES = ['Anita', 'Rahul', 'Maria', 'John', 'Wei', 'Fatima', 'Carlos', 'Priya', 'Yuki', 'Olga', 'Amir', 'Grace']
+LAST_NAMES = ['Sharma', 'Smith', 'Garcia', 'Chen', 'Khan', 'Ivanova', 'Okafor', 'Tanaka', 'Müller', 'Rossi', 'Das']
+
+LOAN_DAYS = 14
+BORROW_COLUMNS = ('user_id', 'book_id', 'borrow_date', 'due_date', 'return_date', 'fine_amount', 'fine_paid', 'version')
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+@contextmanager
+def sqlite_bulk_load():
+    """
+    Trade durability for speed while loading: no fsync per commit, journal kept in memory,
+    bigger page cache. The previous settings are restored afterwards.
+    Only safe for throwaway/benchmark databases - a crash mid-load can corrupt the file.
+    """
+    # PRAGMAs cannot change inside a transaction (e.g. when called from a test)
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        yield
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode')
+        journal_mode = cursor.fetchone()[0]
+        cursor.execute('PRAGMA synchronous')
+        synchronous = cursor.fetchone()[0]
+        cursor.execute('PRAGMA journal_mode=MEMORY')
+        cursor.execute('PRAGMA synchronous=OFF')
+        cursor.execute('PRAGMA cache_size=-262144')  # 256 MB
+        cursor.execute('PRAGMA temp_store=MEMORY')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA journal_mode={journal_mode}')
+            cursor.execute(f'PRAGMA synchronous={synchronous}')
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate synthetic categories, books, users and borrow records for load testing. "
+        "Example (production scale): manage.py seed_library --books 1000000 --users 100000 "
+        "--borrow-records 10000000"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=50)
+        parser.add_argument('--books', type=int, default=10000)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--borrow-records', type=int, default=50000)
+        parser.add_argument('--open-fraction', type=float, default=0.05,
+                            help="Share of borrow records that are not returned yet (capped at one per book)")
+        parser.add_argument('--overdue-fraction', type=float, default=0.4,
+                            help="Share of open loans that are past their due date")
+        parser.add_argument('--unpaid-fraction', type=float, default=0.2,
+                            help="Share of late returns whose fine is still unpaid")
+        parser.add_argument('--history-days', type=int, default=730)
+        parser.add_argument('--batch-size', type=int, default=20000, help="Rows per transaction")
+        parser.add_argument('--password', default='password123', help="Password of every generated user")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if options['categories'] < 1 or options['books'] < 1 or options['users'] < 1:
+            raise CommandError("--categories, --books and --users must be at least 1")
+        if options['history_days'] <= LOAN_DAYS:
+            raise CommandError(f"--history-days must be more than {LOAN_DAYS}")
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        # Borrow records skip the ORM: SQLite stores datetimes as naive UTC text, so generate that directly
+        if connection.vendor == 'sqlite':
+            self.now = self.now.replace(tzinfo=None)
+            self.db_datetime = str
+        else:
+            self.db_datetime = lambda value: value
+        started = time.perf_counter()
+
+        with sqlite_bulk_load():
+            category_ids = self.create_categories(options['categories'])
+            book_ids = self.create_books(options['books'], category_ids)
+            user_ids = self.create_users(options['users'], options['password'])
+            self.create_borrow_records(options, user_ids, book_ids)
+            # Everything above bypassed the model signals that keep the counters current
+            self.stdout.write(f"  counters: {rebuild_counters()}")
+            if catalog.current() is not None:
+                self.stdout.write(f"  catalog snapshot: v{catalog.build_full()['version']}")
+
+        self.stdout.write(self.style.SUCCESS(f"Done in {time.perf_counter() - started:.1f}s"))
+
+    # ---------------------------------------------------------------------
+    # Helpers
+    # ---------------------------------------------------------------------
+    def insert(self, model, objects, label):
+        total = 0
+        for batch in batched(objects, self.batch_size):
+            with transaction.atomic():
+                model.objects.bulk_create(batch)
+            total += len(batch)
+            self.stdout.write(f"  {label}: {total}")
+        return total
+
+    def raw_insert(self, model, columns, rows, label):
+        """
+        executemany() of plain tuples. Used for borrow records, where building and
+        preparing 10M model instances would dominate the load time.
+        """
+        table = connection.ops.quote_name(model._meta.db_table)
+        column_sql = ', '.join(connection.ops.quote_name(column) for column in columns)
+        sql = f"INSERT INTO {table} ({column_sql}) VALUES ({', '.join(['%s'] * len(columns))})"
+        total = 0
+        for batch in batched(rows, self.batch_size):
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(sql, batch)
+            total += len(batch)
+            self.stdout.write(f"  {label}: {total}")
+        return total
+
+    def new_ids(self, model, after):
+        return list(model.objects.filter(id__gt=after).values_list('id', flat=True))
+
+    @staticmethod
+    def last_id(model):
+        return model.objects.aggregate(last=Max('id'))['last'] or 0
+
+    # ---------------------------------------------------------------------
+    # Generators
+    # ---------------------------------------------------------------------
+    def create_categories(self, count):
+        after = self.last_id(Category)
+        names = (
+            GENRES[i % len(GENRES)] + (f" {i // len(GENRES) + 1}" if i >= len(GENRES) else '')
+            for i in range(count)
+        )
+        self.insert(Category, (Category(name=name) for name in names), 'categories')
+        return self.new_ids(Category, after)
+
+    def create_books(self, count, category_ids):
+        after = self.last_id(Book)
+        rng = self.rng
+        # Skewed category sizes: a few big categories, a long tail of small ones
+        weights = [1 / (rank + 1) for rank in range(len(category_ids))]
+        categories = rng.choices(category_ids, weights=weights, k=count)
+
+        def books():
+            for i in range(count):
+                yield Book(
+                    title=' '.join(rng.sample(TITLE_WORDS, rng.randint(2, 4))),
+                    author=f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                    category_id=categories[i],
+                    ISBN=f"979{after + i + 1:010d}",
+                    status='available',
+                )
+
+        self.insert(Book, books(), 'books')
+        return self.new_ids(Book, after)
+
+    def create_users(self, count, password):
+        after = self.last_id(User)
+        # One PBKDF2 hash shared by all generated users; hashing each one would take hours
+        password_hash = make_password(password)
+        users = (
+            User(
+                username=f"seed_user_{after + i + 1}",
+                email=f"seed_user_{after + i + 1}@example.com",
+                password=password_hash,
+                role='librarian' if i % 500 == 0 else 'member',
+            )
+            for i in range(count)
+        )
+        self.insert(User, users, 'users')
+        return self.new_ids(User, after)
+
+    def create_borrow_records(self, options, user_ids, book_ids):
+        total = options['borrow_records']
+        open_count = min(int(total * options['open_fraction']), len(book_ids))
+        self.raw_insert(BorrowRecord, BORROW_COLUMNS, self.returned_loans(total - open_count, options, user_ids, book_ids),
+                        'returned borrow records')
+        open_books = self.rng.sample(book_ids, open_count)
+        self.raw_insert(BorrowRecord, BORROW_COLUMNS, self.open_loans(open_books, options, user_ids), 'open borrow records')
+
+        # Open loans hold their book
+        for batch in batched(open_books, 500):
+            with transaction.atomic():
+                Book.objects.filter(id__in=batch).update(status='borrowed')
+
+    def returned_loans(self, count, options, user_ids, book_ids):
+        rng = self.rng
+        history = options['history_days'] * 86400
+        for _ in range(count):
+            borrow_date = self.now - timedelta(seconds=rng.randrange(LOAN_DAYS * 86400, history))
+            due_date = borrow_date + timedelta(days=LOAN_DAYS)
+            # Most loans come back on time, about a quarter come back up to a month late
+            return_date = borrow_date + timedelta(days=rng.randint(1, LOAN_DAYS + (30 if rng.random() < 0.25 else 0)))
+            return_date = min(return_date, self.now)
+            # Same rule as BorrowRecord.calculate_fine()
+            fine = max((return_date.date() - due_date.date()).days + 1, 0) * 10
+            fine_paid = fine == 0 or rng.random() >= options['unpaid_fraction']
+            yield (
+                rng.choice(user_ids), rng.choice(book_ids), self.db_datetime(borrow_date),
+                self.db_datetime(due_date), self.db_datetime(return_date), fine, fine_paid, 0,
+            )
+
+    def open_loans(self, book_ids, options, user_ids):
+        rng = self.rng
+        for book_id in book_ids:
+            if rng.random() < options['overdue_fraction']:
+                due_date = self.now - timedelta(days=rng.randint(1, 60))
+            else:
+                due_date = self.now + timedelta(days=rng.randint(0, LOAN_DAYS))
+            yield (
+                rng.choice(user_ids), book_id, self.db_datetime(due_date - timedelta(days=LOAN_DAYS)),
+                self.db_datetime(due_date), None, 0, False, 0,
+            )
@@ -0,0 +1,227 @@
+# libraryapp/metrics.py
+import glob
+import json
+import os
+import re
+import secrets
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: dead workers' files are not retired
+    fcntl = None
+
+"""
+Request metrics in Prometheus text format, served at /metrics.
+
+->PerformanceMiddleware calls registry.observe_request() once per request with the DRF route name
+  (e.g. 'borrowrecord-return-book'), status code, latency and SQL query count.
+->Each process keeps its own counters in memory. With several workers (gunicorn/uvicorn) set
+  METRICS_DIR to a directory shared by all of them (on one host): every process writes its counters
+  to worker-<pid>-<nonce>.json there (at most every METRICS_FLUSH_INTERVAL seconds, atomic rename),
+  and /metrics adds up all the files. No external service is needed. The nonce is new for every
+  process, so a later process that gets the same pid never overwrites an earlier one's totals.
+->When a worker's pid is no longer alive, the next scrape adds its counters to retired.json and
+  removes its file, so dead workers' requests stay counted (totals never go down) without the
+  directory growing with every restart.
+->Clear METRICS_DIR at deploy time, before the workers start: totals then restart from zero, which
+  Prometheus handles as an ordinary counter reset.
+"""
+
+# Upper bounds (seconds) of the latency histogram buckets; +Inf is implicit
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _empty_series():
+    return {
+        'buckets': [0] * (len(LATENCY_BUCKETS) + 1),
+        'count': 0,
+        'sum': 0.0,
+        'queries': 0,
+        'statuses': {},
+    }
+
+
+def _merge_series(target, source):
+    target['buckets'] = [a + b for a, b in zip(target['buckets'], source['buckets'])]
+    target['count'] += source['count']
+    target['sum'] += source['sum']
+    target['queries'] += source['queries']
+    for code, count in source['statuses'].items():
+        target['statuses'][code] = target['statuses'].get(code, 0) + count
+
+
+WORKER_FILE = re.compile(r'worker-(\d+)(?:-[0-9a-f]+)?\.json$')
+RETIRED = 'retired.json'
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # alive, owned by another user
+        return True
+    return True
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None  # missing, or being replaced right now; picked up next scrape
+
+
+def _write_atomic(directory, name, data):
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.worker-', suffix='.tmp')
+    with os.fdopen(fd, 'w') as tmp:
+        json.dump(data, tmp)
+    os.replace(tmp_path, os.path.join(directory, name))
+
+
+@contextmanager
+def _directory_lock(directory):
+    with open(os.path.join(directory, '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}  # "route method" -> series dict
+        self._last_flush = 0.0
+        self._pid = None
+        self._nonce = None
+
+    def file_name(self):
+        """This process's file in METRICS_DIR; a forked child gets a name of its own."""
+        if self._pid != os.getpid():
+            self._pid, self._nonce = os.getpid(), secrets.token_hex(4)
+        return f'worker-{self._pid}-{self._nonce}.json'
+
+    def observe_request(self, route, method, status_code, duration, queries):
+        bucket = len(LATENCY_BUCKETS)
+        for index, upper in enumerate(LATENCY_BUCKETS):
+            if duration <= upper:
+                bucket = index
+                break
+        key = f"{route} {method}"
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _empty_series()
+            series['buckets'][bucket] += 1
+            series['count'] += 1
+            series['sum'] += duration
+            series['queries'] += queries
+            code = str(status_code)
+            series['statuses'][code] = series['statuses'].get(code, 0) + 1
+        self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            return json.loads(json.dumps(self._series))
+
+    def flush(self, force=False):
+        """Write this process's counters to METRICS_DIR (no-op when it is not configured)."""
+        directory = settings.METRICS_DIR
+        if not directory:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < settings.METRICS_FLUSH_INTERVAL:
+            return
+        self._last_flush = now
+        os.makedirs(directory, exist_ok=True)
+        _write_atomic(directory, self.file_name(), self.snapshot())
+
+    def retire_dead_workers(self, directory):
+        """Moves the counters of workers that have exited into retired.json."""
+        if fcntl is None:
+            return
+        with _directory_lock(directory):
+            retired = _read(os.path.join(directory, RETIRED)) or {}
+            dead = []
+            for path in glob.glob(os.path.join(directory, 'worker-*.json')):
+                match = WORKER_FILE.search(path)
+                if match is None or int(match.group(1)) == os.getpid() or _pid_alive(int(match.group(1))):
+                    continue
+                worker = _read(path)
+                if worker is not None:
+                    for key, series in worker.items():
+                        _merge_series(retired.setdefault(key, _empty_series()), series)
+                dead.append(path)
+            if dead:
+                # retired.json first: a crash in between counts a worker twice rather than not at all
+                _write_atomic(directory, RETIRED, retired)
+                for path in dead:
+                    os.remove(path)
+
+    def collect(self):
+        """Counters of all workers added together (only this process when METRICS_DIR is unset)."""
+        directory = settings.METRICS_DIR
+        if not directory:
+            return self.snapshot()
+        self.flush(force=True)
+        self.retire_dead_workers(directory)
+        merged = {}
+        for path in glob.glob(os.path.join(directory, 'worker-*.json')) + [os.path.join(directory, RETIRED)]:
+            worker = _read(path)
+            if worker is None:
+                continue
+            for key, series in worker.items():
+                _merge_series(merged.setdefault(key, _empty_series()), series)
+        return merged
+
+
+registry = MetricsRegistry()
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(series_by_key):
+    """Prometheus text exposition format 0.0.4."""
+    duration, requests, errors, queries = [], [], [], []
+    for key in sorted(series_by_key):
+        route, method = key.rsplit(' ', 1)
+        series = series_by_key[key]
+        labels = f'route="{_escape(route)}",method="{method}"'
+
+        cumulative = 0
+        for upper, count in zip(LATENCY_BUCKETS, series['buckets']):
+            cumulative += count
+            duration.append(f'library_http_request_duration_seconds_bucket{{{labels},le="{upper}"}} {cumulative}')
+        duration.append(f'library_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {series["count"]}')
+        duration.append(f'library_http_request_duration_seconds_sum{{{labels}}} {series["sum"]:.6f}')
+        duration.append(f'library_http_request_duration_seconds_count{{{labels}}} {series["count"]}')
+
+        for code in sorted(series['statuses']):
+            count = series['statuses'][code]
+            requests.append(f'library_http_requests_total{{{labels},status="{code}"}} {count}')
+            if int(code) >= 400:
+                errors.append(f'library_http_request_errors_total{{{labels},status="{code}"}} {count}')
+        queries.append(f'library_db_queries_total{{{labels}}} {series["queries"]}')
+
+    lines = [
+        '# HELP library_http_request_duration_seconds Request latency per DRF route and method.',
+        '# TYPE library_http_request_duration_seconds histogram',
+        *duration,
+        '# HELP library_http_requests_total Requests per route, method and status code.',
+        '# TYPE library_http_requests_total counter',
+        *requests,
+        '# HELP library_http_request_errors_total Requests that ended with a 4xx/5xx status.',
+        '# TYPE library_http_request_errors_total counter',
+        *errors,
+        '# HELP library_db_queries_total SQL queries executed while serving the route.',
+        '# TYPE library_db_queries_total counter',
+        *queries,
+    ]
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,88 @@
+# libraryapp/middleware.py
+import json
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .instrumentation import QueryBudgetExceeded, collect_metrics
+from .metrics import registry
+
+logger = logging.getLogger('libraryapp.performance')
+
+
+def view_name_for(request):
+    """DRF route name such as 'borrowrecord-return-book' or 'token_obtain_pair'."""
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unresolved'
+
+
+class PerformanceMiddleware:
+    """
+    Measures every request: SQL query count, DB time, serializer time and total time.
+
+    ->Results go out as a Server-Timing header (visible in the browser devtools network tab)
+      and as one JSON log line on the 'libraryapp.performance' logger.
+    ->The same numbers feed the Prometheus histograms served at /metrics (metrics.py).
+    ->settings.QUERY_BUDGETS maps a view name to the max number of queries it may run
+      (settings.DEFAULT_QUERY_BUDGET for the rest, None = no limit). Going over logs a warning,
+      or raises QueryBudgetExceeded when settings.QUERY_BUDGET_STRICT is on, which fails the test.
+    ->Works under WSGI and ASGI. Under ASGI it stays async so async views (async_views.py) are not
+      pushed onto Django's single sync thread. Queries are counted by query_recorder, which is on
+      every connection (apps.py) and reads the ContextVar, so ORM calls in sync_to_async threads count too.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        with collect_metrics(request) as metrics:
+            response = self.get_response(request)
+        return self.finish(request, response, metrics, start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        with collect_metrics(request) as metrics:
+            response = await self.get_response(request)
+        return self.finish(request, response, metrics, start)
+
+    def finish(self, request, response, metrics, start):
+        total = time.perf_counter() - start
+        view_name = view_name_for(request)
+        response['Server-Timing'] = (
+            f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries", '
+            f'serializer;dur={metrics.serializer_time * 1000:.1f}, '
+            f'total;dur={total * 1000:.1f}'
+        )
+        logger.info(json.dumps({
+            'view': view_name,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': metrics.queries,
+            'db_ms': round(metrics.db_time * 1000, 2),
+            'serializer_ms': round(metrics.serializer_time * 1000, 2),
+            'total_ms': round(total * 1000, 2),
+        }))
+        registry.observe_request(view_name, request.method, response.status_code, total, metrics.queries)
+        self.check_query_budget(view_name, metrics.queries - metrics.throttle_queries)
+        return response
+
+    def check_query_budget(self, view_name, queries):
+        budget = settings.QUERY_BUDGETS.get(view_name, settings.DEFAULT_QUERY_BUDGET)
+        if budget is None or queries <= budget:
+            return
+        message = f"{view_name} ran {queries} SQL queries (budget {budget})"
+        if settings.QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libraryapp', '0004_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='borrowrecord',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:28
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libraryapp', '0006_bookneighbour'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BorrowRecordArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('borrow_date', models.DateTimeField()),
+                ('due_date', models.DateTimeField()),
+                ('return_date', models.DateTimeField()),
+                ('fine_amount', models.DecimalField(decimal_places=2, default=0, max_digits=6)),
+                ('fine_paid', models.BooleanField(default=False)),
+                ('archived_at', models.DateTimeField()),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='libraryapp.book')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_borrow_records', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
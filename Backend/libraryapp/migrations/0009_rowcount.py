@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:54
+
+from django.db import migrations, models
+
+
+def count_existing_rows(apps, schema_editor):
+    from libraryapp.counters import rebuild
+
+    rebuild(apps, using=schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libraryapp', '0008_category_is_deleted_deletionjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RowCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_existing_rows, migrations.RunPython.noop),
+    ]
@@ -4,6 +4,19 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser
 from datetime import timedelta,datetime
 from django.utils import timezone
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+def bump_version(instance, save_kwargs):
+    """Increment `version` when an existing row is saved, so stale If-Match writers get rejected."""
+    if instance.pk is None or save_kwargs.get('force_insert'):
+        return
+    instance.version += 1
+    update_fields = save_kwargs.get('update_fields')
+    if update_fields is not None and 'version' not in update_fields:
+        save_kwargs['update_fields'] = [*update_fields, 'version']
+
+
 class User(AbstractUser):
     ROLES = (
         ('admin', 'Admin'),
@@ -18,6 +31,9 @@ class User(AbstractUser):
 
 class Category(models.Model):
     name = models.CharField(max_length=100)
+    # Set while a DeletionJob removes the category's books in the background (see deletion.py);
+    # hidden categories are left out of the API straight away
+    is_deleted = models.BooleanField(default=False, db_index=True)
 
     class Meta:
         verbose_name_plural = "Categories"
@@ -41,6 +57,33 @@ class Book(models.Model):
     
     ISBN = models.CharField(max_length=13, unique=True) #Aman:- ISBN is unique for each book.
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='available')
+    # Optimistic concurrency: bumped on every update, sent to clients as the ETag (see concurrency.py)
+    version = models.PositiveIntegerField(default=0)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Status as stored, so signals.py can tell when a save changed it (read from __dict__: may be deferred)
+        instance._loaded_status = instance.__dict__.get('status')
+        instance._counted = instance.counted_state()
+        instance._catalog = instance.catalog_state()
+        return instance
+
+    def counted_state(self):
+        """(status, category) as counted by counters.py, or None while one of them is deferred."""
+        if {'status', 'category_id'} - self.__dict__.keys():
+            return None
+        return (self.status, self.category_id)
+
+    def catalog_state(self):
+        """The fields in the catalog snapshot (catalog.py), or None while one of them is deferred."""
+        if {'title', 'author', 'ISBN', 'category_id'} - self.__dict__.keys():
+            return None
+        return (self.title, self.author, self.ISBN, self.category_id)
+
+    def save(self, *args, **kwargs):
+        bump_version(self, kwargs)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.title
@@ -55,6 +98,7 @@ class BorrowRecord(models.Model):
     return_date = models.DateTimeField(null=True, blank=True)
     fine_amount = models.DecimalField(max_digits=6, decimal_places=2, default=0)
     fine_paid = models.BooleanField(default=False)
+    version = models.PositiveIntegerField(default=0)
 
     def calculate_fine(self):
         """Automatically calculate fine if overdue."""
@@ -65,11 +109,141 @@ class BorrowRecord(models.Model):
             return days_overdue * 10  # ₹10 per day 
         return 0
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # What counters.py counted this loan as, so signals.py can apply the difference on save
+        instance._counted = instance.counted_state()
+        return instance
+
+    def counted_state(self):
+        """(user, open, unpaid fine) as counted by counters.py, or None while one of them is deferred."""
+        if {'user_id', 'return_date', 'fine_amount', 'fine_paid'} - self.__dict__.keys():
+            return None
+        return (self.user_id, self.return_date is None, self.fine_amount > 0 and not self.fine_paid)
+
     def save(self, *args, **kwargs):
         # Auto-calculate fine when the book is returned
         if self.return_date:
             self.fine_amount = self.calculate_fine()
+        bump_version(self, kwargs)
         super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.user.username} - {self.book.title}"
+
+
+class BorrowRecordArchive(models.Model):
+    """
+    A returned, paid BorrowRecord moved out of the hot table by `manage.py archive_borrow_records`.
+    Keeps the original BorrowRecord id, so ids stay unique across both tables.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, related_name='archived_borrow_records', on_delete=models.CASCADE)
+    book = models.ForeignKey(Book, related_name='+', on_delete=models.CASCADE)
+    borrow_date = models.DateTimeField()
+    due_date = models.DateTimeField()
+    return_date = models.DateTimeField()
+    fine_amount = models.DecimalField(max_digits=6, decimal_places=2, default=0)
+    fine_paid = models.BooleanField(default=False)
+    archived_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.user_id} - {self.book_id} (archived)"
+
+
+class RowCount(models.Model):
+    """
+    A maintained row count, e.g. `books:status:available` or `loans:user:7:open`, read by paginated
+    lists instead of COUNT(*). Kept up to date by signals.py; see counters.py for the keys.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} = {self.value}"
+
+
+class ThrottleCounter(models.Model):
+    """
+    Requests of one client under one throttle scope (throttles.py), e.g. `throttle:search_user:user-7`:
+    the counts of the current and the previous rate window. One row per client, reused window after window.
+    """
+    key = models.CharField(max_length=255, unique=True)
+    window = models.BigIntegerField()  # number of the current window: unix time // window length
+    current = models.PositiveIntegerField(default=0)
+    previous = models.PositiveIntegerField(default=0)
+    expires_at = models.DateTimeField(db_index=True)  # both counts are stale after this; purged by command
+
+    def __str__(self):
+        return f"{self.key} = {self.current} (window {self.window})"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Stored response for a POST sent with an Idempotency-Key header.
+    A retried request with the same key gets this response back instead of running the view again.
+    """
+    key = models.CharField(max_length=255)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    request_hash = models.CharField(max_length=64)  # sha256 of method + path + body, to reject key reuse
+    status_code = models.PositiveSmallIntegerField(null=True)  # None while the first request is still running
+    response_body = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)  # indexed so expired rows can be purged cheaply
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key_per_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.key}"
+
+
+class BookNeighbour(models.Model):
+    """
+    "Members who borrowed this also borrowed": one of the top-N books most often borrowed by the
+    same members as `book`. Precomputed by `manage.py build_recommendations` (see recommendations.py).
+    """
+    book = models.ForeignKey(Book, related_name='neighbours', on_delete=models.CASCADE)
+    neighbour = models.ForeignKey(Book, related_name='+', on_delete=models.CASCADE)
+    rank = models.PositiveSmallIntegerField()  # 0 = best match
+    co_borrowers = models.PositiveIntegerField()  # members who borrowed both books
+    score = models.FloatField()  # co_borrowers / sqrt(borrowers of book * borrowers of neighbour)
+
+    class Meta:
+        ordering = ['book', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'rank'], name='unique_book_neighbour_rank'),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} -> {self.neighbour_id} ({self.score:.3f})"
+
+
+class DeletionJob(models.Model):
+    """
+    Background deletion of a large category: its books, their loans and finally the category itself
+    are deleted in small batches by deletion.py. Progress is readable through GET /api/deletion-jobs/{id}/.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+    category_id = models.BigIntegerField()  # plain id: the category row is gone when the job finishes
+    category_name = models.CharField(max_length=100)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', db_index=True)
+    total_books = models.PositiveIntegerField(default=0)
+    deleted_books = models.PositiveIntegerField(default=0)
+    deleted_borrow_records = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    requested_by = models.ForeignKey(User, null=True, on_delete=models.SET_NULL, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Delete category {self.category_name} ({self.status})"
@@ -0,0 +1,65 @@
+# libraryapp/pagination.py
+from django.conf import settings
+from django.core.paginator import InvalidPage, Paginator
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+
+from . import counters
+
+"""
+Opt-in page-number pagination for list endpoints.
+
+->Lists stay plain JSON arrays unless the client sends ?page= or ?page_size= (existing clients are
+  unaffected); then the response is {count, next, previous, results}.
+->The count comes from a maintained counter (counters.py) when the view can name one for the request:
+  a view defines counter_key(request) and returns a key, or None to fall back to COUNT(*)
+  (e.g. for ?search=, which no counter covers).
+"""
+
+# Query parameters that do not change which rows a list returns
+NEUTRAL_PARAMS = {'page', 'page_size', 'ordering', 'format'}
+
+
+def filter_params(request):
+    """The query parameters of `request` that may filter the list."""
+    return {name: value for name, value in request.query_params.items() if name not in NEUTRAL_PARAMS}
+
+
+class CountedPaginator(Paginator):
+    """Paginator that takes a known total instead of counting the queryset."""
+
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        if count is not None:
+            self.count = count  # shadows the cached_property, so no COUNT(*) runs
+
+
+class CountedPageNumberPagination(PageNumberPagination):
+    django_paginator_class = CountedPaginator
+    page_size_query_param = 'page_size'
+    max_page_size = settings.PAGINATION_MAX_PAGE_SIZE
+
+    def get_page_size(self, request):
+        if self.page_query_param not in request.query_params and self.page_size_query_param not in request.query_params:
+            return None
+        return super().get_page_size(request)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # PageNumberPagination.paginate_queryset, with the paginator given the counter's total
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        key = view.counter_key(request) if hasattr(view, 'counter_key') else None
+        if not queryset.ordered:
+            queryset = queryset.order_by('pk')  # stable pages
+        paginator = self.django_paginator_class(queryset, page_size, count=counters.get(key) if key else None)
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        return list(self.page)
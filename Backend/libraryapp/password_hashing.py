@@ -0,0 +1,39 @@
+# libraryapp/password_hashing.py
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+
+from . import workers as worker_processes
+
+"""
+Password hashing spread over a process pool, for bulk user imports (user_import.py).
+
+One PBKDF2 hash costs a few hundred milliseconds of CPU and holds the GIL, so threads do not help;
+worker processes use every core.
+
+->Workers are started with `spawn`: forking a threaded server process could copy a lock held by
+  another thread. Each worker configures Django once (workers.setup_django; settings only, nothing
+  touches the database).
+->Passwords are sent in chunks to keep inter-process overhead small next to the hashing itself.
+->Small batches (fewer than `workers` * 2 passwords) are hashed inline: starting the pool would cost more.
+"""
+
+
+def hash_passwords(passwords, workers=None):
+    """make_password() for every password, in order."""
+    passwords = list(passwords)
+    workers = workers or settings.USER_IMPORT_WORKERS or os.cpu_count() or 1
+    if workers <= 1 or len(passwords) < workers * 2:
+        return [make_password(password) for password in passwords]
+
+    chunksize = max(1, min(32, len(passwords) // (workers * 4)))
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=worker_processes.setup_django,
+        initargs=(worker_processes.current_settings_module(),),
+    ) as pool:
+        return list(pool.map(make_password, passwords, chunksize=chunksize))
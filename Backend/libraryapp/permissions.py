@@ -44,3 +44,16 @@ class IsAdminOrLibrarian(BasePermission):
             # of throwing an error
             and getattr(request.user, 'role', None) in ['admin', 'librarian']
         )
+
+
+class IsLibraryStaff(BasePermission):
+    """
+    Admins and librarians only, for reads too (reports that members should not see).
+    """
+
+    def has_permission(self, request, view):
+        return (
+            request.user
+            and request.user.is_authenticated
+            and getattr(request.user, 'role', None) in ['admin', 'librarian']
+        )
@@ -0,0 +1,229 @@
+# libraryapp/recommendations.py
+import os
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from scipy import sparse
+
+from .models import Book, BookNeighbour, BorrowRecord, BorrowRecordArchive
+
+"""
+Book-to-book co-borrowing ("members who borrowed this also borrowed"), run by
+`manage.py build_recommendations` and served by BookViewSet.recommendations.
+
+->B is the sparse member x book matrix (1 = the member borrowed the book at least once).
+  C = B.T @ B is the book x book co-occurrence matrix: C[i, j] members borrowed both i and j,
+  C[i, i] members borrowed i.
+->Neighbours are ranked by cosine similarity C[i, j] / sqrt(C[i, i] * C[j, j]), so a book
+  everybody borrows does not top every list. Pairs seen fewer than RECOMMENDATIONS_MIN_SUPPORT
+  times are ignored.
+->B, C and the last BorrowRecord id processed are kept in RECOMMENDATIONS_STATE_PATH (.npz).
+  An incremental run only reads loans (live or archived) with a larger id. With D = the new (member, book) pairs,
+      C' = C + D.T @ B + B.T @ D + D.T @ D        B' = B + D
+  and new BookNeighbour rows are computed for every book whose scores can have moved: the books
+  whose row of C changed, and the books co-borrowed with a book whose C[j, j] changed (the cosine
+  denominator of their score for it).
+->Rows and columns are indexed by primary key directly; matrices grow when new ids show up.
+"""
+
+INDEX_DTYPE = np.int64
+COUNT_DTYPE = np.int32
+NEIGHBOUR_COLUMNS = ('book_id', 'neighbour_id', 'rank', 'co_borrowers', 'score')
+
+
+# -------------------------------------------------------------------------
+# State file
+# -------------------------------------------------------------------------
+def empty_state():
+    return {
+        'incidence': sparse.csr_matrix((0, 0), dtype=COUNT_DTYPE),
+        'cooccurrence': sparse.csr_matrix((0, 0), dtype=COUNT_DTYPE),
+        'last_record_id': 0,
+    }
+
+
+def load_state(path):
+    if not os.path.exists(path):
+        return empty_state()
+    with np.load(path) as stored:
+        def matrix(name):
+            return sparse.csr_matrix(
+                (stored[f'{name}_data'], stored[f'{name}_indices'], stored[f'{name}_indptr']),
+                shape=tuple(stored[f'{name}_shape']),
+            )
+        return {
+            'incidence': matrix('incidence'),
+            'cooccurrence': matrix('cooccurrence'),
+            'last_record_id': int(stored['last_record_id']),
+        }
+
+
+def save_state(path, state):
+    arrays = {'last_record_id': np.array(state['last_record_id'], dtype=INDEX_DTYPE)}
+    for name in ('incidence', 'cooccurrence'):
+        matrix = state[name]
+        arrays.update({
+            f'{name}_data': matrix.data, f'{name}_indices': matrix.indices,
+            f'{name}_indptr': matrix.indptr, f'{name}_shape': np.array(matrix.shape, dtype=INDEX_DTYPE),
+        })
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    # Written next to the target and renamed: a crash never leaves a half-written state behind
+    temporary = f'{path}.tmp.npz'
+    np.savez(temporary, **arrays)
+    os.replace(temporary, path)
+
+
+# -------------------------------------------------------------------------
+# Matrix maintenance
+# -------------------------------------------------------------------------
+def new_loans(after_id, chunk_size):
+    """
+    (last record id, member ids, book ids) of the loans with id > after_id.
+    Archived loans keep their id (see archive.py), so both tables are read: a full build still sees
+    all history, and a loan archived before it was processed is not skipped.
+    """
+    dtype = [('id', INDEX_DTYPE), ('user', INDEX_DTYPE), ('book', INDEX_DTYPE)]
+    rows = np.concatenate([
+        np.fromiter(
+            model.objects.filter(id__gt=after_id).values_list('id', 'user_id', 'book_id').order_by()
+            .iterator(chunk_size=chunk_size),
+            dtype=dtype,
+        )
+        for model in (BorrowRecordArchive, BorrowRecord)
+    ])
+    last_id = int(rows['id'].max()) if len(rows) else after_id
+    return last_id, rows['user'], rows['book']
+
+
+def resized(matrix, shape):
+    if matrix.shape == shape:
+        return matrix
+    matrix = matrix.tocsr(copy=True)
+    matrix.resize(shape)
+    return matrix
+
+
+def apply_loans(state, users, books):
+    """
+    Adds the (member, book) pairs to B and C in place of the old matrices.
+    Returns the ids of the books whose neighbour scores changed.
+    """
+    incidence = state['incidence']
+    shape = (
+        max(incidence.shape[0], int(users.max()) + 1 if len(users) else 0),
+        max(incidence.shape[1], int(books.max()) + 1 if len(books) else 0),
+    )
+    incidence = resized(incidence, shape)
+    cooccurrence = resized(state['cooccurrence'], (shape[1], shape[1]))
+
+    # Distinct pairs that B does not have yet (repeat loans of a book do not count twice)
+    added = sparse.csr_matrix((np.ones(len(users), dtype=COUNT_DTYPE), (users, books)), shape=shape)
+    added.sum_duplicates()
+    added.data[:] = 1
+    added = (added - added.multiply(incidence)).tocsr()
+    added.eliminate_zeros()
+    if added.nnz == 0:
+        state.update(incidence=incidence, cooccurrence=cooccurrence)
+        return np.empty(0, dtype=INDEX_DTYPE)
+
+    added_t = added.T.tocsr()
+    cooccurrence = (cooccurrence + added_t @ incidence + incidence.T @ added + added_t @ added).tocsr()
+    incidence = (incidence + added).tocsr()
+    state.update(incidence=incidence, cooccurrence=cooccurrence.astype(COUNT_DTYPE))
+
+    # C[j, j] changed for every newly borrowed book j, which moves the score of every book i with
+    # C[i, j] > 0. C is symmetric, so those are the columns of rows j. This also covers the rows
+    # that changed themselves: the books borrowed by members with a new loan.
+    borrowed = np.unique(added.indices)
+    return np.unique(state['cooccurrence'][borrowed].indices).astype(INDEX_DTYPE)
+
+
+def ranks_within(groups):
+    """Position of each entry inside its run of equal values of the sorted `groups` array."""
+    if not len(groups):
+        return np.empty(0, dtype=INDEX_DTYPE)
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    return np.arange(len(groups)) - np.repeat(starts, np.diff(np.r_[starts, len(groups)]))
+
+
+def top_neighbours(cooccurrence, book_ids, top_n, min_support):
+    """
+    Vectorized top-N per row: returns (book, neighbour, rank, co_borrowers, score) arrays,
+    sorted by book then rank.
+    """
+    borrowers = cooccurrence.diagonal().astype(np.float64)
+    rows = cooccurrence[book_ids]
+    row_of_entry = np.repeat(book_ids, np.diff(rows.indptr))
+    neighbours = rows.indices.astype(INDEX_DTYPE)
+    counts = rows.data
+
+    keep = (neighbours != row_of_entry) & (counts >= min_support)
+    row_of_entry, neighbours, counts = row_of_entry[keep], neighbours[keep], counts[keep]
+    scores = counts / np.sqrt(borrowers[row_of_entry] * borrowers[neighbours])
+
+    # Sort by book, then best score first (ties: more co-borrowers, then lower id)
+    order = np.lexsort((neighbours, -counts, -scores, row_of_entry))
+    row_of_entry, neighbours, counts, scores = row_of_entry[order], neighbours[order], counts[order], scores[order]
+    ranks = ranks_within(row_of_entry)
+    top = ranks < top_n
+    return row_of_entry[top], neighbours[top], ranks[top], counts[top], scores[top]
+
+
+def store_neighbours(book_ids, neighbours, batch_size, replace_all=False):
+    """
+    Replaces the BookNeighbour rows of `book_ids` (of every book with `replace_all`).
+    Books deleted since the loans were read are skipped.
+    """
+    book, neighbour, rank, co_borrowers, score = neighbours
+    existing = np.fromiter(Book.objects.values_list('id', flat=True).iterator(), dtype=INDEX_DTYPE)
+    keep = np.isin(book, existing) & np.isin(neighbour, existing)
+    book, neighbour, rank, co_borrowers, score = book[keep], neighbour[keep], rank[keep], co_borrowers[keep], score[keep]
+    # Ranks were assigned before dropping deleted books: close the gaps
+    if not keep.all():
+        rank = ranks_within(book)
+
+    with transaction.atomic():
+        if replace_all:
+            BookNeighbour.objects.all().delete()
+        else:
+            for start in range(0, len(book_ids), batch_size):
+                BookNeighbour.objects.filter(book_id__in=book_ids[start:start + batch_size].tolist()).delete()
+        # Plain executemany: building ~1M model instances would take most of a full build
+        table = connection.ops.quote_name(BookNeighbour._meta.db_table)
+        columns = ', '.join(connection.ops.quote_name(column) for column in NEIGHBOUR_COLUMNS)
+        sql = f"INSERT INTO {table} ({columns}) VALUES ({', '.join(['%s'] * len(NEIGHBOUR_COLUMNS))})"
+        rows = list(zip(book.tolist(), neighbour.tolist(), rank.tolist(), co_borrowers.tolist(), score.tolist()))
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), batch_size):
+                cursor.executemany(sql, rows[start:start + batch_size])
+    return len(book)
+
+
+def refresh(full=False, top_n=None, min_support=None, path=None, chunk_size=50000):
+    """
+    Brings the matrices and BookNeighbour up to date. `full` starts over from an empty state.
+    Returns a summary dict for the management command.
+    """
+    path = path or settings.RECOMMENDATIONS_STATE_PATH
+    if top_n is None:
+        top_n = settings.RECOMMENDATIONS_TOP_N
+    if min_support is None:
+        min_support = settings.RECOMMENDATIONS_MIN_SUPPORT
+
+    state = empty_state() if full else load_state(path)
+    last_id, users, books = new_loans(state['last_record_id'], chunk_size)
+    changed = apply_loans(state, users, books)
+    state['last_record_id'] = last_id
+
+    neighbours = top_neighbours(state['cooccurrence'], changed, top_n, min_support)
+    # A full build also drops rows of books that no longer have any co-borrowers
+    stored = store_neighbours(changed, neighbours, chunk_size, replace_all=full)
+    # Saved last: if storing neighbours failed, the next run processes the same loans again
+    save_state(path, state)
+    return {
+        'loans': len(users),
+        'books_refreshed': len(changed),
+        'neighbours': stored,
+        'last_record_id': last_id,
+    }
@@ -1,12 +1,14 @@
+from django.contrib.auth.validators import UnicodeUsernameValidator
 from rest_framework import serializers
-from .models import User, Book, BorrowRecord, Category
+from .models import User, Book, BookNeighbour, BorrowRecord, BorrowRecordArchive, Category, DeletionJob
+from .instrumentation import TimedSerializerMixin
 """
 Aman:- 
 This file defines how User, Book, BorrowRecord, and Category objects are converted to/from JSON and 
 enforces validation and creation/update logic that’s safer than letting raw model fields be written directly.
 """
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'password', 'role']
@@ -27,16 +29,57 @@ class UserSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
 
-class BookSerializer(serializers.ModelSerializer):
+class UserImportRowSerializer(serializers.Serializer):
+    """
+    One row of a bulk user import (user_import.py). Format checks only: uniqueness is checked for
+    the whole batch at once instead of one query per row.
+    """
+    username = serializers.CharField(max_length=150, validators=[UnicodeUsernameValidator()])
+    email = serializers.EmailField()
+    password = serializers.CharField(write_only=True, trim_whitespace=False)
+    role = serializers.ChoiceField(choices=User.ROLES, default='member')
+
+    def validate_username(self, value):
+        return User.normalize_username(value)
+
+    def validate_email(self, value):
+        return User.objects.normalize_email(value)
+
+
+class AccountSummarySerializer(TimedSerializerMixin, serializers.Serializer):
+    """Member home screen (GET /users/summary/): the profile plus loan and fine totals."""
+    user = UserSerializer(read_only=True)
+    total_loans = serializers.IntegerField()
+    active_loans = serializers.IntegerField()
+    overdue_loans = serializers.IntegerField()
+    next_due_date = serializers.DateTimeField(allow_null=True)  # earliest upcoming due date of the active loans
+    unpaid_fines = serializers.IntegerField()  # loans with a fine still to pay
+    outstanding_fines = serializers.DecimalField(max_digits=10, decimal_places=2)
+    fines_paid = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+
+class BookSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    # Categories being deleted in the background (see deletion.py) take no new books
+    category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.filter(is_deleted=False))
+
     class Meta:
         model = Book
-        fields = ['id','title','author','category','ISBN','status']
+        fields = ['id','title','author','category','ISBN','status','version']
+        read_only_fields = ['version']  # changed only by the server, clients send it back via If-Match
+
+
+class BookNeighbourSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    book = BookSerializer(source='neighbour', read_only=True)
+
+    class Meta:
+        model = BookNeighbour
+        fields = ['book', 'co_borrowers', 'score']
 
 
-class BorrowRecordSerializer(serializers.ModelSerializer):
+class BorrowRecordSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     book = BookSerializer(read_only=True)  # ✅ For reading
     book_id = serializers.PrimaryKeyRelatedField(
-        queryset=Book.objects.all(), 
+        queryset=Book.objects.filter(category__is_deleted=False),
         source='book', 
         write_only=True  # ✅ For writing
     )
@@ -44,8 +87,8 @@ class BorrowRecordSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = BorrowRecord
-        fields = ['id', 'user', 'book', 'book_id', 'borrow_date', 'due_date', 'return_date', 'user_info','fine_amount','fine_paid']
-        read_only_fields = ['user', 'borrow_date', 'return_date','fine_amount','fine_paid']
+        fields = ['id', 'user', 'book', 'book_id', 'borrow_date', 'due_date', 'return_date', 'user_info','fine_amount','fine_paid','version']
+        read_only_fields = ['user', 'borrow_date', 'return_date','fine_amount','fine_paid','version']
     
     def get_user_info(self, obj): #Only users with role admin or librarian will see borrower details. Normal users get null in user_info.
         """Return user information for admin/librarian"""
@@ -61,7 +104,33 @@ class BorrowRecordSerializer(serializers.ModelSerializer):
         return None
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class BorrowRecordArchiveSerializer(BorrowRecordSerializer):
+    """Read-only history row, returned by GET /borrow-records/?include_archived=true."""
+    book_id = None  # archived loans cannot be written
+
+    class Meta:
+        model = BorrowRecordArchive
+        fields = ['id', 'user', 'book', 'borrow_date', 'due_date', 'return_date', 'user_info', 'fine_amount', 'fine_paid', 'archived_at']
+        read_only_fields = fields
+
+
+class CategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
-        fields = "__all__"
+        exclude = ['is_deleted']  # hidden categories are never returned
+
+
+class DeletionJobSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = DeletionJob
+        fields = ['id', 'category_id', 'category_name', 'status', 'total_books', 'deleted_books',
+                  'deleted_borrow_records', 'progress', 'error', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
+
+    def get_progress(self, obj):
+        """Share of the category's books deleted so far (0.0 - 1.0)."""
+        if obj.status == 'done':
+            return 1.0
+        return round(obj.deleted_books / obj.total_books, 3) if obj.total_books else 0.0
@@ -0,0 +1,116 @@
+# libraryapp/signals.py
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import autocomplete, catalog, counters
+from .events import broker
+from .models import Book, BorrowRecord, Category
+
+"""
+Model signal receivers, connected in LibraryappConfig.ready().
+
+Note: QuerySet.update() does not send post_save. Code that changes books that way
+(concurrency.conditional_update) sends it by hand so these receivers still run.
+"""
+
+
+@receiver(post_save, sender=Book, dispatch_uid='libraryapp_book_status_event')
+def publish_book_status(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_loaded_status', None)
+    if not created and previous == instance.status:
+        return
+    instance._loaded_status = instance.status
+    event = {
+        'type': 'book.status',
+        'book_id': instance.pk,
+        'category_id': instance.category_id,
+        'status': instance.status,
+        'previous_status': None if created else previous,
+        'timestamp': timezone.now().isoformat(),
+    }
+    # Only announce changes that were really committed
+    transaction.on_commit(partial(broker.publish, event))
+
+
+@receiver(post_save, sender=Book, dispatch_uid='libraryapp_book_autocomplete_update')
+def update_autocomplete(sender, instance, **kwargs):
+    if {'title', 'author', 'category_id'} & instance.get_deferred_fields():
+        return
+    transaction.on_commit(partial(
+        autocomplete.index.update, instance.pk, instance.title, instance.author, instance.category_id,
+    ))
+
+
+@receiver(post_delete, sender=Book, dispatch_uid='libraryapp_book_autocomplete_remove')
+def remove_from_autocomplete(sender, instance, **kwargs):
+    transaction.on_commit(partial(autocomplete.index.remove, instance.pk))
+
+
+@receiver(post_save, sender=Category, dispatch_uid='libraryapp_category_autocomplete_hide')
+def hide_from_autocomplete(sender, instance, **kwargs):
+    if instance.is_deleted:
+        transaction.on_commit(partial(autocomplete.index.hide_category, instance.pk))
+
+
+# -------------------------------------------------------------------------
+# Row counters (counters.py): every save/delete moves the row between keys,
+# in the same transaction as the write
+# -------------------------------------------------------------------------
+COUNTED_KEYS = {Book: counters.book_keys, BorrowRecord: counters.loan_keys}
+
+
+@receiver(pre_save, sender=Book, dispatch_uid='libraryapp_book_counted_state')
+@receiver(pre_save, sender=BorrowRecord, dispatch_uid='libraryapp_borrowrecord_counted_state')
+def remember_counted_state(sender, instance, **kwargs):
+    # Not loaded with every counted field (built by hand, or deferred): read what is stored once
+    if instance._state.adding or getattr(instance, '_counted', None) is not None:
+        return
+    stored = sender._default_manager.filter(pk=instance.pk).first()
+    instance._counted = stored.counted_state() if stored else None
+
+
+@receiver(post_save, sender=Book, dispatch_uid='libraryapp_book_counters_save')
+@receiver(post_save, sender=BorrowRecord, dispatch_uid='libraryapp_borrowrecord_counters_save')
+def count_saved(sender, instance, created, using, **kwargs):
+    previous = None if created else getattr(instance, '_counted', None)
+    if instance.counted_state() is None:
+        # Some counted fields are deferred: load them as stored rather than guess
+        instance.refresh_from_db(fields=instance.get_deferred_fields())
+    current = instance.counted_state()
+    keys = COUNTED_KEYS[sender]
+    counters.change(keys(previous), keys(current), using)
+    instance._counted = current
+
+
+@receiver(post_delete, sender=Book, dispatch_uid='libraryapp_book_counters_delete')
+@receiver(post_delete, sender=BorrowRecord, dispatch_uid='libraryapp_borrowrecord_counters_delete')
+def count_deleted(sender, instance, using, **kwargs):
+    counters.change(COUNTED_KEYS[sender](instance.counted_state() or getattr(instance, '_counted', None)), [], using)
+
+
+# -------------------------------------------------------------------------
+# Catalog snapshot (catalog.py): refreshed when titles, authors, ISBNs or
+# categories change — not on status changes, which the snapshot leaves out
+# -------------------------------------------------------------------------
+@receiver(post_save, sender=Book, dispatch_uid='libraryapp_book_catalog_save')
+def mark_catalog_book(sender, instance, created, **kwargs):
+    state = instance.catalog_state()
+    if not created and state is not None and state == getattr(instance, '_catalog', None):
+        return
+    instance._catalog = state
+    transaction.on_commit(partial(catalog.refresher.mark, [instance.pk]))
+
+
+@receiver(post_delete, sender=Book, dispatch_uid='libraryapp_book_catalog_delete')
+def mark_catalog_book_deleted(sender, instance, **kwargs):
+    transaction.on_commit(partial(catalog.refresher.mark, [instance.pk]))
+
+
+@receiver(post_save, sender=Category, dispatch_uid='libraryapp_category_catalog_save')
+@receiver(post_delete, sender=Category, dispatch_uid='libraryapp_category_catalog_delete')
+def mark_catalog_categories(sender, instance, **kwargs):
+    transaction.on_commit(catalog.refresher.mark)
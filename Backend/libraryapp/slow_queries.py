@@ -0,0 +1,104 @@
+# libraryapp/slow_queries.py
+import json
+import logging
+import time
+
+from django.conf import settings
+
+from .instrumentation import current_metrics
+
+logger = logging.getLogger('libraryapp.slow_queries')
+
+"""
+Opt-in slow-query log.
+
+->Set SLOW_QUERY_THRESHOLD_MS (env var of the same name) to turn it on; unset = off.
+->slow_query_logger is installed on every new DB connection (see apps.py) and times each query.
+  Queries at or above the threshold are logged with their SQL, parameters, the DRF view that ran
+  them and, on SQLite, the `EXPLAIN QUERY PLAN` output. So a slow BookViewSet filter combination
+  (search/status/category/ordering) can be reproduced from the log alone.
+->Parameter values can be password hashes, emails or tokens, so only their types are logged
+  (e.g. '<str>') unless SLOW_QUERY_LOG_PARAMS is set, e.g. while reproducing a problem locally.
+->The 'libraryapp.slow_queries' logger writes to slow_queries.log through
+  BackgroundRotatingFileHandler, so the file write happens off the request thread.
+"""
+
+MAX_PARAM_LENGTH = 200
+
+
+def _view_name():
+    from .middleware import view_name_for
+
+    metrics = current_metrics()
+    if metrics is None or metrics.request is None:
+        return None  # management command, shell, ...
+    return view_name_for(metrics.request)
+
+
+def param_for_log(param):
+    if settings.SLOW_QUERY_LOG_PARAMS:
+        return repr(param)[:MAX_PARAM_LENGTH]
+    return f'<{type(param).__name__}>'
+
+
+def explain_query_plan(connection, sql, params):
+    """SQLite query plan rows as indented text lines, e.g. ['SCAN libraryapp_book', ...]."""
+    # create_cursor() gives a raw backend cursor: the EXPLAIN is not timed, counted or logged itself
+    cursor = connection.create_cursor()
+    try:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    depth = {0: 0}
+    plan = []
+    for node_id, parent_id, _, detail in rows:
+        depth[node_id] = depth.get(parent_id, 0) + 1
+        plan.append('  ' * (depth[node_id] - 1) + detail)
+    return plan
+
+
+def _can_explain(connection, sql, many):
+    return (
+        connection.vendor == 'sqlite'
+        and not many
+        and sql.lstrip()[:6].upper().startswith(('SELECT', 'WITH'))
+    )
+
+
+def log_slow_query(connection, sql, params, many, duration):
+    plan = None
+    if _can_explain(connection, sql, many):
+        try:
+            plan = explain_query_plan(connection, sql, params)
+        except Exception as e:  # never let diagnostics break the request
+            plan = [f'EXPLAIN failed: {e}']
+    logger.warning(json.dumps({
+        'duration_ms': round(duration * 1000, 2),
+        'view': _view_name(),
+        'database': connection.alias,
+        'sql': sql,
+        'params': None if many else [param_for_log(p) for p in (params or ())],
+        'query_plan': plan,
+    }))
+
+
+def slow_query_logger(execute, sql, params, many, context):
+    threshold = settings.SLOW_QUERY_THRESHOLD_MS
+    if threshold is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        if duration * 1000 >= threshold:
+            log_slow_query(context['connection'], sql, params, many, duration)
+
+
+def install_slow_query_logger(sender, connection, **kwargs):
+    """connection_created receiver."""
+    # Inserted at the front: connection.execute_wrapper() blocks pop from the end,
+    # and the connection may be opened while one of them is active.
+    if slow_query_logger not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, slow_query_logger)
@@ -1,10 +1,24 @@
 from django.urls import reverse
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.core.management import call_command
+from io import StringIO
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.test import APIClient, APITestCase
 from django.utils import timezone
 from unittest.mock import patch
+import asyncio
+import json
+import os
+import socketserver
+import tempfile
+import threading
+import time
 from datetime import timedelta
-from libraryapp.models import User, Book, Category, BorrowRecord
+from libraryapp.models import User, Book, BookNeighbour, Category, BorrowRecord, BorrowRecordArchive, IdempotencyKey
+from libraryapp.instrumentation import QueryBudgetExceeded
+from libraryapp.password_hashing import hash_passwords
+from django.contrib.auth.hashers import check_password
+from rest_framework_simplejwt.tokens import AccessToken
 
 
 class LibraryAPITests(APITestCase):
@@ -199,3 +213,1228 @@ class LibraryAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         record.refresh_from_db()
         self.assertTrue(record.fine_paid)
+
+    def test_idempotent_borrow_is_replayed(self):
+        """✅ Retrying a borrow with the same Idempotency-Key replays the first response"""
+        self.auth(self.member_token)
+        url = reverse('borrowrecord-list')
+        data = {
+            "book_id": self.book.id,
+            "due_date": (timezone.now() + timedelta(days=3)).isoformat()
+        }
+        first = self.client.post(url, data, HTTP_IDEMPOTENCY_KEY="borrow-1")
+        retry = self.client.post(url, data, HTTP_IDEMPOTENCY_KEY="borrow-1")
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data['id'], first.data['id'])
+        self.assertEqual(BorrowRecord.objects.filter(book=self.book).count(), 1)
+
+    def test_idempotent_retry_while_first_request_runs_gets_409(self):
+        """ A retry that arrives while the first request still runs is refused, not run twice"""
+        from libraryapp.views import BorrowRecordViewSet
+
+        self.auth(self.member_token)
+        url = reverse('borrowrecord-list')
+        data = {"book_id": self.book.id, "due_date": (timezone.now() + timedelta(days=3)).isoformat()}
+        perform_create = BorrowRecordViewSet.perform_create
+        retries = []
+
+        def retry_during_first(view, serializer):
+            retries.append(self.client.post(url, data, HTTP_IDEMPOTENCY_KEY="borrow-2"))
+            perform_create(view, serializer)
+
+        with patch.object(BorrowRecordViewSet, 'perform_create', autospec=True, side_effect=retry_during_first):
+            first = self.client.post(url, data, HTTP_IDEMPOTENCY_KEY="borrow-2")
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retries[0].status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(retries[0]['Retry-After'], '1')
+        self.assertEqual(BorrowRecord.objects.filter(book=self.book).count(), 1)
+        # Once the first request is done, retries replay its response
+        replay = self.client.post(url, data, HTTP_IDEMPOTENCY_KEY="borrow-2")
+        self.assertEqual((replay.data['id'], replay['Idempotent-Replayed']), (first.data['id'], 'true'))
+
+    def test_idempotency_key_released_when_view_fails(self):
+        """✅ A request that fails with a server error releases its key, so a retry runs for real"""
+        from libraryapp.views import BorrowRecordViewSet
+
+        self.auth(self.member_token)
+        self.client.raise_request_exception = False
+        url = reverse('borrowrecord-list')
+        data = {"book_id": self.book.id, "due_date": (timezone.now() + timedelta(days=3)).isoformat()}
+        with patch.object(BorrowRecordViewSet, 'perform_create', side_effect=RuntimeError("disk full")):
+            failed = self.client.post(url, data, HTTP_IDEMPOTENCY_KEY="borrow-3")
+        self.assertEqual(failed.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        self.assertFalse(IdempotencyKey.objects.filter(key="borrow-3").exists())
+        retry = self.client.post(url, data, HTTP_IDEMPOTENCY_KEY="borrow-3")
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+
+    def test_idempotency_key_reuse_with_different_request(self):
+        """ Same Idempotency-Key on a different request is rejected"""
+        record = BorrowRecord.objects.create(
+            user=self.member,
+            book=self.book,
+            due_date=timezone.now() + timedelta(days=2)
+        )
+        self.auth(self.member_token)
+        response = self.client.post(reverse('borrowrecord-return-book', args=[record.id]), HTTP_IDEMPOTENCY_KEY="key-1")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.post(reverse('borrowrecord-list'), {
+            "book_id": self.book.id,
+            "due_date": (timezone.now() + timedelta(days=3)).isoformat()
+        }, HTTP_IDEMPOTENCY_KEY="key-1")
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    def test_book_update_with_current_etag(self):
+        """✅ PATCH with the current ETag succeeds and bumps the version"""
+        self.auth(self.librarian_token)
+        url = reverse('book-detail', args=[self.book.id])
+        etag = self.client.get(url)['ETag']
+        response = self.client.patch(url, {"title": "Physics 102"}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.title, "Physics 102")
+
+    def test_book_update_with_stale_etag(self):
+        """ PATCH with a stale ETag is rejected and does not overwrite"""
+        self.auth(self.librarian_token)
+        url = reverse('book-detail', args=[self.book.id])
+        etag = self.client.get(url)['ETag']
+        self.client.patch(url, {"title": "First edit"}, HTTP_IF_MATCH=etag)
+        response = self.client.patch(url, {"title": "Second edit"}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.title, "First edit")
+
+    def test_server_timing_header(self):
+        """✅ Every response reports DB, serializer and total time"""
+        self.auth(self.member_token)
+        response = self.client.get(reverse('book-list'))
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('serializer;dur=', response['Server-Timing'])
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+    @override_settings(QUERY_BUDGETS={'book-list': 1}, QUERY_BUDGET_STRICT=True)
+    def test_query_budget_exceeded_fails_in_tests(self):
+        """ A view running more queries than its budget fails"""
+        self.auth(self.member_token)
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(reverse('book-list'))
+
+    def test_metrics_endpoint_reports_route_histograms(self):
+        """✅ /metrics exposes latency histograms per DRF route"""
+        self.auth(self.member_token)
+        self.client.get(reverse('book-list'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.content.decode()
+        self.assertIn('library_http_request_duration_seconds_bucket{route="book-list",method="GET",le="+Inf"}', body)
+        self.assertIn('library_db_queries_total{route="book-list",method="GET"}', body)
+
+    def test_metrics_aggregates_worker_files(self):
+        """✅ /metrics adds up counters written by other worker processes"""
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            other_worker = {"borrowrecord-return-book POST": {
+                "buckets": [0] * 11 + [1], "count": 1, "sum": 12.5, "queries": 7, "statuses": {"500": 1},
+            }}
+            with open(os.path.join(directory, f'worker-{os.getppid()}-0a1b2c3d.json'), 'w') as f:
+                json.dump(other_worker, f)
+            body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('library_http_request_errors_total{route="borrowrecord-return-book",method="POST",status="500"} 1', body)
+
+    def test_metrics_retires_dead_worker_files(self):
+        """✅ A dead worker's counters move to retired.json: its file goes, its requests stay counted"""
+        import subprocess
+        import sys
+
+        exited = subprocess.Popen([sys.executable, "-c", "pass"])
+        exited.wait()
+        dead_worker = {"dead-worker-route GET": {
+            "buckets": [1] + [0] * 11, "count": 1, "sum": 0.001, "queries": 2, "statuses": {"200": 1},
+        }}
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            dead_file = os.path.join(directory, f'worker-{exited.pid}-0a1b2c3d.json')
+            with open(dead_file, 'w') as f:
+                json.dump(dead_worker, f)
+            for _ in range(2):  # the second scrape must not count it again
+                body = self.client.get(reverse('metrics')).content.decode()
+                self.assertIn('library_db_queries_total{route="dead-worker-route",method="GET"} 2', body)
+            self.assertFalse(os.path.exists(dead_file))
+            self.assertTrue(os.path.exists(os.path.join(directory, 'retired.json')))
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_slow_query_log_captures_query_plan(self):
+        """✅ Queries over the threshold are logged with view and EXPLAIN QUERY PLAN"""
+        self.auth(self.member_token)
+        with self.assertLogs('libraryapp.slow_queries', level='WARNING') as logs:
+            self.client.get(reverse('book-list'), {'status': 'available', 'ordering': 'title'})
+        entries = [json.loads(line.split(':', 2)[2]) for line in logs.output]
+        book_query = next(e for e in entries if 'libraryapp_book' in e['sql'])
+        self.assertEqual(book_query['view'], 'book-list')
+        self.assertTrue(book_query['query_plan'])
+        self.assertIn('<str>', book_query['params'])  # values are redacted by default
+        self.assertNotIn("'available'", book_query['params'])
+
+        with self.settings(SLOW_QUERY_LOG_PARAMS=True), self.assertLogs('libraryapp.slow_queries', level='WARNING') as logs:
+            self.client.get(reverse('book-list'), {'status': 'available'})
+        entries = [json.loads(line.split(':', 2)[2]) for line in logs.output]
+        book_query = next(e for e in entries if 'libraryapp_book' in e['sql'])
+        self.assertIn("'available'", book_query['params'])
+
+    def test_seed_library_command(self):
+        """✅ seed_library generates a consistent mix of loans"""
+        call_command('seed_library', categories=3, books=40, users=5, borrow_records=200,
+                     open_fraction=0.1, stdout=StringIO())
+        self.assertEqual(Book.objects.count(), 41)
+        self.assertEqual(BorrowRecord.objects.count(), 200)
+        open_loans = BorrowRecord.objects.filter(return_date__isnull=True)
+        self.assertEqual(open_loans.count(), 20)
+        self.assertEqual(Book.objects.filter(status='borrowed').count(), 20)
+        self.assertTrue(BorrowRecord.objects.filter(fine_amount__gt=0, fine_paid=False).exists())
+
+    def test_benchmark_api_command(self):
+        """✅ benchmark_api writes latency percentiles and flags regressions against a baseline"""
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            baseline = os.path.join(directory, 'baseline.json')
+            with open(baseline, 'w') as f:
+                json.dump({'results': {'book-list-filtered': {'p95_ms': 0.001, 'queries_per_op': 0}}}, f)
+            call_command('benchmark_api', iterations=2, warmup=0, scenario=['book-list-filtered', 'borrow-return-cycle'],
+                         output=output, baseline=baseline, stdout=StringIO())
+            with open(output) as f:
+                report = json.load(f)
+        result = report['results']['borrow-return-cycle']
+        self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        self.assertGreater(result['queries_per_op'], 0)
+        self.assertGreater(report['results']['book-list-filtered']['queries_per_op'], 0)
+        self.assertTrue(report['comparison']['book-list-filtered']['regressed'])
+        self.assertFalse(User.objects.filter(username__startswith='bench_').exists())  # no leftover accounts
+        self.assertFalse(BorrowRecord.objects.filter(user__username__startswith='bench_').exists())
+
+
+class SlowSMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for Django's EmailBackend; every message takes `server.delay` seconds to accept."""
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.reply("220 fake-smtp ready")
+        while line := self.rfile.readline():
+            command = line.decode().strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                self.reply("250 fake-smtp")
+            elif command == "DATA":
+                self.reply("354 end with <CRLF>.<CRLF>")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                time.sleep(self.server.delay)
+                self.server.messages += 1
+                self.reply("250 queued")
+            elif command == "QUIT":
+                self.reply("221 bye")
+                return
+            else:  # MAIL FROM, RCPT TO, RSET, NOOP
+                self.reply("250 ok")
+
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+
+    def __init__(self, delay):
+        super().__init__(("127.0.0.1", 0), SlowSMTPHandler)
+        self.delay = delay
+        self.messages = 0
+
+
+class AsyncMailViewTests(TestCase):
+    SMTP_DELAY = 0.3
+    REQUESTS = 10
+
+    def setUp(self):
+        self.smtp = FakeSMTPServer(self.SMTP_DELAY)
+        threading.Thread(target=self.smtp.serve_forever, daemon=True).start()
+        self.addCleanup(self.smtp.server_close)
+        self.addCleanup(self.smtp.shutdown)
+        mail_settings = override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1', EMAIL_PORT=self.smtp.server_address[1],
+            EMAIL_USE_TLS=False, EMAIL_HOST_USER='library@example.com',
+        )
+        mail_settings.enable()
+        self.addCleanup(mail_settings.disable)
+
+        self.admin = User.objects.create_user(username="admin", password="x", role="admin", is_staff=True)
+        self.member = User.objects.create_user(username="mem", password="x", email="mem@example.com")
+        category = Category.objects.create(name="Science")
+        self.records = [
+            BorrowRecord.objects.create(
+                user=self.member,
+                book=Book.objects.create(title=f"Book {i}", author="A", category=category, ISBN=f"{i:013d}"),
+                due_date=timezone.now() - timedelta(days=1),
+            )
+            for i in range(self.REQUESTS)
+        ]
+        self.headers = {"Authorization": f"Bearer {AccessToken.for_user(self.admin)}"}
+
+    async def test_send_email_throughput_not_limited_by_smtp_latency(self):
+        """✅ Concurrent async send_email requests overlap their SMTP round trips"""
+        started = time.perf_counter()
+        responses = await asyncio.gather(*[
+            self.async_client.post(
+                reverse('borrowrecord-send-email-async', args=[record.id]),
+                {"subject": "Reminder", "message": "Return the book soon."},
+                content_type="application/json", headers=self.headers,
+            )
+            for record in self.records
+        ])
+        elapsed = time.perf_counter() - started
+        self.assertEqual([r.status_code for r in responses], [200] * self.REQUESTS)
+        self.assertEqual(self.smtp.messages, self.REQUESTS)
+        # Sequential sending would take REQUESTS * SMTP_DELAY = 3s
+        self.assertLess(elapsed, self.REQUESTS * self.SMTP_DELAY / 2)
+
+    async def test_check_due_books_sends_concurrently(self):
+        """✅ Async check_due_books notifies every overdue borrower without waiting on each send"""
+        started = time.perf_counter()
+        response = await self.async_client.get(reverse('borrowrecord-check-due-books-async'), headers=self.headers)
+        elapsed = time.perf_counter() - started
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["message"], f"Sent {self.REQUESTS} notifications for overdue books")
+        self.assertLess(elapsed, self.REQUESTS * self.SMTP_DELAY / 2)
+
+    async def test_send_email_requires_librarian(self):
+        """ Members cannot use the async send_email view"""
+        response = await self.async_client.post(
+            reverse('borrowrecord-send-email-async', args=[self.records[0].id]),
+            {"subject": "x", "message": "y"}, content_type="application/json",
+            headers={"Authorization": f"Bearer {AccessToken.for_user(self.member)}"},
+        )
+        self.assertEqual(response.status_code, 403)
+
+
+class BookEventStreamTests(TestCase):
+
+    def setUp(self):
+        self.member = User.objects.create_user(username="mem", password="x")
+        self.science = Category.objects.create(name="Science")
+        self.history = Category.objects.create(name="History")
+        self.book = Book.objects.create(title="Physics 101", author="Einstein", category=self.science, ISBN="1234567890123")
+        self.other = Book.objects.create(title="Rome", author="Beard", category=self.history, ISBN="1234567890124")
+
+    def test_status_change_is_published_after_commit(self):
+        """✅ Saving a new Book.status publishes one event once the transaction commits"""
+        book = Book.objects.get(pk=self.book.pk)
+        with patch("libraryapp.signals.broker.publish") as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                book.title = "Physics 102"
+                book.save()  # no status change, no event
+                book.status = "borrowed"
+                book.save()
+        publish.assert_called_once()
+        event = publish.call_args.args[0]
+        self.assertEqual((event["book_id"], event["status"], event["previous_status"]), (book.pk, "borrowed", "available"))
+
+    async def test_stream_delivers_filtered_events(self):
+        """✅ SSE clients only receive events for the categories they asked for"""
+        response = await self.async_client.get(
+            reverse('book-events'), {"category": str(self.science.id), "token": str(AccessToken.for_user(self.member))}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = aiter(response.streaming_content)
+        self.assertIn(b": connected", await anext(stream))
+
+        from libraryapp.events import broker
+        broker.publish({"type": "book.status", "book_id": self.other.id, "category_id": self.history.id, "status": "borrowed"})
+        broker.publish({"type": "book.status", "book_id": self.book.id, "category_id": self.science.id, "status": "borrowed"})
+        chunk = (await asyncio.wait_for(anext(stream), timeout=2)).decode()
+        self.assertIn("event: book.status", chunk)
+        self.assertIn(f'"book_id": {self.book.id}', chunk)
+        await stream.aclose()
+
+    async def test_closing_stream_unsubscribes(self):
+        """✅ A disconnected client no longer receives fan-out"""
+        from libraryapp.async_views import book_event_stream
+        from libraryapp.events import broker
+
+        before = broker.subscriber_count()
+        stream = book_event_stream(None, None)
+        await anext(stream)
+        self.assertEqual(broker.subscriber_count(), before + 1)
+        await stream.aclose()
+        self.assertEqual(broker.subscriber_count(), before)
+
+    def test_slow_subscriber_drops_oldest_events(self):
+        """ A full client queue drops its oldest event instead of growing"""
+        from libraryapp.events import Subscription
+
+        async def scenario():
+            subscription = Subscription(asyncio.get_running_loop(), 2)
+            for i in range(3):
+                subscription.push({"id": i})
+            return subscription
+
+        subscription = asyncio.run(scenario())
+        self.assertEqual(subscription.dropped, 1)
+        self.assertEqual(subscription.queue.get_nowait()["id"], 1)
+
+
+class AutocompleteTests(APITestCase):
+
+    def setUp(self):
+        from libraryapp.autocomplete import index
+        self.index = index
+        self.index.clear()
+        self.addCleanup(self.index.clear)  # rolled-back test data must not leak into other tests
+        self.member = User.objects.create_user(username="mem", password="x")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.member)}")
+        self.category = Category.objects.create(name="Science")
+        self.book = Book.objects.create(title="Physics 101", author="Émile Borel", category=self.category, ISBN="1234567890123")
+        Book.objects.create(title="Modern Physics", author="Émile Borel", category=self.category, ISBN="1234567890124")
+
+    def suggest(self, query, **params):
+        response = self.client.get(reverse('book-autocomplete'), {"q": query, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(s["field"], s["text"]) for s in response.data["suggestions"]]
+
+    def test_prefix_matches_titles_words_and_authors(self):
+        """✅ Prefixes match title starts, later title words and authors, ignoring case and accents"""
+        self.assertEqual(self.suggest("PHY"), [("title", "Physics 101"), ("title", "Modern Physics")])
+        # Same author on two books is suggested once
+        self.assertEqual(self.suggest("emile"), [("author", "Émile Borel")])
+        self.assertEqual(self.suggest("phy", limit=1), [("title", "Physics 101")])
+        self.assertEqual(self.suggest(""), [])
+
+    def test_index_follows_saves_and_deletes(self):
+        """✅ After the first build, committed saves and deletes update the index without a rebuild"""
+        self.suggest("phy")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.title = "Quantum Physics"
+            self.book.save()
+            Book.objects.create(title="Quasars", author="Sagan", category=self.category, ISBN="1234567890125")
+        # Shorter completion first, though "quantum" sorts before "quasars"
+        self.assertEqual(self.suggest("qua"), [("title", "Quasars"), ("title", "Quantum Physics")])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.delete()
+        self.assertEqual(self.suggest("qua"), [("title", "Quasars")])
+        self.assertNotIn(("title", "Physics 101"), self.suggest("phy"))
+
+    def test_index_picks_up_changes_from_other_workers(self):
+        """✅ Changes that reached the database without this process's signals show up after a refresh"""
+        from django.db.models import F
+
+        self.assertEqual(self.suggest("phy"), [("title", "Physics 101"), ("title", "Modern Physics")])
+        # As another worker would: no post_save in this process
+        Book.objects.filter(pk=self.book.pk).update(title="Quantum Physics", version=F("version") + 1)
+        self.assertEqual(self.suggest("qua"), [])  # not checked again before AUTOCOMPLETE_REFRESH_SECONDS
+        with self.settings(AUTOCOMPLETE_REFRESH_SECONDS=0):
+            self.assertEqual(self.suggest("qua"), [("title", "Quantum Physics")])
+
+    def test_books_of_deleted_categories_are_left_out(self):
+        """ Books of a category being deleted are not suggested, whether hidden before or after the build"""
+        poetry = Category.objects.create(name="Poetry", is_deleted=True)
+        Book.objects.create(title="Physics of Verse", author="X", category=poetry, ISBN="1234567890125")
+        self.assertNotIn(("title", "Physics of Verse"), self.suggest("phy"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.is_deleted = True
+            self.category.save()
+        self.assertEqual(self.suggest("phy"), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.create(title="Physics 102", author="Y", category=self.category, ISBN="1234567890126")
+        self.assertEqual(self.suggest("phy"), [])
+
+    def test_index_size_is_bounded(self):
+        """ Books beyond AUTOCOMPLETE_MAX_ENTRIES are not indexed"""
+        with self.settings(AUTOCOMPLETE_MAX_ENTRIES=4):
+            self.assertEqual(self.suggest("modern"), [])
+            self.assertLessEqual(len(self.index), 4)
+
+
+class RecommendationTests(APITestCase):
+
+    def setUp(self):
+        state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(state_dir.cleanup)
+        self.state_path = os.path.join(state_dir.name, "state.npz")
+        category = Category.objects.create(name="Science")
+        self.a, self.b, self.c, self.d = [
+            Book.objects.create(title=f"Book {i}", author="X", category=category, ISBN=f"12345678901{i:02d}")
+            for i in range(4)
+        ]
+        self.members = [User.objects.create_user(username=f"mem{i}", password="x") for i in range(3)]
+        for member, books in zip(self.members, [(self.a, self.b, self.c), (self.a, self.b), (self.a, self.c, self.c)]):
+            for book in books:
+                self.loan(member, book)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.members[0])}")
+
+    def loan(self, member, book):
+        BorrowRecord.objects.create(user=member, book=book, due_date=timezone.now())
+
+    def build(self, *args):
+        out = StringIO()
+        call_command("build_recommendations", "--state", self.state_path, *args, stdout=out)
+        return out.getvalue()
+
+    def recommended(self, book):
+        response = self.client.get(reverse('book-recommendations', args=[book.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(item["book"]["id"], item["co_borrowers"]) for item in response.data["recommendations"]]
+
+    def test_full_build_serves_co_borrowed_books(self):
+        """✅ Books borrowed by at least two of the same members are recommended, best match first"""
+        self.build("--full")
+        self.assertEqual(self.recommended(self.a), [(self.b.id, 2), (self.c.id, 2)])
+        self.assertEqual(self.recommended(self.b), [(self.a.id, 2)])  # B-C only has one co-borrower
+        self.assertEqual(self.recommended(self.d), [])
+
+    def test_incremental_refresh_matches_full_build(self):
+        """✅ An incremental run reads only new loans and gives the same result as a rebuild"""
+        from libraryapp import recommendations
+
+        self.build("--full")
+        self.loan(self.members[1], self.c)
+        self.loan(self.members[1], self.c)  # repeat loans count once
+        self.assertIn("Read 2 new loans", self.build())
+        self.assertEqual(self.recommended(self.b), [(self.a.id, 2), (self.c.id, 2)])
+
+        incremental = recommendations.load_state(self.state_path)
+        self.build("--full")
+        full = recommendations.load_state(self.state_path)
+        self.assertEqual((incremental["cooccurrence"] != full["cooccurrence"]).nnz, 0)
+        self.assertEqual(incremental["last_record_id"], full["last_record_id"])
+
+    def test_incremental_refresh_rescores_neighbours_of_changed_books(self):
+        """✅ A new borrower of B changes A's score for B, although A itself gained no loans"""
+        self.build("--full")
+        self.assertEqual(self.recommended(self.a), [(self.b.id, 2), (self.c.id, 2)])  # tie on score
+        self.loan(User.objects.create_user(username="mem3", password="x"), self.b)
+        self.build()
+
+        def stored():
+            return list(BookNeighbour.objects.order_by("book_id", "rank").values_list(
+                "book_id", "neighbour_id", "rank", "co_borrowers", "score"))
+
+        incremental = stored()
+        self.build("--full")
+        self.assertEqual(incremental, stored())
+        self.assertEqual(self.recommended(self.a), [(self.c.id, 2), (self.b.id, 2)])
+
+
+class CirculationAnalyticsTests(APITestCase):
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.librarian = User.objects.create_user(username="lib", password="x", role="librarian")
+        self.member = User.objects.create_user(username="mem", password="x")
+        self.science = Category.objects.create(name="Science")
+        self.history = Category.objects.create(name="History")
+        self.physics = Book.objects.create(title="Physics", author="X", category=self.science, ISBN="1234567890123")
+        self.rome = Book.objects.create(title="Rome", author="Y", category=self.history, ISBN="1234567890124")
+        # Physics: 2 loans this week and 1 twenty days ago; Rome: 1 loan sixty days ago
+        for book, days_ago in [(self.physics, 1), (self.physics, 2), (self.physics, 20), (self.rome, 60)]:
+            self.loan(book, days_ago)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.librarian)}")
+
+    def loan(self, book, days_ago):
+        record = BorrowRecord.objects.create(user=self.member, book=book, due_date=timezone.now())
+        BorrowRecord.objects.filter(pk=record.pk).update(borrow_date=timezone.now() - timedelta(days=days_ago))
+
+    def report(self):
+        response = self.client.get(reverse('borrowrecord-analytics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_rolling_windows_and_demand_curves(self):
+        """✅ Loans are counted per book and category over each rolling window"""
+        report = self.report()
+        self.assertEqual(report["loans_analysed"], 4)
+        self.assertEqual(report["popular_books"]["7"], [{"book_id": self.physics.id, "title": "Physics", "loans": 2}])
+        self.assertEqual([b["book_id"] for b in report["popular_books"]["90"]], [self.physics.id, self.rome.id])
+        science, history = report["categories"]
+        self.assertEqual(science["loans"], {"7": 2, "30": 3, "90": 3})
+        self.assertEqual(history["loans"], {"7": 0, "30": 0, "90": 1})
+        self.assertEqual(science["weekly_loans"][-1], 2)
+        self.assertEqual(sum(history["weekly_loans"]), 1)
+        self.assertEqual(len(science["forecast"]), 4)
+
+    def test_report_is_cached_until_a_new_loan_arrives(self):
+        """✅ The arrays are only rebuilt when a newer BorrowRecord exists"""
+        from libraryapp import analytics
+
+        with patch("libraryapp.analytics.load_loans", wraps=analytics.load_loans) as load:
+            self.report()
+            self.report()
+            self.assertEqual(load.call_count, 1)
+            self.loan(self.rome, 0)
+            self.assertEqual(self.report()["categories"][1]["loans"]["7"], 1)
+            self.assertEqual(load.call_count, 2)
+
+    def test_members_cannot_view_analytics(self):
+        """ Analytics are for librarians and admins only"""
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.member)}")
+        response = self.client.get(reverse('borrowrecord-analytics'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_linear_forecast_follows_trend(self):
+        """✅ The forecast extends each category's recent trend and never goes negative"""
+        import numpy as np
+        from libraryapp.analytics import linear_forecast
+
+        weekly = np.array([[1, 2, 3, 4], [4, 3, 2, 1]])
+        forecast = linear_forecast(weekly, trend_weeks=4, horizon=2)
+        np.testing.assert_allclose(forecast, [[5, 6], [0, 0]])
+
+
+class BorrowRecordArchiveTests(APITestCase):
+
+    def setUp(self):
+        self.librarian = User.objects.create_user(username="lib", password="x", role="librarian")
+        self.member = User.objects.create_user(username="mem", password="x")
+        self.other = User.objects.create_user(username="other", password="x")
+        category = Category.objects.create(name="Science")
+        self.book = Book.objects.create(title="Physics", author="X", category=category, ISBN="1234567890123")
+        long_ago = timezone.now() - timedelta(days=400)
+        self.old_paid = self.loan(self.member, returned=long_ago)
+        self.old_other = self.loan(self.other, returned=long_ago)
+        self.old_unpaid = self.loan(self.member, returned=long_ago, fine_amount=50)
+        self.recent = self.loan(self.member, returned=timezone.now() - timedelta(days=3))
+        self.open = self.loan(self.member)
+
+    def loan(self, user, returned=None, fine_amount=0):
+        record = BorrowRecord.objects.create(user=user, book=self.book, due_date=timezone.now())
+        BorrowRecord.objects.filter(pk=record.pk).update(return_date=returned, fine_amount=fine_amount)
+        return record
+
+    def archive(self, *args):
+        out = StringIO()
+        call_command("archive_borrow_records", "--older-than-days", "365", "--batch-size", "1", *args, stdout=out)
+        return out.getvalue()
+
+    def test_only_old_returned_paid_records_are_moved(self):
+        """✅ Closed, paid loans past the cutoff move to the archive in batches; the rest stay"""
+        self.assertIn("2 borrow records would be archived", self.archive("--dry-run"))
+        self.assertIn("Archived 2 borrow records", self.archive())
+        self.assertEqual(
+            set(BorrowRecord.objects.values_list("id", flat=True)), {self.old_unpaid.id, self.recent.id, self.open.id}
+        )
+        archived = BorrowRecordArchive.objects.get(pk=self.old_paid.pk)
+        self.assertEqual((archived.user, archived.book, archived.fine_paid), (self.member, self.book, False))
+        self.assertIsNotNone(archived.archived_at)
+
+    def test_include_archived_history(self):
+        """✅ Archived loans only show up in the list with ?include_archived=true, scoped like live ones"""
+        self.archive()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.member)}")
+        url = reverse('borrowrecord-list')
+        self.assertEqual(len(self.client.get(url).data), 3)
+        history = self.client.get(url, {"include_archived": "true"}).data
+        self.assertEqual([record["id"] for record in history if "archived_at" in record], [self.old_paid.id])
+        self.assertEqual(history[-1]["book"]["id"], self.book.id)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.librarian)}")
+        self.assertEqual(len(self.client.get(url, {"include_archived": "1"}).data), 5)
+
+    def test_recommendations_still_read_archived_loans(self):
+        """✅ Co-borrowing history includes loans that were archived"""
+        from libraryapp.recommendations import new_loans
+
+        self.archive()
+        last_id, users, books = new_loans(0, chunk_size=100)
+        self.assertEqual(len(users), 5)
+        self.assertEqual(last_id, self.open.id)
+
+
+@override_settings(CATEGORY_DELETE_INLINE_MAX_BOOKS=2, DELETION_BATCH_SIZE=2, DELETION_PAUSE_SECONDS=0)
+class CategoryDeletionTests(APITestCase):
+
+    def setUp(self):
+        self.librarian = User.objects.create_user(username="lib", password="x", role="librarian")
+        self.member = User.objects.create_user(username="mem", password="x")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.librarian)}")
+        self.big = Category.objects.create(name="Science")
+        self.small = Category.objects.create(name="Poetry")
+        books = [
+            Book.objects.create(title=f"Book {i}", author="X", category=self.big, ISBN=f"12345678901{i:02d}")
+            for i in range(5)
+        ]
+        for book in books:
+            BorrowRecord.objects.create(user=self.member, book=book, due_date=timezone.now())
+        Book.objects.create(title="Odes", author="Y", category=self.small, ISBN="1234567890199")
+
+    def test_small_category_is_deleted_inline(self):
+        """✅ Categories under the threshold are still deleted in the request"""
+        response = self.client.delete(reverse('category-detail', args=[self.small.id]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Category.objects.filter(pk=self.small.id).exists())
+
+    def test_large_category_is_deleted_by_background_job(self):
+        """✅ A big category is hidden at once, then deleted in batches with visible progress"""
+        from libraryapp.models import DeletionJob
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(reverse('category-detail', args=[self.big.id]))
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual((response.data["status"], response.data["total_books"]), ("pending", 5))
+
+        job = self.client.get(response["Location"]).data
+        self.assertEqual((job["status"], job["progress"]), ("done", 1.0))
+        self.assertEqual((job["deleted_books"], job["deleted_borrow_records"]), (5, 5))
+        self.assertFalse(Category.objects.filter(pk=self.big.id).exists())
+        self.assertEqual(Book.objects.count(), 1)
+        self.assertEqual(DeletionJob.objects.count(), 1)
+
+    def test_category_is_hidden_until_interrupted_job_is_resumed(self):
+        """✅ Hidden categories and their books leave the API; run_deletion_jobs finishes the job"""
+        with self.captureOnCommitCallbacks(execute=False):
+            self.client.delete(reverse('category-detail', args=[self.big.id]))
+        self.assertEqual([c["id"] for c in self.client.get(reverse('category-list')).data], [self.small.id])
+        self.assertEqual(len(self.client.get(reverse('book-list')).data), 1)
+        self.assertEqual(Book.objects.filter(category=self.big).count(), 5)
+
+        out = StringIO()
+        call_command("run_deletion_jobs", stdout=out)
+        self.assertIn("done, 5 books and 5 borrow records deleted", out.getvalue())
+        self.assertFalse(Category.objects.filter(pk=self.big.id).exists())
+
+    def test_members_cannot_view_deletion_jobs(self):
+        """ Job progress is only visible to librarians and admins"""
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.member)}")
+        self.assertEqual(self.client.get(reverse('deletionjob-list')).status_code, status.HTTP_403_FORBIDDEN)
+
+
+@override_settings(THROTTLE_ENABLED=True)
+class ThrottleTests(APITestCase):
+
+    def setUp(self):
+        self.member = User.objects.create_user(username="mem", password="mem123")
+        category = Category.objects.create(name="Science")
+        Book.objects.create(title="Physics 101", author="Einstein", category=category, ISBN="1234567890123")
+
+    def rates(self, **rates):
+        from django.conf import settings
+        return override_settings(REST_FRAMEWORK={
+            **settings.REST_FRAMEWORK,
+            "DEFAULT_THROTTLE_RATES": {**settings.REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"], **rates},
+        })
+
+    def test_token_attempts_are_limited_per_username(self):
+        """ Repeated logins for one account get 429 with Retry-After, other accounts are unaffected"""
+        url = reverse('token_obtain_pair')
+        with self.rates(token_username="2/min"):
+            for _ in range(2):
+                self.client.post(url, {"username": "mem", "password": "wrong"})
+            response = self.client.post(url, {"username": "mem", "password": "mem123"})
+            self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+            self.assertGreaterEqual(int(response["Retry-After"]), 1)
+            self.assertLessEqual(int(response["Retry-After"]), 120)
+            self.assertEqual(response.data["status_code"], 429)
+            other = self.client.post(url, {"username": "someone", "password": "x"})
+            self.assertEqual(other.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_search_is_limited_per_user_but_plain_lists_are_not(self):
+        """ ?search= has its own, lower limit than plain list requests"""
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.member)}")
+        url = reverse('book-list')
+        with self.rates(search_user="3/min", list_user="100/min"):
+            codes = [self.client.get(url, {"search": "phys"}).status_code for _ in range(4)]
+            self.assertEqual(codes, [200, 200, 200, 429])
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+    def test_counters_roll_over_in_one_row(self):
+        """✅ Each client keeps a single counter row; a new window moves the count to `previous`"""
+        from libraryapp.models import ThrottleCounter
+        from libraryapp.throttles import ListUserThrottle
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.member)}")
+        url = reverse('book-list')
+        with self.rates(list_user="3/min"), patch.object(ListUserThrottle, "timer", return_value=600.0):
+            codes = [self.client.get(url).status_code for _ in range(4)]
+            self.assertEqual(codes, [200, 200, 200, 429])
+        row = ThrottleCounter.objects.get()
+        self.assertEqual((row.window, row.current, row.previous), (10, 3, 0))
+
+        # 30s into the next window the previous 3 requests still weigh 1.5, so two more fit
+        with self.rates(list_user="3/min"), patch.object(ListUserThrottle, "timer", return_value=690.0):
+            codes = [self.client.get(url).status_code for _ in range(3)]
+            self.assertEqual(codes, [200, 200, 429])
+        row = ThrottleCounter.objects.get()
+        self.assertEqual((row.window, row.current, row.previous), (11, 2, 3))
+
+        # The fake clock is long past, so the row counts as idle
+        call_command("purge_throttle_counters", stdout=StringIO())
+        self.assertFalse(ThrottleCounter.objects.exists())
+
+    def test_sliding_window_weighs_previous_window(self):
+        """✅ Requests from the previous window still count, fading out as the window slides"""
+        from libraryapp.throttles import ListUserThrottle
+
+        with self.rates(list_user="10/min"):
+            throttle = ListUserThrottle()
+        self.assertEqual(throttle.estimate(previous=10, current=0, elapsed=15), 7.5)
+        throttle.previous, throttle.current, throttle.elapsed = 10, 5, 15
+        # 10 * (1 - t/60) + 5 < 10  once t > 30
+        self.assertAlmostEqual(throttle.wait(), 15)
+        throttle.previous, throttle.current, throttle.elapsed = 0, 20, 30
+        # next window starts in 30s, then 20 * (1 - t/60) < 10 once t > 30
+        self.assertAlmostEqual(throttle.wait(), 60)
+
+
+@override_settings(READ_REPLICA_ENABLED=True)
+class ReadReplicaRoutingTests(TransactionTestCase):
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        self.member = User.objects.create_user(username="mem", password="x")
+        self.category = Category.objects.create(name="Science")
+        self.book = Book.objects.create(title="Physics 101", author="Einstein", category=self.category, ISBN="1234567890123")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.member)}")
+
+    def test_safe_viewset_reads_use_replica(self):
+        """✅ Book list reads go to the replica connection, borrowing stays on default"""
+        from django.db import connections
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connections["replica"]) as replica, CaptureQueriesContext(connections["default"]) as default:
+            response = self.client.get(reverse('book-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        self.assertTrue(any("libraryapp_book" in q["sql"] for q in replica.captured_queries))
+        self.assertFalse(any("libraryapp_book" in q["sql"] for q in default.captured_queries))
+
+        with CaptureQueriesContext(connections["replica"]) as replica:
+            response = self.client.post(reverse('borrowrecord-list'), {
+                "book_id": self.book.id, "due_date": (timezone.now() + timedelta(days=7)).isoformat(),
+            })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(replica.captured_queries), 0)
+
+    def test_first_write_pins_reads_to_default(self):
+        """✅ After a write, the same request reads from default (read-your-writes)"""
+        from libraryapp.db_router import ReadReplicaRouter, reads_from_replica
+
+        router = ReadReplicaRouter()
+        self.assertEqual(router.db_for_read(Book), "default")
+        with reads_from_replica():
+            self.assertEqual(Book.objects.get(pk=self.book.pk)._state.db, "replica")
+            self.assertEqual(router.db_for_write(Book), "default")
+            self.assertEqual(Book.objects.get(pk=self.book.pk)._state.db, "default")
+
+    def test_benchmark_counts_replica_queries(self):
+        """✅ benchmark_api counts the queries that ran on the replica connection"""
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            call_command('benchmark_api', iterations=2, warmup=0, scenario=['book-list-filtered'],
+                         output=output, baseline='', stdout=StringIO())
+            with open(output) as f:
+                report = json.load(f)
+        self.assertGreater(report['results']['book-list-filtered']['queries_per_op'], 0)
+
+
+class RowCounterTests(APITestCase):
+
+    def setUp(self):
+        self.librarian = User.objects.create_user(username="lib", password="x", role="librarian", is_staff=True)
+        self.member = User.objects.create_user(username="mem", password="x")
+        self.science = Category.objects.create(name="Science")
+        self.poetry = Category.objects.create(name="Poetry")
+        for i in range(5):
+            Book.objects.create(
+                title=f"Book {i}", author="X", category=self.science if i < 3 else self.poetry, ISBN=f"12345678901{i:02d}"
+            )
+
+    def counts(self):
+        from libraryapp.models import RowCount
+
+        return dict(RowCount.objects.exclude(value=0).values_list("name", "value"))
+
+    def rebuilt_counts(self):
+        out = StringIO()
+        call_command("rebuild_counters", stdout=out)
+        return self.counts()
+
+    def test_borrow_return_and_payment_keep_counters_exact(self):
+        """✅ Counters follow borrows, late returns, fine payment and deletes as a full rebuild would"""
+        from libraryapp import counters
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.member)}")
+        book = Book.objects.filter(category=self.science).first()
+        record_id = self.client.post(reverse('borrowrecord-list'), {
+            "book_id": book.id, "due_date": (timezone.now() - timedelta(days=3)).isoformat(),
+        }).data["id"]
+        self.assertEqual(counters.get(counters.loan_key(user=self.member.pk, kind="open")), 1)
+        self.assertEqual(counters.get(counters.book_key(status="borrowed", category=self.science.pk)), 1)
+
+        self.client.post(reverse('borrowrecord-return-book', args=[record_id]))
+        BorrowRecord.objects.filter(pk=record_id).update(fine_paid=False)  # bypasses signals, like manual SQL
+        self.assertEqual(self.rebuilt_counts()[counters.loan_key(kind="unpaid")], 1)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.librarian)}")
+        self.client.post(reverse('borrowrecord-mark-fine-paid', args=[record_id]))
+        Book.objects.filter(category=self.poetry).first().delete()
+        counts = self.counts()
+        self.assertEqual(counts, self.rebuilt_counts())
+        self.assertEqual(counts["books:status:available"], 4)
+        self.assertEqual(counts[f"loans:user:{self.member.pk}"], 1)
+        self.assertNotIn("loans:open", counts)
+        self.assertNotIn("loans:unpaid", counts)
+
+    def test_paginated_book_list_reads_counter_instead_of_count(self):
+        """✅ ?page= lists take their total from the counter for status/category filters, COUNT(*) for search"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.librarian)}")
+        url = reverse('book-list')
+        self.assertEqual(len(self.client.get(url, {"category": self.science.pk}).data), 3)  # unpaginated by default
+
+        with CaptureQueriesContext(connection) as queries:
+            page = self.client.get(url, {"category": self.science.pk, "status": "available", "page_size": 2}).data
+        self.assertEqual((page["count"], len(page["results"])), (3, 2))
+        self.assertIsNotNone(page["next"])
+        self.assertFalse(any("COUNT(" in q["sql"] for q in queries.captured_queries))
+
+        with CaptureQueriesContext(connection) as queries:
+            page = self.client.get(url, {"search": "Book", "page": 1}).data
+        self.assertEqual(page["count"], 5)
+        self.assertTrue(any("COUNT(" in q["sql"] for q in queries.captured_queries))
+
+    def test_paginated_loans_are_scoped_to_member(self):
+        """✅ A member's paginated loans are counted from their own counters; archive mixing is refused"""
+        books = list(Book.objects.all())
+        for book in books[:3]:
+            BorrowRecord.objects.create(user=self.member, book=book, due_date=timezone.now())
+        BorrowRecord.objects.create(user=self.librarian, book=books[3], due_date=timezone.now())
+        record = BorrowRecord.objects.filter(user=self.member).first()
+        record.return_date = timezone.now()
+        record.save()
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.member)}")
+        url = reverse('borrowrecord-list')
+        self.assertEqual(self.client.get(url, {"page": 1}).data["count"], 3)
+        self.assertEqual(self.client.get(url, {"page": 1, "open": "true"}).data["count"], 2)
+        self.assertEqual(self.client.get(url, {"page": 1, "open": "false"}).data["count"], 1)
+        response = self.client.get(url, {"page": 1, "include_archived": "true"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RequestCoalescingTests(TransactionTestCase):
+
+    def setUp(self):
+        self.member = User.objects.create_user(username="mem", password="x")
+        self.category = Category.objects.create(name="Science")
+        for i in range(3):
+            Book.objects.create(title=f"Book {i}", author="X", category=self.category, ISBN=f"12345678901{i:02d}")
+
+    def test_identical_concurrent_lists_run_one_query(self):
+        """✅ Concurrent identical book lists wait on one leader: one book query, same data for all"""
+        from django.db import connections
+        from django.db.models.sql.compiler import SQLCompiler
+        from libraryapp.coalescing import flights
+
+        clients = 5
+        book_queries = []
+        execute_sql = SQLCompiler.execute_sql
+
+        def counting_execute_sql(compiler, *args, **kwargs):
+            if compiler.query.model is Book:
+                book_queries.append(threading.get_ident())
+                # Hold the leader until every other request is waiting on it
+                deadline = time.monotonic() + 5
+                while flights.waiting() < clients - 1 and time.monotonic() < deadline:
+                    time.sleep(0.01)
+            return execute_sql(compiler, *args, **kwargs)
+
+        responses = []
+
+        def fetch(query):
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.member)}")
+            try:
+                responses.append(client.get(reverse('book-list') + query))
+            finally:
+                connections.close_all()
+
+        # Same parameters in a different order are the same request
+        queries = [f"?status=available&category={self.category.id}", f"?category={self.category.id}&status=available"]
+        with patch.object(SQLCompiler, "execute_sql", counting_execute_sql):
+            threads = [threading.Thread(target=fetch, args=(queries[i % 2],)) for i in range(clients)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(book_queries), 1)
+        self.assertEqual([len(response.data) for response in responses], [3] * clients)
+        self.assertEqual(sum(response.has_header("X-Coalesced") for response in responses), clients - 1)
+
+
+class ExceptionLoggingTests(APITestCase):
+
+    def setUp(self):
+        import logging
+
+        self.member = User.objects.create_user(username="mem", password="x")
+        self.logger = logging.getLogger("libraryapp.exception_handler")
+        # Fresh sampling state: other tests log the same errors
+        self.sampler = self.logger.filters[0]
+        self.sampler._windows.clear()
+
+    def test_severity_follows_status_code(self):
+        """✅ 404 is INFO, 401 WARNING; records carry structured fields and are formatted lazily"""
+        with self.assertLogs(self.logger, level="INFO") as logs:
+            self.client.get(reverse('book-list'))
+            self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.member)}")
+            self.client.get(reverse('borrowrecord-detail', args=[999]))
+        unauthenticated, not_found = logs.records
+        self.assertEqual((unauthenticated.levelname, unauthenticated.status_code), ("WARNING", 401))
+        self.assertEqual((not_found.levelname, not_found.status_code, not_found.view), ("INFO", 404, "BorrowRecordViewSet"))
+        self.assertEqual(not_found.user_id, self.member.pk)
+        self.assertIn("GET /api/borrow-records/999/ -> 404 Http404", not_found.getMessage())
+        self.assertIsInstance(not_found.args[-1], Exception)  # not pre-formatted
+
+    def test_unhandled_errors_are_logged_with_traceback(self):
+        """✅ Exceptions DRF does not handle are ERROR records with exc_info, never sampled"""
+        from libraryapp.exception_handler import custom_exception_handler
+
+        with self.assertLogs(self.logger, level="INFO") as logs:
+            for _ in range(self.sampler.burst + 2):
+                try:
+                    raise KeyError("boom")
+                except KeyError as exc:
+                    response = custom_exception_handler(exc, {"view": None, "request": None})
+        self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        self.assertEqual(len(logs.records), self.sampler.burst + 2)
+        self.assertEqual(logs.records[0].levelname, "ERROR")
+        self.assertIsNotNone(logs.records[0].exc_info)
+
+    def test_repeated_client_errors_are_sampled(self):
+        """✅ Beyond the burst, identical client errors are dropped and counted in the next window"""
+        import logging
+        from libraryapp.logging_utils import SampleRepeatsFilter
+
+        sampler = SampleRepeatsFilter(burst=2, window=0.05)
+
+        def record():
+            return logging.LogRecord("x", logging.INFO, __file__, 1, "%s failed", ("GET",), None)
+
+        records = [record() for _ in range(5)]
+        for r in records:
+            r.sample_key = (404, "BookViewSet", "NotFound")
+        self.assertEqual([sampler.filter(r) for r in records], [True, True, False, False, False])
+        unkeyed = record()
+        self.assertTrue(sampler.filter(unkeyed))
+
+        time.sleep(0.06)
+        later = record()
+        later.sample_key = (404, "BookViewSet", "NotFound")
+        self.assertTrue(sampler.filter(later))
+        self.assertEqual(later.getMessage(), "GET failed (3 similar suppressed)")
+
+
+class AccountSummaryTests(APITestCase):
+
+    def setUp(self):
+        self.member = User.objects.create_user(username="mem", password="x")
+        other = User.objects.create_user(username="other", password="x")
+        category = Category.objects.create(name="Science")
+        books = [
+            Book.objects.create(title=f"Book {i}", author="X", category=category, ISBN=f"12345678901{i:02d}")
+            for i in range(5)
+        ]
+        now = timezone.now()
+        self.next_due = now + timedelta(days=3)
+        BorrowRecord.objects.create(user=self.member, book=books[0], due_date=self.next_due)
+        BorrowRecord.objects.create(user=self.member, book=books[1], due_date=now + timedelta(days=9))
+        BorrowRecord.objects.create(user=self.member, book=books[2], due_date=now - timedelta(days=2))  # overdue
+        BorrowRecord.objects.create(
+            user=self.member, book=books[3], due_date=now - timedelta(days=20), return_date=now - timedelta(days=16),
+        )  # returned 5 days late: fine 50, unpaid
+        paid = BorrowRecord.objects.create(
+            user=self.member, book=books[4], due_date=now - timedelta(days=30), return_date=now - timedelta(days=29),
+        )
+        BorrowRecord.objects.filter(pk=paid.pk).update(fine_paid=True)  # fine 20, paid
+        BorrowRecord.objects.create(user=other, book=books[0], due_date=now - timedelta(days=5))
+
+    def test_summary_in_one_aggregate_query(self):
+        """✅ Profile, loan counts, next due date and fine totals come back from one query"""
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.member)}")
+        with self.assertNumQueries(2):  # JWT user lookup + the aggregate
+            response = self.client.get(reverse('user-summary'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data
+        self.assertEqual(data["user"]["username"], "mem")
+        self.assertEqual(
+            (data["total_loans"], data["active_loans"], data["overdue_loans"], data["unpaid_fines"]), (5, 3, 1, 1)
+        )
+        self.assertEqual((data["outstanding_fines"], data["fines_paid"]), ("50.00", "20.00"))
+        self.assertEqual(data["next_due_date"], self.next_due.isoformat().replace("+00:00", "Z"))
+
+    def test_summary_requires_login(self):
+        """ Anonymous callers get 401"""
+        self.assertEqual(self.client.get(reverse('user-summary')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class CatalogSnapshotTests(APITestCase):
+
+    def setUp(self):
+        self.snapshot_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.snapshot_dir.cleanup)
+        settings = override_settings(
+            CATALOG_SNAPSHOT_DIR=self.snapshot_dir.name, CATALOG_SEGMENT_SIZE=2,
+            CATALOG_AUTO_REFRESH=True, CATALOG_REFRESH_DELAY_SECONDS=0,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.member = User.objects.create_user(username="mem", password="x")
+        self.category = Category.objects.create(name="Science")
+        self.books = [
+            Book.objects.create(title=f"Book {i}", author="Ädam", category=self.category, ISBN=f"12345678901{i:02d}")
+            for i in range(5)
+        ]
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.member)}")
+
+    def download(self, **headers):
+        import gzip
+
+        response = self.client.get(reverse('book-catalog'), HTTP_ACCEPT_ENCODING="gzip, br", **headers)
+        body = b"".join(response.streaming_content) if response.status_code == 200 else b""
+        return response, json.loads(gzip.decompress(body)) if body else None
+
+    def test_snapshot_is_served_pre_gzipped_with_version_etag(self):
+        """✅ The full build is a valid gzip of the catalog (no status), revalidated by ETag"""
+        self.assertEqual(self.client.get(reverse('book-catalog')).status_code, status.HTTP_404_NOT_FOUND)
+        out = StringIO()
+        call_command("build_catalog_snapshot", stdout=out)
+        self.assertIn("Catalog snapshot v1", out.getvalue())
+
+        response, snapshot = self.download()
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(snapshot["categories"], [[self.category.id, "Science"]])
+        self.assertEqual(snapshot["book_fields"], ["id", "title", "author", "category", "ISBN"])
+        self.assertEqual(snapshot["books"][0], [self.books[0].id, "Book 0", "Ädam", self.category.id, "1234567890100"])
+        self.assertEqual(len(snapshot["books"]), 5)
+
+        cached = self.client.get(reverse('book-catalog'), HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        plain = self.client.get(reverse('book-catalog'))
+        body = b"".join(plain.streaming_content)
+        self.assertNotIn("Content-Encoding", plain)
+        self.assertEqual(int(plain["Content-Length"]), len(body))
+        self.assertEqual(json.loads(body)["books"], snapshot["books"])
+
+    def test_manifest_read_before_two_refreshes_still_serves(self):
+        """✅ A version removed between reading the manifest and opening its file falls back to the latest"""
+        from libraryapp import catalog
+
+        stale = catalog.build_full()
+        catalog.build_full()
+        catalog.build_full()  # removes version 1
+        with patch("libraryapp.catalog.current", side_effect=[stale, catalog.current()]):
+            response, snapshot = self.download()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response["ETag"], snapshot["version"]), ('"catalog-3"', 3))
+
+    def test_snapshot_removed_after_manifest_read_is_404(self):
+        """ A snapshot directory cleared between reading the manifest and opening the file gives 404, not 500"""
+        import shutil
+        from libraryapp import catalog
+
+        stale = catalog.build_full()
+        shutil.rmtree(self.snapshot_dir.name)
+        with patch("libraryapp.catalog.current", side_effect=[stale, None]):
+            response, _ = self.download()
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_changes_refresh_only_their_segment(self):
+        """✅ Edits, additions and deletes produce a new version; status changes and other segments are untouched"""
+        from libraryapp import catalog
+
+        catalog.build_full()
+        segments = {index: os.path.getmtime(catalog.segment_path(index)) for index in catalog.segment_indexes()}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.books[0].status = "borrowed"
+            self.books[0].save()
+        self.assertEqual(catalog.current()["version"], 1)
+
+        time.sleep(0.01)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.books[4].title = "Renamed"
+            self.books[4].save()
+        deleted_id = self.books[3].id
+        with self.captureOnCommitCallbacks(execute=True):
+            self.books[3].delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            added = Book.objects.create(title="New", author="Y", category=self.category, ISBN="1234567890199")
+        response, snapshot = self.download()
+        self.assertEqual(response["X-Catalog-Version"], "4")
+        self.assertEqual([book[1] for book in snapshot["books"]], ["Book 0", "Book 1", "Book 2", "Renamed", "New"])
+        changed = {self.books[4].id // 2, deleted_id // 2, added.id // 2}
+        for index, modified in segments.items():
+            if index not in changed:
+                self.assertEqual(os.path.getmtime(catalog.segment_path(index)), modified)
+
+
+class BulkUserImportTests(APITestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_user(username="boss", password="x", is_staff=True, role="admin")
+        User.objects.create_user(username="taken", email="Taken@Example.com", password="x")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.admin)}")
+
+    @override_settings(USER_IMPORT_WORKERS=1, USER_IMPORT_BATCH_SIZE=2)
+    def test_valid_rows_created_and_duplicates_reported_per_row(self):
+        """✅ Valid rows are created in batches; duplicates in the file or the database are reported by row"""
+        rows = [
+            {"username": "ana", "email": "ana@example.com", "password": "pw-ana"},
+            {"username": "ben", "email": "ben@example.com", "password": "pw-ben", "role": "librarian"},
+            {"username": "ana", "email": "ana2@example.com", "password": "x"},          # username of row 1
+            {"username": "cal", "email": "BEN@example.com", "password": "x"},           # email of row 2
+            {"username": "taken", "email": "new@example.com", "password": "x"},         # existing username
+            {"username": "dee", "email": "taken@example.com", "password": "x"},         # existing email
+            {"username": "eve", "email": "not-an-email", "password": "x"},
+        ]
+        response = self.client.post(reverse('user-bulk-import'), {"users": rows}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data["rows"], response.data["created"]), (7, 2))
+        errors = {error["row"]: error for error in response.data["errors"]}
+        self.assertEqual(sorted(errors), [3, 4, 5, 6, 7])
+        self.assertEqual(errors[3]["errors"]["username"], ["Duplicate of row 1."])
+        self.assertEqual(errors[4]["errors"]["email"], ["Duplicate of row 2."])
+        self.assertIn("username", errors[5]["errors"])
+        self.assertIn("email", errors[6]["errors"])
+        self.assertIn("email", errors[7]["errors"])
+        self.assertEqual(errors[7]["username"], "eve")
+
+        ben = User.objects.get(username="ben")
+        self.assertEqual(ben.role, "librarian")
+        self.assertTrue(ben.check_password("pw-ben"))
+        self.assertTrue(User.objects.get(username="ana").check_password("pw-ana"))
+
+    def test_import_is_admin_only(self):
+        """ Members cannot import users; empty and oversized lists are rejected"""
+        member = User.objects.create_user(username="mem", password="x")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(member)}")
+        response = self.client.post(reverse('user-bulk-import'), {"users": []}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.admin)}")
+        response = self.client.post(reverse('user-bulk-import'), {"users": []}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        with override_settings(USER_IMPORT_MAX_ROWS=1):
+            rows = [{"username": f"u{i}", "email": f"u{i}@example.com", "password": "x"} for i in range(2)]
+            response = self.client.post(reverse('user-bulk-import'), {"users": rows}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("import_users", str(response.data["details"]["users"]))
+
+    def test_process_pool_hashes_match(self):
+        """✅ Hashes made in worker processes verify like make_password()'s, in input order"""
+        hashes = hash_passwords(["first", "second", "third", "fourth"], workers=2)
+        self.assertTrue(all(check_password(password, encoded) for password, encoded in
+                            zip(["first", "second", "third", "fourth"], hashes)))
+        self.assertFalse(check_password("second", hashes[0]))
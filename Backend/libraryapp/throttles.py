@@ -0,0 +1,147 @@
+# libraryapp/throttles.py
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.throttling import SimpleRateThrottle
+
+from .instrumentation import current_metrics
+from .models import ThrottleCounter
+
+"""
+Throttles that keep a few clients from saturating the workers with PBKDF2 logins, searches and
+unpaginated list requests. Rates live in REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'].
+
+->Sliding-window counters: the counts of the current and the previous window. The request count over
+  the last `duration` seconds is estimated as
+      previous_window * (1 - elapsed / duration) + current_window
+  (DRF's own throttles keep a list of every request timestamp instead).
+->Counters live in the ThrottleCounter table, one row per (scope, client) that is moved on to the next
+  window in place, so they are shared by every worker and the table never grows past the number of
+  active clients. A request costs one upsert that counts it, rolls the window over if needed and
+  returns both counts; a denied request takes its count back with an update. The upsert is atomic, so simultaneous requests from
+  one client are never under-counted. `manage.py purge_throttle_counters` deletes idle clients' rows.
+->Denied requests get 429 with a Retry-After header (seconds until the estimate drops below the limit).
+->THROTTLE_ENABLED = False turns every throttle off (the default under `manage.py test`).
+"""
+
+
+class SlidingWindowThrottle(SimpleRateThrottle):
+    cache_format = 'throttle:%(scope)s:%(ident)s'
+
+    def get_rate(self):
+        # Read at request time, so override_settings / per-deployment rates apply
+        return settings.REST_FRAMEWORK.get('DEFAULT_THROTTLE_RATES', {}).get(self.scope) or super().get_rate()
+
+    def allow_request(self, request, view):
+        if not settings.THROTTLE_ENABLED or self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        window = int(self.now // self.duration)
+        self.elapsed = self.now - window * self.duration
+        # Both counts are stale once the window after this one has passed
+        expires_at = datetime.fromtimestamp((window + 2) * self.duration, tz=timezone.utc)
+
+        connection = connections[DEFAULT_DB_ALIAS]
+        quote = connection.ops.quote_name
+        table = quote(ThrottleCounter._meta.db_table)
+        key, window_, current, previous = (quote(name) for name in ('key', 'window', 'current', 'previous'))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} ({key}, {window_}, {current}, {previous}, {quote('expires_at')}) "
+                f"VALUES (%s, %s, 1, 0, %s) "
+                f"ON CONFLICT ({key}) DO UPDATE SET "
+                f"{previous} = CASE WHEN {table}.{window_} = excluded.{window_} THEN {table}.{previous} "
+                f"WHEN {table}.{window_} = excluded.{window_} - 1 THEN {table}.{current} ELSE 0 END, "
+                f"{current} = CASE WHEN {table}.{window_} = excluded.{window_} THEN {table}.{current} + 1 ELSE 1 END, "
+                f"{window_} = excluded.{window_}, {quote('expires_at')} = excluded.{quote('expires_at')} "
+                f"RETURNING {current}, {previous}",
+                [self.key, window, connection.ops.adapt_datetimefield_value(expires_at)],
+            )
+            counted, self.previous = cursor.fetchone()
+            self.current = counted - 1  # the requests before this one
+            allowed = self.estimate(self.previous, self.current, self.elapsed) < self.num_requests
+            if not allowed:  # denied requests are not counted
+                cursor.execute(f"UPDATE {table} SET {current} = {current} - 1 WHERE {key} = %s", [self.key])
+        metrics = current_metrics()
+        if metrics is not None:
+            metrics.throttle_queries += 1 if allowed else 2
+        return allowed
+
+    def estimate(self, previous, current, elapsed):
+        return previous * (1 - elapsed / self.duration) + current
+
+    def wait(self):
+        """Seconds until the estimate drops below the limit again (DRF rounds it up for Retry-After)."""
+        limit = self.num_requests
+        if self.current >= limit:
+            # Not before the next window, where this window's count becomes `previous`
+            return (self.duration - self.elapsed) + self.duration * (1 - limit / self.current)
+        # Solve previous * (1 - t / duration) + current < limit for t
+        return max(self.duration * (1 - (limit - self.current) / self.previous) - self.elapsed, 1)
+
+
+def client_ident(throttle, request):
+    """Authenticated user id, or the client IP (honours NUM_PROXIES like DRF) for anonymous requests."""
+    if request.user and request.user.is_authenticated:
+        return f'user-{request.user.pk}'
+    return f'ip-{throttle.get_ident(request)}'
+
+
+# -------------------------------------------------------------------------
+# POST /api/token/ — every attempt runs a password hash
+# -------------------------------------------------------------------------
+class TokenIPThrottle(SlidingWindowThrottle):
+    """Login attempts per client IP."""
+    scope = 'token_ip'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class TokenUsernameThrottle(SlidingWindowThrottle):
+    """Login attempts per target account, whatever IPs they come from."""
+    scope = 'token_username'
+
+    def get_cache_key(self, request, view):
+        username = request.data.get('username') if hasattr(request.data, 'get') else None
+        if not username:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': str(username).strip().lower()[:150]}
+
+
+# -------------------------------------------------------------------------
+# Search and list routes (installed as DEFAULT_THROTTLE_CLASSES; they skip every other action)
+# -------------------------------------------------------------------------
+class SearchUserThrottle(SlidingWindowThrottle):
+    """?search= list requests per user (per IP when anonymous)."""
+    scope = 'search_user'
+
+    def get_cache_key(self, request, view):
+        if getattr(view, 'action', None) != 'list' or not request.query_params.get('search'):
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': client_ident(self, request)}
+
+
+class SearchIPThrottle(SlidingWindowThrottle):
+    """?search= list requests per IP, so one address cannot spread its load over many accounts."""
+    scope = 'search_ip'
+
+    def get_cache_key(self, request, view):
+        if getattr(view, 'action', None) != 'list' or not request.query_params.get('search'):
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class ListUserThrottle(SlidingWindowThrottle):
+    """Any list request per user (per IP when anonymous)."""
+    scope = 'list_user'
+
+    def get_cache_key(self, request, view):
+        if getattr(view, 'action', None) != 'list':
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': client_ident(self, request)}
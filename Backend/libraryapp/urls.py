@@ -4,7 +4,8 @@
 from django.urls import path, include
 # Default Router -> Automatically generates all the standard CRUD URL routes for the ModelViewSets
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import views, async_views
+from .throttles import TokenIPThrottle, TokenUsernameThrottle
 # They generate and refresh JSON web tokens (JWTs) for secure login and authentication
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
@@ -34,11 +35,20 @@ router.register(r'users', views.UserViewSet)
 router.register(r'books', views.BookViewSet)
 router.register(r'borrow-records', views.BorrowRecordViewSet)
 router.register(r'categories', views.CategoryViewSet)
+router.register(r'deletion-jobs', views.DeletionJobViewSet)
 
 urlpatterns = [
+    # Server-Sent Events stream of book status changes (async, served through asgi.py).
+    # Must come before the router, whose books/<pk>/ route would otherwise match it.
+    path('books/events/', async_views.book_events, name='book-events'),
+
     # Includes all automatically generated URLs from our router
     path('', include(router.urls)),
 
+    # Async (ASGI) versions of the SMTP-bound borrow-record actions, see async_views.py
+    path('async/borrow-records/<int:pk>/send_email/', async_views.send_email, name='borrowrecord-send-email-async'),
+    path('async/borrow-records/check_due_books/', async_views.check_due_books, name='borrowrecord-check-due-books-async'),
+
     # Enables login/logout views for the browsable DRF API
     path('api-auth/', include('rest_framework.urls', namespace='rest_framework')),
 
@@ -54,7 +64,9 @@ urlpatterns = [
     #   "refresh": "refresh_token"
     # }
     # This endpoint generates JWT tokens upon successful login
-    path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    # Throttled per IP and per username: every attempt costs a PBKDF2 hash (see throttles.py)
+    path('api/token/', TokenObtainPairView.as_view(throttle_classes=[TokenIPThrottle, TokenUsernameThrottle]),
+         name='token_obtain_pair'),
 
     # ✅ Chandan: Refresh your access token without logging in again
     # Send:
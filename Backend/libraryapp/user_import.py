@@ -0,0 +1,128 @@
+# libraryapp/user_import.py
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
+
+from .models import User
+from .password_hashing import hash_passwords
+from .serializers import UserImportRowSerializer
+
+"""
+Bulk user import for semester enrolment: POST /api/users/bulk_import/ and `manage.py import_users`.
+
+->Every row is checked on its own and rejected rows are reported by position (1-based), with the reason:
+  invalid fields, a username or email repeated earlier in the same import ("Duplicate of row N."),
+  or one that already exists. Existence is checked with two queries per batch, not per row.
+  Emails are compared case-insensitively, usernames exactly (like the unique constraint).
+->Passwords of the accepted rows are hashed across a process pool (password_hashing.py), then the users
+  are inserted with bulk_create, one transaction per USER_IMPORT_BATCH_SIZE rows.
+->If a batch still hits the unique constraint (someone registered the same username in the meantime),
+  that batch is retried row by row so only the clashing rows are reported.
+->bulk_create skips save() and model signals; nothing in this app listens to User saves.
+"""
+
+
+def batched(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def check_rows(rows):
+    """Validates the rows; returns ([(row number, data), ...] accepted, {row number: errors})."""
+    accepted, errors = [], {}
+    usernames, emails = {}, {}
+    for number, row in enumerate(rows, start=1):
+        serializer = UserImportRowSerializer(data=row)
+        if not serializer.is_valid():
+            errors[number] = serializer.errors
+            continue
+        data = serializer.validated_data
+        problems = {}
+        if data['username'] in usernames:
+            problems['username'] = [f"Duplicate of row {usernames[data['username']]}."]
+        if data['email'].lower() in emails:
+            problems['email'] = [f"Duplicate of row {emails[data['email'].lower()]}."]
+        if problems:
+            errors[number] = problems
+            continue
+        usernames[data['username']] = number
+        emails[data['email'].lower()] = number
+        accepted.append((number, data))
+    return accepted, errors
+
+
+def check_existing(accepted, errors, batch_size):
+    """Drops the rows whose username or email is already taken; returns the rest."""
+    free = []
+    for batch in batched(accepted, batch_size):
+        taken_usernames = set(User.objects.filter(
+            username__in=[data['username'] for _, data in batch]
+        ).values_list('username', flat=True))
+        taken_emails = set(User.objects.annotate(email_lower=Lower('email')).filter(
+            email_lower__in=[data['email'].lower() for _, data in batch]
+        ).values_list('email_lower', flat=True))
+        for number, data in batch:
+            problems = {}
+            if data['username'] in taken_usernames:
+                problems['username'] = ["A user with that username already exists."]
+            if data['email'].lower() in taken_emails:
+                problems['email'] = ["A user with that email already exists."]
+            if problems:
+                errors[number] = problems
+            else:
+                free.append((number, data))
+    return free
+
+
+def insert(batch, errors):
+    """bulk_create for one batch of (row number, User); returns the number of users created."""
+    try:
+        with transaction.atomic():
+            User.objects.bulk_create([user for _, user in batch])
+        return len(batch)
+    except IntegrityError:
+        pass
+    created = 0
+    for number, user in batch:
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create([user])
+            created += 1
+        except IntegrityError:
+            errors[number] = {'username': ["A user with that username already exists."]}
+    return created
+
+
+def import_users(rows, batch_size=None, workers=None, dry_run=False):
+    """
+    Creates a user for every valid row of `rows` (dicts with username, email, password and role).
+    Returns {'rows', 'created', 'errors': [{'row', 'username', 'errors'}, ...]}; with dry_run nothing
+    is hashed or written and 'created' counts the rows that would be.
+    """
+    rows = list(rows)
+    batch_size = batch_size or settings.USER_IMPORT_BATCH_SIZE
+    accepted, errors = check_rows(rows)
+    accepted = check_existing(accepted, errors, batch_size)
+
+    if dry_run:
+        created = len(accepted)
+    else:
+        hashes = hash_passwords([data['password'] for _, data in accepted], workers=workers)
+        users = [
+            (number, User(username=data['username'], email=data['email'], role=data['role'], password=password))
+            for (number, data), password in zip(accepted, hashes)
+        ]
+        created = sum(insert(batch, errors) for batch in batched(users, batch_size))
+
+    return {
+        'rows': len(rows),
+        'created': created,
+        'errors': [
+            {
+                'row': number,
+                'username': rows[number - 1].get('username') if isinstance(rows[number - 1], dict) else None,
+                'errors': errors[number],
+            }
+            for number in sorted(errors)
+        ],
+    }
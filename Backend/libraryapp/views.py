@@ -7,20 +7,39 @@
 
 from rest_framework import viewsets
 from django.shortcuts import render
-from .models import User, Book, BorrowRecord, Category
+from .models import User, Book, BookNeighbour, BorrowRecord, BorrowRecordArchive, Category, DeletionJob
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from .utils import send_due_notification
 from django.utils import timezone
-from .serializers import UserSerializer, BookSerializer, BorrowRecordSerializer, CategorySerializer
+from .serializers import (
+    UserSerializer, AccountSummarySerializer, BookSerializer, BookNeighbourSerializer, BorrowRecordSerializer,
+    BorrowRecordArchiveSerializer, CategorySerializer, DeletionJobSerializer,
+)
 from rest_framework import filters
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.exceptions import ValidationError
-from .permissions import IsAdminOrLibrarian
+from .permissions import IsAdminOrLibrarian, IsLibraryStaff
+from .idempotency import idempotent
+from .concurrency import etag_for, update_or_raise
 from rest_framework import status
 from django.core.mail import send_mail
 from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.views.decorators.http import require_GET
+from .metrics import registry, render_prometheus
+from .autocomplete import index as autocomplete_index
+from . import catalog as catalog_snapshot
+from .deletion import start_category_deletion
+from .db_router import ReplicaReadMixin
+from .coalescing import CoalescedListMixin
+from .pagination import filter_params
+from . import counters
+from .user_import import import_users
+from django.urls import reverse
+from django.db import transaction
+from django.db.models import Count, Min, Q, Sum
 
 # -------------------------------------------------------------------------
 # ModelViewSet is a powerful abstraction in Django REST Framework that automatically
@@ -65,6 +84,52 @@ class UserViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(request.user)
         return Response(serializer.data)
 
+    # ---------------------------------------------------------------------
+    # GET /users/summary/
+    # Member home screen in one call: the profile plus active/overdue loans,
+    # next due date and fine totals, from a single aggregate query over the
+    # user's borrow records. Archived loans (archive.py) are returned and paid,
+    # so only total_loans and fines_paid leave out that older history.
+    # ---------------------------------------------------------------------
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def summary(self, request):
+        now = timezone.now()
+        active = Q(return_date__isnull=True)
+        unpaid = Q(fine_amount__gt=0, fine_paid=False)
+        totals = BorrowRecord.objects.filter(user=request.user).aggregate(
+            total_loans=Count('id'),
+            active_loans=Count('id', filter=active),
+            overdue_loans=Count('id', filter=active & Q(due_date__lt=now)),
+            next_due_date=Min('due_date', filter=active & Q(due_date__gte=now)),
+            unpaid_fines=Count('id', filter=unpaid),
+            outstanding_fines=Sum('fine_amount', filter=unpaid, default=0),
+            fines_paid=Sum('fine_amount', filter=Q(fine_amount__gt=0, fine_paid=True), default=0),
+        )
+        return Response(AccountSummarySerializer({'user': request.user, **totals}).data)
+
+    # ---------------------------------------------------------------------
+    # POST /users/bulk_import/   {"users": [{"username", "email", "password", "role"}, ...]}
+    # Admin only. Enrols a list of users at once: passwords are hashed on
+    # every core and users inserted in batches (see user_import.py).
+    # Each rejected row is reported with its position and the reasons; the
+    # valid rows are still created. 201 if any user was created, else 400.
+    # Hashing runs inside the request (~0.1-0.5 s of CPU per password), so a
+    # request takes at most USER_IMPORT_MAX_ROWS rows; larger lists go
+    # through `manage.py import_users`.
+    # ---------------------------------------------------------------------
+    @action(detail=False, methods=['post'])
+    def bulk_import(self, request):
+        rows = request.data.get('users') if isinstance(request.data, dict) else request.data
+        if not isinstance(rows, list) or not rows:
+            raise ValidationError({'users': 'Expected a non-empty list of users.'})
+        if len(rows) > settings.USER_IMPORT_MAX_ROWS:
+            raise ValidationError({'users': (
+                f'At most {settings.USER_IMPORT_MAX_ROWS} users per request; '
+                'import larger lists with `manage.py import_users`.'
+            )})
+        report = import_users(rows)
+        return Response(report, status=status.HTTP_201_CREATED if report['created'] else status.HTTP_400_BAD_REQUEST)
+
     # ---------------------------------------------------------------------
     # Dynamic permissions based on the action being performed
     # ---------------------------------------------------------------------
@@ -73,7 +138,7 @@ class UserViewSet(viewsets.ModelViewSet):
             permission_classes = [AllowAny]  # Registration allowed for anyone
         elif self.action == 'list':
             permission_classes = [IsAdminOrLibrarian]
-        elif self.action in ['retrieve', 'update', 'partial_update', 'me']:
+        elif self.action in ['retrieve', 'update', 'partial_update', 'me', 'summary']:
             permission_classes = [IsAuthenticated]
         elif self.action == 'destroy':
             permission_classes = [IsAdminOrLibrarian]
@@ -92,9 +157,11 @@ class UserViewSet(viewsets.ModelViewSet):
 #   update() → PUT /books/<id>/ → full update
 #   partial_update() → PATCH /books/<id>/ → partial update
 #   destroy() → DELETE /books/<id>/ → delete book
+# Identical list requests in flight at the same time share one query (coalescing.py).
 # -------------------------------------------------------------------------
-class BookViewSet(viewsets.ModelViewSet):
-    queryset = Book.objects.all()
+class BookViewSet(CoalescedListMixin, ReplicaReadMixin, viewsets.ModelViewSet):
+    queryset = Book.objects.filter(category__is_deleted=False)  # books of categories being deleted are hidden
+    replica_actions = ('list', 'retrieve', 'autocomplete', 'recommendations')  # read from the replica (db_router.py)
     serializer_class = BookSerializer
     filter_backends = [filters.SearchFilter, DjangoFilterBackend, filters.OrderingFilter]
     search_fields = ['title', 'author', 'ISBN']  # Enables ?search=
@@ -102,14 +169,113 @@ class BookViewSet(viewsets.ModelViewSet):
     ordering_fields = ['title', 'author']  # Enables ordering
     permission_classes = [IsAdminOrLibrarian]
 
+    # ---------------------------------------------------------------------
+    # Optimistic concurrency (see concurrency.py):
+    # GET returns the row version as ETag, PUT/PATCH accept it back as If-Match
+    # and only write if nobody changed the book in between.
+    # ---------------------------------------------------------------------
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        response['ETag'] = etag_for(response.data['version'])
+        return response
+
+    def update(self, request, *args, **kwargs):
+        response = super().update(request, *args, **kwargs)
+        response['ETag'] = etag_for(response.data['version'])
+        return response
+
+    def perform_update(self, serializer):
+        update_or_raise(self.request, serializer.instance, **serializer.validated_data)
+
+    # ---------------------------------------------------------------------
+    # GET /books/?page=2&status=available&category=3
+    # Paginated lists read their total from the counters kept by counters.py
+    # when filtered by status and/or category only. Anything else (?search=),
+    # or any category being deleted in the background, falls back to COUNT(*).
+    # ---------------------------------------------------------------------
+    def counter_key(self, request):
+        params = filter_params(request)
+        if params.keys() - {'status', 'category'} or Category.objects.filter(is_deleted=True).exists():
+            return None
+        category = params.get('category')
+        return counters.book_key(status=params.get('status') or None, category=int(category) if category else None)
+
+    # ---------------------------------------------------------------------
+    # GET /api/books/autocomplete/?q=phy&limit=10
+    # Any logged-in user — title/author suggestions for the search box,
+    # answered from the in-memory prefix index (see autocomplete.py)
+    # ---------------------------------------------------------------------
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        query = request.query_params.get('q', '')
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            raise ValidationError({'limit': 'Must be an integer.'})
+        limit = max(1, min(limit, settings.AUTOCOMPLETE_MAX_RESULTS))
+        return Response({'query': query, 'suggestions': autocomplete_index.suggest(query, limit)})
+
+    # ---------------------------------------------------------------------
+    # GET /api/books/catalog/
+    # Any logged-in user — the whole catalog (books without status, plus
+    # categories) as one pre-gzipped JSON file, sent straight from disk
+    # (see catalog.py). ETag is the snapshot version: If-None-Match gets 304.
+    # ---------------------------------------------------------------------
+    @action(detail=False, methods=['get'])
+    def catalog(self, request):
+        missing = Response({'detail': 'No catalog snapshot has been built yet.'}, status=status.HTTP_404_NOT_FOUND)
+        manifest = catalog_snapshot.current()
+        if manifest is None:
+            return missing
+        if request.headers.get('If-None-Match') == f'"catalog-{manifest["version"]}"':
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            manifest, snapshot = catalog_snapshot.open_current(manifest)
+            if manifest is None:
+                return missing
+            if 'gzip' in request.headers.get('Accept-Encoding', ''):
+                response = FileResponse(snapshot, content_type='application/json')
+                response['Content-Encoding'] = 'gzip'
+            else:
+                # Rare: clients that cannot take gzip get it inflated on the fly. A generator, so
+                # FileResponse does not inflate the whole file first to measure it
+                response = FileResponse(catalog_snapshot.inflate(snapshot), content_type='application/json')
+                response['Content-Length'] = manifest['uncompressed_size']
+        response['ETag'] = f'"catalog-{manifest["version"]}"'
+        response['X-Catalog-Version'] = manifest['version']
+        response['Cache-Control'] = 'no-cache'  # revalidate: the ETag check is cheap
+        response['Vary'] = 'Accept-Encoding'
+        return response
+
+    # ---------------------------------------------------------------------
+    # GET /api/books/{id}/recommendations/?limit=10
+    # Any logged-in user — "members who borrowed this also borrowed",
+    # precomputed by `manage.py build_recommendations` (see recommendations.py)
+    # ---------------------------------------------------------------------
+    @action(detail=True, methods=['get'])
+    def recommendations(self, request, pk=None):
+        book = self.get_object()
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            raise ValidationError({'limit': 'Must be an integer.'})
+        limit = max(1, min(limit, settings.RECOMMENDATIONS_TOP_N))
+        neighbours = BookNeighbour.objects.filter(book=book).select_related('neighbour').order_by('rank')[:limit]
+        return Response({
+            'book_id': book.id,
+            'recommendations': BookNeighbourSerializer(neighbours, many=True).data,
+        })
+
 
 # -------------------------------------------------------------------------
 # BORROW RECORD VIEWSET
 # -------------------------------------------------------------------------
 # Handles all borrow/return operations, fine calculations, and notifications.
 # -------------------------------------------------------------------------
-class BorrowRecordViewSet(viewsets.ModelViewSet):
+class BorrowRecordViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = BorrowRecord.objects.all()
+    # Reports only: the heavy reads of this viewset (db_router.py)
+    replica_actions = ('unpaid_fines', 'analytics')
     serializer_class = BorrowRecordSerializer
     permission_classes = [IsAuthenticated]
 
@@ -126,9 +292,68 @@ class BorrowRecordViewSet(viewsets.ModelViewSet):
     # ---------------------------------------------------------------------
     def get_queryset(self):
         user = self.request.user
+        # select_related: the serializer reads record.book and record.user for every row
+        records = BorrowRecord.objects.select_related('book', 'user')
         if user.role in ['admin', 'librarian']:
-            return BorrowRecord.objects.all()
-        return BorrowRecord.objects.filter(user=user)
+            return records
+        return records.filter(user=user)
+
+    # ---------------------------------------------------------------------
+    # GET /borrow-records/?open=true — only loans not returned yet
+    # ---------------------------------------------------------------------
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action == 'list' and 'open' in self.request.query_params:
+            is_open = self.request.query_params['open'].lower() in ('1', 'true', 'yes')
+            queryset = queryset.filter(return_date__isnull=is_open)
+        return queryset
+
+    # ---------------------------------------------------------------------
+    # Totals of paginated lists (?page=) come from counters.py:
+    # all loans or the member's own, optionally only open ones; unpaid fines.
+    # ---------------------------------------------------------------------
+    def counter_key(self, request):
+        if self.action == 'unpaid_fines':
+            return counters.loan_key(kind='unpaid')
+        params = filter_params(request)
+        if params.keys() - {'open'}:
+            return None
+        kind = None
+        if 'open' in params:
+            if params['open'].lower() not in ('1', 'true', 'yes'):
+                return None  # returned loans have no counter of their own
+            kind = 'open'
+        user = None if request.user.role in ['admin', 'librarian'] else request.user.pk
+        return counters.loan_key(user=user, kind=kind)
+
+    # ---------------------------------------------------------------------
+    # GET /borrow-records/?include_archived=true
+    # Archived loans (see archive.py) are left out unless asked for, so the
+    # usual list only touches the small live table. With include_archived the
+    # live records come first, then archived ones (newest first), which carry
+    # an extra `archived_at` field.
+    # ---------------------------------------------------------------------
+    def list(self, request, *args, **kwargs):
+        include_archived = request.query_params.get('include_archived', '').lower() in ('1', 'true', 'yes')
+        if include_archived and self.paginator.get_page_size(request):
+            raise ValidationError({'include_archived': 'Cannot be combined with pagination.'})
+        response = super().list(request, *args, **kwargs)
+        if include_archived:
+            archived = BorrowRecordArchive.objects.select_related('book', 'user').order_by('-borrow_date')
+            if request.user.role not in ['admin', 'librarian']:
+                archived = archived.filter(user=request.user)
+            context = self.get_serializer_context()
+            response.data = list(response.data) + BorrowRecordArchiveSerializer(archived, many=True, context=context).data
+        return response
+
+    # ---------------------------------------------------------------------
+    # POST /borrow-records/
+    # Wrapped so a retried borrow with the same Idempotency-Key header
+    # gets the original response instead of a "not available" 400.
+    # ---------------------------------------------------------------------
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
 
     # ---------------------------------------------------------------------
     # Custom create logic:
@@ -142,9 +367,11 @@ class BorrowRecordViewSet(viewsets.ModelViewSet):
         if book.status != 'available':
             raise ValidationError("This book is not available for borrowing")
 
-        serializer.save(user=self.request.user)
-        book.status = 'borrowed'
-        book.save()
+        # One transaction: the loan, the book status and their counters (counters.py)
+        with transaction.atomic():
+            serializer.save(user=self.request.user)
+            book.status = 'borrowed'
+            book.save()
 
     # ---------------------------------------------------------------------
     # Admin-only endpoint to send due notifications
@@ -153,7 +380,7 @@ class BorrowRecordViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
     def check_due_books(self, request):
         count = 0
-        records = BorrowRecord.objects.filter(
+        records = BorrowRecord.objects.select_related('book', 'user').filter(
             return_date__isnull=True,
             due_date__lte=timezone.now()
         )
@@ -162,29 +389,46 @@ class BorrowRecordViewSet(viewsets.ModelViewSet):
             count += 1
         return Response({'message': f'Sent {count} notifications for overdue books'})
 
+    # ---------------------------------------------------------------------
+    # GET /borrow-records/analytics/?top=20
+    # Librarian/Admin — loans per book and per category over rolling windows,
+    # weekly demand per category and a short forecast (see analytics.py)
+    # ---------------------------------------------------------------------
+    @action(detail=False, methods=['get'], permission_classes=[IsLibraryStaff])
+    def analytics(self, request):
+        from .analytics import circulation_report  # NumPy is only needed here
+
+        try:
+            top = int(request.query_params.get('top', 20))
+        except ValueError:
+            raise ValidationError({'top': 'Must be an integer.'})
+        return Response(circulation_report(top=max(1, min(top, 100))))
+
     # ---------------------------------------------------------------------
     # POST /borrow-records/{id}/return_book/
     # Marks book as returned, calculates fine if overdue
     # ---------------------------------------------------------------------
     @action(detail=True, methods=['post'])
+    @idempotent
     def return_book(self, request, pk=None):
         borrow_record = self.get_object()
         if borrow_record.return_date:
             return Response({'error': 'Book already returned'}, status=400)
 
-        borrow_record.return_date = timezone.now()
-        borrow_record.save()
-
-        now = timezone.now()
-        if now.date() >= borrow_record.due_date.date():
-            days_late = (now.date() - borrow_record.due_date.date()).days + 1
-            borrow_record.fine_amount = days_late * 10  # ₹10/day fine
-            borrow_record.fine_paid = True
+        with transaction.atomic():
+            borrow_record.return_date = timezone.now()
             borrow_record.save()
 
-        book = borrow_record.book
-        book.status = 'available'
-        book.save()
+            now = timezone.now()
+            if now.date() >= borrow_record.due_date.date():
+                days_late = (now.date() - borrow_record.due_date.date()).days + 1
+                borrow_record.fine_amount = days_late * 10  # ₹10/day fine
+                borrow_record.fine_paid = True
+                borrow_record.save()
+
+            book = borrow_record.book
+            book.status = 'available'
+            book.save()
 
         message = "Book returned successfully"
         if borrow_record.fine_amount > 0:
@@ -198,7 +442,10 @@ class BorrowRecordViewSet(viewsets.ModelViewSet):
     # ---------------------------------------------------------------------
     @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
     def unpaid_fines(self, request):
-        fines = BorrowRecord.objects.filter(fine_amount__gt=0, fine_paid=False)
+        fines = BorrowRecord.objects.select_related('book', 'user').filter(fine_amount__gt=0, fine_paid=False)
+        page = self.paginate_queryset(fines)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
         serializer = self.get_serializer(fines, many=True)
         return Response(serializer.data)
 
@@ -207,12 +454,15 @@ class BorrowRecordViewSet(viewsets.ModelViewSet):
     # Librarian/Admin — mark fine as paid manually
     # ---------------------------------------------------------------------
     @action(detail=True, methods=['post'], permission_classes=[IsAdminUser])
+    @idempotent
     def mark_fine_paid(self, request, pk=None):
         record = self.get_object()
         if record.fine_paid:
             return Response({'message': 'Fine already marked as paid'}, status=status.HTTP_400_BAD_REQUEST)
-        record.fine_paid = True
-        record.save()
+        # Conditional write: a concurrent payment by another librarian gets 409/412 instead of being overwritten.
+        # Atomic so the unpaid-fine counters (counters.py) move with it
+        with transaction.atomic():
+            update_or_raise(request, record, fine_paid=True)
         return Response({'message': f'Fine of ₹{record.fine_amount} for {record.book.title} marked as paid'})
 
     # ---------------------------------------------------------------------
@@ -250,8 +500,9 @@ class BorrowRecordViewSet(viewsets.ModelViewSet):
 # Categories (book categories) can be read by any logged-in user;
 # creation/deletion reserved for admin/librarian.
 # -------------------------------------------------------------------------
-class CategoryViewSet(viewsets.ModelViewSet):
-    queryset = Category.objects.all()
+class CategoryViewSet(CoalescedListMixin, ReplicaReadMixin, viewsets.ModelViewSet):
+    queryset = Category.objects.filter(is_deleted=False)
+    replica_actions = ('list', 'retrieve')
     serializer_class = CategorySerializer
     permission_classes = [IsAdminOrLibrarian]
 
@@ -261,3 +512,49 @@ class CategoryViewSet(viewsets.ModelViewSet):
         else:
             permission_classes = [IsAdminOrLibrarian]
         return [permission() for permission in permission_classes]
+
+    # ---------------------------------------------------------------------
+    # DELETE /categories/{id}/
+    # Small categories are deleted at once (204). Bigger ones are hidden
+    # immediately and deleted in batches by a background job (see deletion.py):
+    # 202 with the job, whose progress is at Location (/deletion-jobs/{id}/).
+    # ---------------------------------------------------------------------
+    def destroy(self, request, *args, **kwargs):
+        category = self.get_object()
+        if category.books.count() <= settings.CATEGORY_DELETE_INLINE_MAX_BOOKS:
+            self.perform_destroy(category)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        job = start_category_deletion(category, request.user)
+        return Response(
+            DeletionJobSerializer(job).data,
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': reverse('deletionjob-detail', args=[job.pk])},
+        )
+
+
+# -------------------------------------------------------------------------
+# DELETION JOB VIEWSET
+# -------------------------------------------------------------------------
+# Read-only progress of background category deletions:
+#   GET /deletion-jobs/ and GET /deletion-jobs/{id}/ (librarians and admins)
+# -------------------------------------------------------------------------
+class DeletionJobViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = DeletionJob.objects.order_by('-created_at')
+    serializer_class = DeletionJobSerializer
+    permission_classes = [IsLibraryStaff]
+
+
+# -------------------------------------------------------------------------
+# GET /metrics
+# Prometheus scrape endpoint (plain Django view, not DRF: scrapers send no JWT).
+# Set METRICS_TOKEN to require "Authorization: Bearer <token>".
+# -------------------------------------------------------------------------
+@require_GET
+def metrics(request):
+    token = settings.METRICS_TOKEN
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+    return HttpResponse(
+        render_prometheus(registry.collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
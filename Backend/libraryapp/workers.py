@@ -0,0 +1,30 @@
+# libraryapp/workers.py
+import importlib
+import os
+
+import django
+
+"""
+Entry points for worker processes started with the `spawn` method (password hashing, benchmarks).
+
+A spawned process starts a fresh interpreter: Django has to be set up before anything imports models.
+So this module must not import models either. Use setup_django as a pool initializer, or run(...)
+as a Process target that sets Django up and then calls a function given by its dotted path.
+"""
+
+
+def setup_django(settings_module):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    django.setup()
+
+
+def current_settings_module():
+    """The settings module of this process, for passing to workers."""
+    return os.environ.get('DJANGO_SETTINGS_MODULE', 'libraryProject.settings')
+
+
+def run(settings_module, target, *args):
+    """Process target: sets Django up, then calls `target` ('package.module.function') with `args`."""
+    setup_django(settings_module)
+    module, name = target.rsplit('.', 1)
+    return getattr(importlib.import_module(module), name)(*args)